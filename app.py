@@ -3,6 +3,10 @@ from flask import Flask
 import sys
 from config import Config
 from extensions import db, login_manager
+from logging_setup import configure_logging
+from sqlite_tuning import configure_sqlite
+from static_assets import init_static_assets
+from request_metrics import init_metrics
 from models import User
 import os
 
@@ -12,6 +16,17 @@ if hasattr(sys.stdout, "reconfigure"):
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    configure_logging(app)
+
+    # Caché de plantillas compiladas en disco: los workers nuevos no recompilan Jinja
+    template_cache_dir = app.config.get('TEMPLATE_CACHE_DIR')
+    if template_cache_dir:
+        from jinja2 import FileSystemBytecodeCache
+        os.makedirs(template_cache_dir, exist_ok=True)
+        app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(template_cache_dir)}
+
+    # url_for('static') con los nombres con hash de static/dist si existe el build
+    init_static_assets(app)
 
     # Crear carpeta de uploads si no existe
     upload_folder = app.config.get('UPLOAD_FOLDER')
@@ -22,6 +37,12 @@ def create_app(config_class=Config):
     db.init_app(app)
     login_manager.init_app(app)
 
+    # Pragmas de SQLite en cada conexión nueva (antes de la primera consulta)
+    # y métricas por endpoint con el recuento de consultas (ver request_metrics.py)
+    with app.app_context():
+        configure_sqlite(app, db.engine)
+        init_metrics(app, db.engine)
+
     # Configurar user_loader para Flask-Login
     @login_manager.user_loader
     def load_user(user_id):
@@ -37,16 +58,85 @@ def create_app(config_class=Config):
     from blueprints.payment import bp as payment_bp
     app.register_blueprint(payment_bp, url_prefix='/payment')
 
-    # Crear tablas
-    with app.app_context():
-        db.create_all()
+    # Comando para vaciar la bandeja de Redsys desde cron si el hilo está desactivado
+    @app.cli.command('drain-redsys-inbox')
+    def drain_redsys_inbox():
+        """Procesa todas las notificaciones de Redsys pendientes"""
+        from services.notification_inbox_service import NotificationInboxService
+        processed = NotificationInboxService.drain()
+        print(f"Notificaciones procesadas: {processed}")
+
+    @app.cli.command('rebuild-revenue-rollup')
+    def rebuild_revenue_rollup():
+        """Recalcula los ingresos diarios por curso desde los pagos completados"""
+        from services.payment_service import PaymentService
+        rows = PaymentService.rebuild_revenue_rollup()
+        print(f"Filas de ingresos diarios generadas: {rows}")
+
+    @app.cli.command('generate-image-variants')
+    def generate_image_variants():
+        """Genera las variantes responsive pendientes (imágenes subidas antes o con el hilo desactivado)"""
+        from services.image_service import ImageService
+        processed = ImageService.process_pending()
+        print(f"Imágenes procesadas: {processed}")
+
+    @app.cli.command('build-assets')
+    def build_assets():
+        """Minifica CSS/JS, les añade el hash y genera las variantes .gz/.br en static/dist"""
+        import static_assets
+        manifest = static_assets.build(app.static_folder)
+        for source, hashed in sorted(manifest.items()):
+            print(f"{source} -> {hashed}")
+
+    @app.cli.command('optimize-images')
+    def optimize_images():
+        """Genera variantes redimensionadas y recomprimidas de las fotos de static/images"""
+        import static_assets
+        manifest = static_assets.optimize_images(app)
+        for source, entry in sorted(manifest.items()):
+            print(f"{source} -> {entry['slug']} {entry['widths']} ({', '.join(entry['formats'])})")
+
+    @app.cli.command('db-upgrade')
+    def db_upgrade():
+        """Aplica las migraciones de esquema pendientes"""
+        import schema_migrations
+        applied = schema_migrations.upgrade(db.engine)
+        print(f"Migraciones aplicadas: {applied or 'ninguna'} (revisión actual {schema_migrations.LATEST_REVISION})")
+
+    @app.cli.command('db-revision')
+    def db_revision():
+        """Muestra la revisión del esquema de la BDD"""
+        import schema_migrations
+        with db.engine.connect() as connection:
+            revision = schema_migrations.current_revision(connection)
+        print(f"Revisión de la BDD: {revision} (última disponible {schema_migrations.LATEST_REVISION})")
+
+    # Esquema: una consulta si está al día, migraciones pendientes si no (ver schema_migrations.py)
+    if app.config.get('AUTO_MIGRATE', True):
+        import schema_migrations
+        with app.app_context():
+            schema_migrations.ensure_schema(db.engine)
 
     return app
 
 # LÍNEA CRÍTICA PARA CPANEL: 
-# Definimos 'app' en el ámbito global para que Passenger pueda encontrarla.
-app = create_app()
+# Passenger (y 'flask run') buscan 'app' en este módulo. Se crea en el primer
+# acceso (PEP 562) y no al importar: los scripts y comandos que solo usan
+# create_app() no construyen una segunda aplicación ni tocan la BDD por defecto.
+# A un worker de Passenger no le ahorra arranque: pide 'app' nada más importar
+# este módulo y create_app() necesita igualmente todos los imports. Casi todo
+# ese tiempo es importar SQLAlchemy, que solo evita precargar la aplicación en
+# Passenger (medición en bench_cold_start.py y profile_startup.py).
+_app = None
+
+def __getattr__(name):
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Este bloque se mantiene para que sigas pudiendo ejecutarlo localmente
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,129 @@
+# audit_catalog_queries.py
+# Comprueba que la portada no hace una consulta por curso (N+1): siembra N
+# cursos activos con galería, cuenta los SQL de CourseService._load_active_catalog
+# y de un GET / con la caché del catálogo recién invalidada, duplica los cursos
+# (2N) y vuelve a contar. Termina con error si el número de consultas cambia.
+# Usa una BDD SQLite temporal.
+# Uso: python audit_catalog_queries.py [N]
+import sys
+import os
+import json
+import tempfile
+
+# Configurar encoding UTF-8 para la salida
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+IMAGES_PER_COURSE = 3
+
+
+def build_app(db_path):
+    from app import create_app
+    from config import Config
+
+    class AuditConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + db_path
+        LOG_LEVEL = 'WARNING'
+        REDSYS_INBOX_WORKER = False
+        IMAGE_VARIANTS_WORKER = False
+        METRICS_ENABLED = False
+        TEMPLATE_CACHE_DIR = ''
+
+    return create_app(AuditConfig)
+
+
+class StatementCounter:
+    """Cuenta los SQL que pasan por el engine mientras está activo"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.active = False
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active:
+            self.count += 1
+
+    def measure(self, func):
+        self.active, self.count = True, 0
+        try:
+            func()
+        finally:
+            self.active = False
+        return self.count
+
+
+def seed_courses(count, start):
+    """Crea cursos activos con galería; la mitad de las imágenes con variantes ya generadas"""
+    from extensions import db
+    from models import CourseImage
+    from services.course_service import CourseService
+
+    variants = json.dumps({'formats': ['webp', 'jpeg'],
+                           'sizes': {'thumb': [320, 240], 'card': [640, 480], 'hero': [1280, 960]}})
+    for i in range(start, start + count):
+        filenames = [f'ab/cd/curso{i}-{j}.jpg' for j in range(IMAGES_PER_COURSE)]
+        CourseService.create_course(f'Curso {i}', 'Descripción', 100.0 + i, filenames[0], filenames)
+    CourseImage.query.filter(CourseImage.id % 2 == 0).update({CourseImage.variants: variants}, synchronize_session=False)
+    db.session.commit()
+
+
+def count_queries(app, counter):
+    from extensions import db
+    from services.cache_service import catalog_cache
+    from services.course_service import CourseService
+
+    with app.app_context():
+        loader = counter.measure(CourseService._load_active_catalog)
+        db.session.remove()
+
+    with app.app_context():
+        catalog_cache.invalidate()
+        db.session.commit()
+    client = app.test_client()
+    status = []
+    page = counter.measure(lambda: status.append(client.get('/').status_code))
+    if status != [200]:
+        raise RuntimeError(f"GET / devolvió {status}")
+    return loader, page
+
+
+def main(n=5):
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        app = build_app(db_path)
+        with app.app_context():
+            from extensions import db
+            counter = StatementCounter(db.engine)
+            seed_courses(n, 0)
+        small = count_queries(app, counter)
+
+        with app.app_context():
+            seed_courses(n, n)
+        large = count_queries(app, counter)
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    print(f"📊 Consultas con {n} y {2 * n} cursos ({IMAGES_PER_COURSE} imágenes por curso):")
+    print(f"   CourseService._load_active_catalog   {small[0]:3d} -> {large[0]:3d}")
+    print(f"   GET / (caché del catálogo vacía)      {small[1]:3d} -> {large[1]:3d}")
+    if small != large:
+        print("❌ El número de consultas crece con el número de cursos (N+1)")
+        return False
+    print("✅ El número de consultas de la portada no depende del número de cursos")
+    return True
+
+
+if __name__ == '__main__':
+    print("🔍 Comprobando el número de consultas de la portada...\n")
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    if not main(n):
+        sys.exit(1)
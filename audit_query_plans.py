@@ -0,0 +1,288 @@
+# audit_query_plans.py
+# Auditoría de planes de consulta: ejecuta los métodos de CourseService,
+# PaymentService, UserService y OfferService contra una BDD SQLite temporal con
+# datos de ejemplo, captura cada SQL que emiten y lo pasa por EXPLAIN QUERY PLAN.
+# Termina con error si alguna consulta recorre una tabla completa sin índice.
+import sys
+import os
+import re
+import inspect
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Configurar encoding UTF-8 para la salida
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+# "SCAN payment" (o "SCAN TABLE payment" en SQLite < 3.36) sin "USING ... INDEX"
+FULL_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+# Recorridos completos intencionados: (método, tabla) -> motivo
+ALLOWED_FULL_SCANS = {
+    ('PaymentService.get_sales_totals', 'revenue_rollup'):
+        'suma todo el rollup diario (una fila por día y curso), que es justo lo que se pretende',
+    # Listados completos del panel sin filtro ni LIMIT: leen todas las filas con o
+    # sin índice, y un índice solo para ordenarlos encarecería cada escritura
+    ('CourseService.get_all_courses', 'course'): 'listado completo de cursos del panel',
+    ('UserService.get_all_users', 'user'): 'listado completo de usuarios del panel',
+    ('PaymentService.get_all_payments', 'payment'): 'listado completo de pagos del panel',
+    ('OfferService.get_all_offers', 'offer'): 'listado completo de ofertas del panel',
+}
+
+# Métodos sin acceso a BDD o auxiliares que se auditan a través de otros métodos
+NOT_QUERYING = {
+    'OfferService.build_pricing_table',
+    'OfferService.calculate_total_from_table',
+    'OfferService.calculate_total_with_offers',
+    'PaymentService.encode_buyers_cursor',
+    'PaymentService.decode_buyers_cursor',
+    'PaymentService._filter_completed_payments',
+    'PaymentService._completed_payments_query',
+    'PaymentService._transition_status',
+    'PaymentService._add_to_revenue_rollup',
+}
+
+
+def build_app(db_path):
+    from app import create_app
+    from config import Config
+
+    class AuditConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + db_path
+        LOG_LEVEL = 'WARNING'
+        REDSYS_INBOX_WORKER = False
+        IMAGE_VARIANTS_WORKER = False
+        METRICS_ENABLED = False
+        TEMPLATE_CACHE_DIR = ''
+
+    return create_app(AuditConfig)
+
+
+class QueryRecorder:
+    """Guarda los SQL emitidos, agrupados por el método de servicio que los lanzó"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.current = None
+        self.queries = OrderedDict()
+        event.listen(engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.current is None or executemany:
+            return
+        if statement.lstrip().split(None, 1)[0].upper() not in ('SELECT', 'UPDATE', 'DELETE', 'WITH'):
+            return
+        self.queries.setdefault((self.current, statement), parameters)
+
+    @contextmanager
+    def label(self, name):
+        previous, self.current = self.current, name
+        try:
+            yield
+        finally:
+            self.current = previous
+
+
+def seed(num_courses=12, num_users=300, num_payments=3000):
+    from extensions import db
+    from models import Course, CourseImage, User, Payment, Offer, RevenueRollup
+
+    now = datetime.utcnow()
+    courses = [Course(title=f'Curso {i}', description='', price=100.0 + i, is_active=i % 4 != 0,
+                      created_at=now - timedelta(days=i)) for i in range(num_courses)]
+    db.session.add_all(courses)
+    db.session.flush()
+    db.session.add_all(CourseImage(course_id=course.id, filename=f'img_{course.id}_{n}.jpg')
+                       for course in courses for n in range(3))
+
+    users = [User(name=f'Comprador {i}', email=f'comprador{i}@example.com', phone='600000000',
+                  created_at=now - timedelta(hours=i)) for i in range(num_users)]
+    db.session.add_all(users)
+    db.session.flush()
+
+    statuses = ('completed', 'completed', 'pending', 'failed')
+    for i in range(num_payments):
+        status = statuses[i % len(statuses)]
+        db.session.add(Payment(
+            user_id=users[i % num_users].id,
+            course_id=courses[i % num_courses].id,
+            amount=courses[i % num_courses].price,
+            status=status,
+            created_at=now - timedelta(minutes=i),
+            completed_at=now - timedelta(minutes=i) if status == 'completed' else None,
+        ))
+
+    db.session.add_all(Offer(quantity=q, price=q * 90.0, is_active=q != 4) for q in range(2, 7))
+    db.session.add_all(RevenueRollup(day=(now - timedelta(days=d)).date(), course_id=course.id,
+                                     payments_count=3, revenue=300.0)
+                       for d in range(60) for course in courses)
+    db.session.commit()
+    return courses, users
+
+
+def exercise(recorder, courses, users):
+    """Llama a cada método de los servicios con argumentos realistas"""
+    from extensions import db
+    from models import Payment, Offer
+    from services.course_service import CourseService
+    from services.offer_service import OfferService
+    from services.payment_service import PaymentService
+    from services.user_service import UserService
+
+    course_id = courses[1].id
+    user = users[5]
+    today = datetime.utcnow().date()
+    pending = Payment.query.filter_by(status='pending').first()
+    newest_completed = Payment.query.filter_by(status='completed').order_by(Payment.completed_at.desc()).first()
+    cursor = (newest_completed.completed_at, newest_completed.id)
+    offer = Offer.query.first()
+    db.session.expire_all()
+    created_offers = []
+
+    calls = [
+        ('CourseService.get_course_by_id', lambda: CourseService.get_course_by_id(course_id)),
+        ('CourseService.get_active_courses', CourseService.get_active_courses),
+        ('CourseService._load_active_catalog', CourseService._load_active_catalog),
+        ('CourseService.get_active_catalog', CourseService.get_active_catalog),
+        ('CourseService.get_catalog_courses_by_ids', lambda: CourseService.get_catalog_courses_by_ids([course_id])),
+        ('CourseService.get_all_courses', lambda: CourseService.get_all_courses(with_images=True)),
+        ('CourseService.get_courses_by_ids', lambda: CourseService.get_courses_by_ids([c.id for c in courses[:3]])),
+        ('CourseService.create_course', lambda: CourseService.create_course('Curso auditoría', '', 120.0)),
+        ('CourseService.add_course_image', lambda: CourseService.add_course_image(course_id, 'ab/cd/abcd.jpg')),
+        ('CourseService.add_course_image', lambda: CourseService.add_course_image(course_id, 'ab/cd/abcd.jpg')),
+        ('CourseService.update_course', lambda: CourseService.update_course(course_id, price=111.0)),
+        ('CourseService.delete_course', lambda: CourseService.delete_course(courses[-1].id)),
+
+        ('UserService.create_user', lambda: UserService.create_user('Auditoría', 'audit@example.com', '600000000')),
+        ('UserService.get_user_by_email', lambda: UserService.get_user_by_email(user.email)),
+        ('UserService.get_user_by_id', lambda: UserService.get_user_by_id(user.id)),
+        ('UserService.get_all_users', UserService.get_all_users),
+        ('UserService.get_users_with_payments', UserService.get_users_with_payments),
+        ('UserService.is_admin', lambda: UserService.is_admin(user.id)),
+
+        ('OfferService._load_active_offers', OfferService._load_active_offers),
+        ('OfferService.get_active_offers', OfferService.get_active_offers),
+        ('OfferService.get_all_offers', OfferService.get_all_offers),
+        ('OfferService.get_pricing_table', OfferService.get_pricing_table),
+        ('OfferService.calculate_cart_total', lambda: OfferService.calculate_cart_total([100.0] * 40)),
+        ('OfferService.create_offer', lambda: created_offers.append(OfferService.create_offer(8, 700.0))),
+        ('OfferService.update_offer', lambda: OfferService.update_offer(db.session.get(Offer, offer.id), offer.quantity, 150.0)),
+        ('OfferService.delete_offer', lambda: OfferService.delete_offer(created_offers[0])),
+
+        ('PaymentService.create_payment', lambda: PaymentService.create_payment(user.id, course_id, 100.0)),
+        ('PaymentService.get_payment_by_id', lambda: PaymentService.get_payment_by_id(pending.id)),
+        ('PaymentService.get_pending_payment_by_id', lambda: PaymentService.get_pending_payment_by_id(pending.id)),
+        ('PaymentService.get_pending_payments_by_ids', lambda: PaymentService.get_pending_payments_by_ids([pending.id])),
+        ('PaymentService.get_payments_by_user', lambda: PaymentService.get_payments_by_user(user.id)),
+        ('PaymentService.get_all_payments', PaymentService.get_all_payments),
+        ('PaymentService.get_payments_with_users', PaymentService.get_payments_with_users),
+        ('PaymentService.get_buyers_page', lambda: PaymentService.get_buyers_page()),
+        ('PaymentService.get_buyers_page', lambda: PaymentService.get_buyers_page(after=cursor)),
+        ('PaymentService.get_buyers_page', lambda: PaymentService.get_buyers_page({'course_id': course_id}, after=cursor)),
+        ('PaymentService.get_buyers_page', lambda: PaymentService.get_buyers_page(
+            {'date_from': today - timedelta(days=2), 'date_to': today})),
+        ('PaymentService.get_buyers_page', lambda: PaymentService.get_buyers_page({'email_prefix': 'comprador1'})),
+        ('PaymentService.iter_completed_payments_for_export', lambda: list(
+            PaymentService.iter_completed_payments_for_export({'course_id': course_id}))),
+        ('PaymentService.fail_payment', lambda: PaymentService.fail_payment(pending.id)),
+        ('PaymentService.complete_payment', lambda: PaymentService.complete_payment(pending.id, transaction_id='000000000001')),
+        ('PaymentService.get_sales_totals', PaymentService.get_sales_totals),
+        ('PaymentService.get_daily_revenue', PaymentService.get_daily_revenue),
+        ('PaymentService.rebuild_revenue_rollup', PaymentService.rebuild_revenue_rollup),
+    ]
+
+    for name, call in calls:
+        with recorder.label(name):
+            call()
+    return {name for name, _ in calls}
+
+
+def uncovered_methods(exercised):
+    """Métodos de los servicios que la auditoría no ejecuta (para no olvidar consultas nuevas)"""
+    from services.course_service import CourseService
+    from services.offer_service import OfferService
+    from services.payment_service import PaymentService
+    from services.user_service import UserService
+
+    missing = []
+    for service in (CourseService, PaymentService, UserService, OfferService):
+        for name, _ in inspect.getmembers(service, inspect.isfunction):
+            full_name = f'{service.__name__}.{name}'
+            if full_name not in exercised and full_name not in NOT_QUERYING:
+                missing.append(full_name)
+    return missing
+
+
+def explain(connection, statement, parameters):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def audit(db_path, verbose=False):
+    from extensions import db
+
+    app = build_app(db_path)
+    with app.app_context():
+        courses, users = seed()
+        recorder = QueryRecorder(db.engine)
+        exercised = exercise(recorder, courses, users)
+
+        failures = []
+        warnings = []
+        connection = db.engine.raw_connection()
+        try:
+            for (method, statement), parameters in recorder.queries.items():
+                plan = explain(connection, statement, parameters)
+                if verbose:
+                    print(f"\n{method}\n  {' '.join(statement.split())}")
+                    for line in plan:
+                        print(f"    → {line}")
+                allowed_scan = False
+                for line in plan:
+                    match = FULL_SCAN_RE.match(line)
+                    if match:
+                        reason = ALLOWED_FULL_SCANS.get((method, match.group(1)))
+                        if reason is None:
+                            failures.append((method, line, statement))
+                        else:
+                            allowed_scan = True
+                            if verbose:
+                                print(f"    (permitido: {reason})")
+                    elif 'TEMP B-TREE' in line and not allowed_scan:
+                        # Tras un recorrido completo permitido, ordenar en memoria es lo esperado
+                        warnings.append((method, line, statement))
+        finally:
+            connection.close()
+        db.session.remove()
+
+    print(f"📊 {len(recorder.queries)} consultas distintas auditadas en {len(exercised)} métodos")
+    for method in uncovered_methods(exercised):
+        print(f"⚠️  {method} no está cubierto por la auditoría")
+    for method, line, statement in warnings:
+        print(f"⚠️  {method}: {line}\n      {' '.join(statement.split())[:160]}")
+    if failures:
+        print(f"\n❌ {len(failures)} consultas recorren una tabla completa:")
+        for method, line, statement in failures:
+            print(f"   - {method}: {line}\n      {' '.join(statement.split())[:160]}")
+        return False
+    print("✅ Ninguna consulta de los servicios hace un recorrido completo de tabla")
+    return True
+
+
+if __name__ == '__main__':
+    print("🔍 Auditando los planes de consulta de los servicios...\n")
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    try:
+        success = audit(db_path, verbose='-v' in sys.argv)
+    finally:
+        os.remove(db_path)
+    if not success:
+        sys.exit(1)
@@ -0,0 +1,122 @@
+# bench_cold_start.py
+# Mide el arranque en frío de un worker: cada muestra es un proceso Python nuevo
+# que importa app.py (como hace Passenger), pide la portada y después la página
+# de compra. Informa del tiempo hasta la primera respuesta contado desde el
+# arranque del intérprete. Usa una BDD SQLite temporal con datos.
+# Uso: python bench_cold_start.py [muestras]
+import sys
+import os
+import json
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+# Configurar encoding UTF-8 para la salida
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+BASEDIR = os.path.abspath(os.path.dirname(__file__))
+
+# Código que ejecuta cada proceso hijo: mide import de app.py y la primera petición
+_CHILD = r'''
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {basedir!r})
+import app as app_module
+t1 = time.perf_counter()
+client = app_module.app.test_client()
+t2 = time.perf_counter()
+response = client.get('/')
+t3 = time.perf_counter()
+second = client.get('/payment/buy/{course_id}')
+t4 = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (t1 - t0) * 1000,
+    'create_ms': (t2 - t1) * 1000,
+    'first_ms': (t3 - t2) * 1000,
+    'second_ms': (t4 - t3) * 1000,
+    'ttfr_ms': (t3 - t0) * 1000,
+    'status': [response.status_code, second.status_code],
+}}))
+'''
+
+
+def seed(env):
+    """Crea el esquema y un catálogo pequeño en la BDD temporal (en un proceso aparte)"""
+    code = f'''
+import sys
+sys.path.insert(0, {BASEDIR!r})
+from app import app
+from services.course_service import CourseService
+from services.offer_service import OfferService
+with app.app_context():
+    for i in range(6):
+        course = CourseService.create_course(f'Curso {{i}}', 'Descripción del curso ' * 20, 250.0 + i)
+    OfferService.create_offer(2, 450.0)
+    OfferService.create_offer(3, 640.0)
+    print(course.id)
+'''
+    output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return int(output.stdout.strip().splitlines()[-1])
+
+
+def sample(env, course_id):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', _CHILD.format(basedir=BASEDIR, course_id=course_id)],
+                            env=env, capture_output=True, text=True, check=True)
+    total_ms = (time.perf_counter() - start) * 1000
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result['total_ms'] = total_ms
+    return result
+
+
+def main(samples=10):
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.remove(db_path)
+    cache_dir = tempfile.mkdtemp(prefix='jinja_cache_')
+    env = dict(os.environ,
+               DATABASE_URL='sqlite:///' + db_path,
+               TEMPLATE_CACHE_DIR=cache_dir,
+               LOG_LEVEL='WARNING',
+               REDSYS_INBOX_WORKER='0',
+               IMAGE_VARIANTS_WORKER='0',
+               METRICS_ENABLED='0')
+    try:
+        course_id = seed(env)
+        # Primera muestra: caché de plantillas vacía (equivale al primer worker tras un despliegue)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        first = sample(env, course_id)
+        results = [sample(env, course_id) for _ in range(samples)]
+    finally:
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    if any(code != 200 for r in [first] + results for code in r['status']):
+        print(f"❌ Respuestas inesperadas: {[r['status'] for r in [first] + results]}")
+        return False
+
+    def median(key):
+        return statistics.median(r[key] for r in results)
+
+    print(f"📊 Arranque en frío de un worker ({samples} procesos nuevos, medianas):")
+    print(f"   import app.py                           {median('import_ms'):7.1f} ms")
+    print(f"   create_app() (primer acceso a app.app)  {median('create_ms'):7.1f} ms")
+    print(f"   primera respuesta GET /                 {median('first_ms'):7.1f} ms")
+    print(f"   segunda página GET /payment/buy/<id>    {median('second_ms'):7.1f} ms")
+    print(f"   ⏱️  tiempo hasta la primera respuesta    {median('ttfr_ms'):7.1f} ms")
+    print(f"   proceso completo (intérprete incluido)  {median('total_ms'):7.1f} ms")
+    print(f"\n   Primer worker tras despliegue (sin caché de plantillas): "
+          f"GET / {first['first_ms']:.1f} ms | primera respuesta {first['ttfr_ms']:.1f} ms")
+    return True
+
+
+if __name__ == '__main__':
+    print("🔍 Midiendo el tiempo hasta la primera respuesta de un worker nuevo...\n")
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    if not main(samples):
+        sys.exit(1)
@@ -0,0 +1,160 @@
+# bench_notification_logging.py
+# Mide el coste de los logs en las notificaciones de Redsys con distintos modos:
+# escritura síncrona en el hilo que registra, cola con hilo de escritura
+# (LOG_ASYNC) y logs desactivados como referencia. Se miden por separado las dos
+# mitades del camino: el POST a /payment/redsys/notification (solo encola en la
+# bandeja) y el procesamiento de la bandeja, una notificación por lote, que es
+# lo que hace el worker (process_notification y el estado de la fila). El worker
+# de fondo está desactivado: la bandeja se vacía desde el propio benchmark.
+# Usa una BDD SQLite temporal.
+import sys
+import os
+import statistics
+import tempfile
+import time
+
+# Configurar encoding UTF-8 para la salida
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+SECRET_KEY = 'sq7HjrUOBfKmC576ILgskD5srU870gJ7'
+
+def build_app(db_path, log_async, log_level, log_levels):
+    from app import create_app
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + db_path
+        WTF_CSRF_ENABLED = False
+        LOG_ASYNC = log_async
+        LOG_LEVEL = log_level
+        LOG_LEVELS = log_levels
+        REDSYS_INBOX_WORKER = False
+        IMAGE_VARIANTS_WORKER = False
+        METRICS_ENABLED = False
+        TEMPLATE_CACHE_DIR = ''
+
+    return create_app(BenchConfig)
+
+
+def seed(app, num_payments):
+    from extensions import db
+    from services.course_service import CourseService
+    from services.payment_gateway_service import PaymentGatewayService
+    from services.payment_service import PaymentService
+    from services.user_service import UserService
+
+    with app.app_context():
+        PaymentGatewayService.update_config('redsys', '999008881', '001', SECRET_KEY, 'production')
+        course = CourseService.create_course('Curso benchmark', '', 299.0)
+        user = UserService.create_user('Benchmark', 'bench@example.com', '600000000')
+        ids = []
+        for _ in range(num_payments):
+            ids.append(PaymentService.create_payment(user.id, course.id, 299.0).id)
+        db.session.remove()
+        return ids
+
+
+def signed_notification(payment_id):
+    from services.redsys_service import RedsysService
+
+    order_id = str(payment_id).zfill(12)
+    params = RedsysService.encode_merchant_parameters({
+        'Ds_Order': order_id,
+        'Ds_Response': '0000',
+        'Ds_Amount': '29900',
+        'Ds_Card_Number': '454881******0004',
+    })
+    return {
+        'Ds_SignatureVersion': 'HMAC_SHA256_V1',
+        'Ds_MerchantParameters': params,
+        'Ds_Signature': RedsysService.generate_signature(params, order_id, SECRET_KEY),
+    }
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        'mean': statistics.mean(latencies),
+        'p50': latencies[len(latencies) // 2],
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def run_mode(label, log_async, log_level, log_levels, num_requests, log_stream):
+    import logging_setup
+    from extensions import db
+    from models import Payment
+    from services.notification_inbox_service import NotificationInboxService
+
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        app = build_app(db_path, log_async, log_level, log_levels)
+        logging_setup.configure_logging(app, stream=log_stream)
+        payment_ids = seed(app, num_requests)
+        client = app.test_client()
+
+        endpoint = []
+        for payment_id in payment_ids:
+            form = signed_notification(payment_id)
+            start = time.perf_counter()
+            response = client.post('/payment/redsys/notification', data=form)
+            endpoint.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                print(f"❌ {label}: respuesta {response.status_code}")
+                return None
+
+        processing = []
+        with app.app_context():
+            while True:
+                start = time.perf_counter()
+                if not NotificationInboxService.process_batch(1):
+                    break
+                processing.append((time.perf_counter() - start) * 1000)
+            completed = Payment.query.filter_by(status='completed').count()
+            db.session.remove()
+            db.engine.dispose()
+        if completed != num_requests:
+            print(f"❌ {label}: {completed} de {num_requests} pagos completados")
+            return None
+
+        return {'label': label, 'endpoint': summarize(endpoint), 'processing': summarize(processing)}
+    finally:
+        os.remove(db_path)
+
+
+def main(num_requests=300):
+    # Los logs se escriben en un fichero real para que el coste de E/S sea visible
+    log_file = tempfile.NamedTemporaryFile('w', suffix='.log', delete=False, encoding='utf-8')
+    # redsys=DEBUG incluye los parámetros decodificados, como hacían los antiguos prints
+    modes = [
+        ('Log síncrono (sin cola)', False, 'INFO', 'redsys=DEBUG'),
+        ('Log con cola (LOG_ASYNC)', True, 'INFO', 'redsys=DEBUG'),
+        ('Logs desactivados', True, 'CRITICAL', ''),
+    ]
+    results = []
+    try:
+        for label, log_async, log_level, log_levels in modes:
+            result = run_mode(label, log_async, log_level, log_levels, num_requests, log_file)
+            if result is None:
+                return False
+            results.append(result)
+    finally:
+        log_file.close()
+        os.remove(log_file.name)
+
+    for key, title in (('endpoint', 'POST /payment/redsys/notification (encolar)'),
+                       ('processing', 'Bandeja: process_notification por notificación')):
+        print(f"📊 {title} ({num_requests} notificaciones):")
+        for result in results:
+            stats = result[key]
+            print(f"   {result['label']:<36} media {stats['mean']:6.2f} ms | p50 {stats['p50']:6.2f} ms"
+                  f" | p95 {stats['p95']:6.2f} ms")
+    return True
+
+
+if __name__ == '__main__':
+    print("🔍 Midiendo el coste de los logs en la notificación de Redsys...\n")
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,74 @@
+# bench_redsys_signature.py
+# Microbenchmark del coste por firma de Redsys: derivación original (decodificar
+# la clave y crear un cifrador 3DES-CBC en cada llamada) frente a la actual con
+# la clave preparada en caché, y firma/verificación en lote.
+import sys
+import base64
+import hashlib
+import hmac
+import timeit
+from Crypto.Cipher import DES3
+from services.redsys_service import RedsysService
+
+# Configurar encoding UTF-8 para la salida
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+# Clave pública de pruebas de Redsys
+SECRET_KEY = 'sq7HjrUOBfKmC576ILgskD5srU870gJ7'
+ORDER_ID = '000000011234'
+MERCHANT_PARAMS = RedsysService.encode_merchant_parameters({
+    'DS_MERCHANT_AMOUNT': '30000',
+    'DS_MERCHANT_ORDER': ORDER_ID,
+    'DS_MERCHANT_MERCHANTCODE': '999008881',
+    'DS_MERCHANT_CURRENCY': '978',
+    'DS_MERCHANT_TRANSACTIONTYPE': '0',
+    'DS_MERCHANT_TERMINAL': '001',
+})
+
+
+def legacy_generate_signature(merchant_params_encoded, order_id, secret_key):
+    """Implementación anterior: prepara la clave y el cifrador en cada firma"""
+    key = DES3.adjust_key_parity(base64.b64decode(secret_key.strip()))
+    order_bytes = order_id.encode('utf-8')
+    order_padded = order_bytes + b'\x00' * ((8 - len(order_bytes) % 8) % 8)
+    cipher = DES3.new(key, DES3.MODE_CBC, iv=b'\x00' * 8)
+    derived_key = cipher.encrypt(order_padded)
+    mac = hmac.new(derived_key, merchant_params_encoded.encode('utf-8'), hashlib.sha256).digest()
+    return base64.b64encode(mac).decode('utf-8')
+
+
+def per_call_us(func, number):
+    """Mejor tiempo de 5 repeticiones, en microsegundos por llamada"""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def run(number=20000, batch_size=100):
+    legacy = legacy_generate_signature(MERCHANT_PARAMS, ORDER_ID, SECRET_KEY)
+    current = RedsysService.generate_signature(MERCHANT_PARAMS, ORDER_ID, SECRET_KEY)
+    if legacy != current:
+        print("❌ Las firmas no coinciden entre la implementación anterior y la actual")
+        return False
+
+    items = [(MERCHANT_PARAMS, str(i).zfill(12)) for i in range(batch_size)]
+    signed = [(mp, order, sig) for (mp, order), sig in zip(items, RedsysService.generate_signatures(items, SECRET_KEY))]
+
+    results = [
+        ('Firma (antes)', per_call_us(lambda: legacy_generate_signature(MERCHANT_PARAMS, ORDER_ID, SECRET_KEY), number)),
+        ('Firma (ahora)', per_call_us(lambda: RedsysService.generate_signature(MERCHANT_PARAMS, ORDER_ID, SECRET_KEY), number)),
+        ('Verificación (ahora)', per_call_us(lambda: RedsysService.verify_signature(MERCHANT_PARAMS, ORDER_ID, current, SECRET_KEY), number)),
+        ('Firma en lote (por firma)', per_call_us(lambda: RedsysService.generate_signatures(items, SECRET_KEY), number // batch_size) / batch_size),
+        ('Verificación en lote (por firma)', per_call_us(lambda: RedsysService.verify_signatures(signed, SECRET_KEY), number // batch_size) / batch_size),
+    ]
+
+    print(f"📊 Coste por firma ({number} iteraciones, mejor de 5):")
+    for label, value in results:
+        print(f"   {label:<34} {value:8.2f} µs")
+    print(f"\n   Mejora: x{results[0][1] / results[1][1]:.2f}")
+    return True
+
+
+if __name__ == '__main__':
+    print("🔍 Midiendo firmas HMAC_SHA256_V1 de Redsys...\n")
+    if not run():
+        sys.exit(1)
@@ -0,0 +1,179 @@
+# bench_sqlite_tuning.py
+# Compara el rendimiento del checkout con varios procesos escribiendo y leyendo
+# a la vez sobre la misma BDD SQLite, con el perfil SQLITE_TUNING desactivado
+# (journal por defecto) y activado (WAL + pragmas). Cada proceso de compra hace
+# el POST de /payment/buy y completa el pago como lo haría la notificación de
+# Redsys; los procesos lectores consultan el listado de compradores.
+# Uso: python bench_sqlite_tuning.py [segundos] [procesos_compra] [procesos_lectura]
+import sys
+import os
+import multiprocessing
+import statistics
+import tempfile
+import time
+
+# Configurar encoding UTF-8 para la salida
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+def build_app(db_path, tuning):
+    from app import create_app
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + db_path
+        WTF_CSRF_ENABLED = False
+        LOG_LEVEL = 'CRITICAL'
+        REDSYS_INBOX_WORKER = False
+        IMAGE_VARIANTS_WORKER = False
+        METRICS_ENABLED = False
+        TEMPLATE_CACHE_DIR = ''
+        SQLITE_TUNING = tuning
+
+    return create_app(BenchConfig)
+
+
+def seed(db_path, tuning):
+    from extensions import db
+    from services.course_service import CourseService
+
+    app = build_app(db_path, tuning)
+    with app.app_context():
+        course_id = CourseService.create_course('Curso benchmark', '', 299.0).id
+        db.session.remove()
+        db.engine.dispose()
+    return course_id
+
+
+def _is_locked(error):
+    return 'database is locked' in str(error) or 'database is busy' in str(error)
+
+
+def checkout_worker(db_path, tuning, course_id, worker_id, start_event, duration, results):
+    from extensions import db
+    from services.payment_service import PaymentService
+
+    app = build_app(db_path, tuning)
+    client = app.test_client()
+    latencies = []
+    locked = 0
+    other_errors = 0
+
+    start_event.wait()
+    deadline = time.perf_counter() + duration
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+        start = time.perf_counter()
+        try:
+            response = client.post(f'/payment/buy/{course_id}', data={
+                'name': f'Comprador {worker_id}-{n}',
+                'email': f'comprador{worker_id}.{n}@example.com',
+                'phone': '600000000',
+            })
+            location = response.headers.get('Location', '')
+            if response.status_code != 302 or '/payment/process/' not in location:
+                other_errors += 1
+                continue
+            payment_id = int(location.rstrip('/').rsplit('/', 1)[1])
+            with app.app_context():
+                PaymentService.complete_payment(payment_id, transaction_id=str(payment_id).zfill(12), payment_method='redsys')
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            if _is_locked(e):
+                locked += 1
+            else:
+                other_errors += 1
+            with app.app_context():
+                db.session.rollback()
+
+    results.put(('checkout', latencies, locked, other_errors))
+
+
+def reader_worker(db_path, tuning, worker_id, start_event, duration, results):
+    from services.payment_service import PaymentService
+
+    app = build_app(db_path, tuning)
+    latencies = []
+    locked = 0
+    other_errors = 0
+
+    start_event.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            with app.app_context():
+                PaymentService.get_buyers_page()
+                PaymentService.get_sales_totals()
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            if _is_locked(e):
+                locked += 1
+            else:
+                other_errors += 1
+
+    results.put(('read', latencies, locked, other_errors))
+
+
+def run_profile(tuning, duration, num_writers, num_readers):
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        course_id = seed(db_path, tuning)
+        ctx = multiprocessing.get_context('spawn')
+        start_event = ctx.Event()
+        results = ctx.Queue()
+        processes = [ctx.Process(target=checkout_worker, args=(db_path, tuning, course_id, i, start_event, duration, results))
+                     for i in range(num_writers)]
+        processes += [ctx.Process(target=reader_worker, args=(db_path, tuning, i, start_event, duration, results))
+                      for i in range(num_readers)]
+        for process in processes:
+            process.start()
+        # Margen para que todos los procesos importen la app antes de empezar
+        time.sleep(3)
+        start_event.set()
+
+        stats = {'checkout': [[], 0, 0], 'read': [[], 0, 0]}
+        for _ in processes:
+            kind, latencies, locked, other_errors = results.get()
+            stats[kind][0].extend(latencies)
+            stats[kind][1] += locked
+            stats[kind][2] += other_errors
+        for process in processes:
+            process.join()
+        return stats
+    finally:
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+
+def _summary(latencies, duration):
+    if not latencies:
+        return "sin operaciones completadas"
+    latencies = sorted(latencies)
+    p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+    return (f"{len(latencies) / duration:7.1f} op/s | p50 {statistics.median(latencies) * 1000:6.1f} ms"
+            f" | p95 {p95 * 1000:7.1f} ms")
+
+
+def main(duration=10.0, num_writers=4, num_readers=2):
+    print(f"📊 {num_writers} procesos de compra + {num_readers} lectores durante {duration:.0f} s por perfil\n")
+    for label, tuning in (('Sin perfil (journal por defecto)', False), ('SQLITE_TUNING (WAL + pragmas)', True)):
+        stats = run_profile(tuning, duration, num_writers, num_readers)
+        print(f"   {label}")
+        for kind, title in (('checkout', 'Checkouts'), ('read', 'Lecturas ')):
+            latencies, locked, other_errors = stats[kind]
+            print(f"      {title} {_summary(latencies, duration)} | 'database is locked': {locked} | otros errores: {other_errors}")
+        print()
+    return True
+
+
+if __name__ == '__main__':
+    print("🔍 Benchmark de checkout concurrente sobre SQLite...\n")
+    args = sys.argv[1:]
+    duration = float(args[0]) if len(args) > 0 else 10.0
+    num_writers = int(args[1]) if len(args) > 1 else 4
+    num_readers = int(args[2]) if len(args) > 2 else 2
+    main(duration, num_writers, num_readers)
@@ -1,5 +1,5 @@
 # blueprints/admin/routes.py
-from flask import render_template, request, redirect, url_for, flash, current_app
+from flask import render_template, request, redirect, url_for, flash, current_app, jsonify, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
 from . import bp
@@ -7,14 +7,20 @@ from services.course_service import CourseService
 from services.payment_gateway_service import PaymentGatewayService
 from services.payment_service import PaymentService
 from services.offer_service import OfferService
+from services.cache_service import catalog_cache
+from services.notification_inbox_service import NotificationInboxService
+from services.image_service import variant_worker
+from services.upload_service import UploadService
+from request_metrics import PROMETHEUS_CONTENT_TYPE
 from models import User, CourseImage, Offer
 from extensions import db
 from config import Config
 from flask_wtf import FlaskForm
 from flask_wtf.file import MultipleFileField
 from wtforms import StringField, TextAreaField, FloatField, BooleanField, SelectField, validators
-import os
-import uuid
+import io
+import csv
+from datetime import datetime
 from werkzeug.datastructures import FileStorage
 
 class CourseForm(FlaskForm):
@@ -78,38 +84,33 @@ def allowed_file(filename, app):
            filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
 def save_course_image(file, app):
-    """Guarda la imagen del curso y retorna el nombre del archivo"""
+    """Guarda la imagen del curso (por contenido, ver UploadService) y retorna el nombre del archivo"""
     if file and file.filename and allowed_file(file.filename, app):
-        # Crear carpeta si no existe
-        upload_folder = app.config.get('UPLOAD_FOLDER')
-        if upload_folder:
-            os.makedirs(upload_folder, exist_ok=True)
-            
-            # Generar nombre único para el archivo
-            filename = secure_filename(file.filename)
-            ext = filename.rsplit('.', 1)[1].lower()
-            unique_filename = f"{uuid.uuid4().hex}.{ext}"
-            filepath = os.path.join(upload_folder, unique_filename)
-            
-            file.save(filepath)
-            return unique_filename
+        filename = secure_filename(file.filename)
+        ext = filename.rsplit('.', 1)[1].lower()
+        return UploadService.save(file, ext, app)
     return None
 
 def save_course_images(files, app):
-    """Guarda múltiples imágenes del curso y retorna los nombres guardados."""
-    if not files:
-        return []
-
-    saved_filenames = []
-    for file in files:
+    """
+    Guarda múltiples imágenes del curso. Retorna {nombre guardado: archivo subido}
+    en el orden de subida (ver ensure_course_images).
+    """
+    saved = {}
+    for file in files or []:
         if not isinstance(file, FileStorage):
             continue
         if not file.filename:
             continue
         filename = save_course_image(file, app)
-        if filename:
-            saved_filenames.append(filename)
-    return saved_filenames
+        if filename and filename not in saved:
+            saved[filename] = file
+    return saved
+
+def ensure_course_images(saved, app):
+    """Tras confirmar las referencias, recrea los archivos reutilizados que se borraron mientras tanto"""
+    for filename, file in saved.items():
+        UploadService.ensure_file(filename, file, app)
 
 def has_selected_uploads(files):
     """Indica si el usuario seleccionó al menos un archivo con nombre."""
@@ -123,7 +124,8 @@ def ensure_legacy_image_in_gallery(course):
         return
     already_exists = any(image.filename == course.image_filename for image in course.images)
     if not already_exists:
-        db.session.add(CourseImage(course_id=course.id, filename=course.image_filename))
+        CourseService.add_course_image(course.id, course.image_filename)
+        catalog_cache.invalidate()
         db.session.commit()
 
 @bp.route('/login', methods=['GET', 'POST'])
@@ -171,18 +173,17 @@ def dashboard():
         flash('No tienes permisos para acceder a esta sección.', 'error')
         return redirect(url_for('main.index'))
     
-    # Estadísticas
-    courses = CourseService.get_all_courses()
-    active_courses = [c for c in courses if c.is_active]
-    payments = PaymentService.get_payments_with_users()
-    
-    total_revenue = sum(p.amount for p in payments)
+    # Estadísticas: agregadas en SQL sobre el rollup diario, sin cargar el histórico de pagos
+    active_courses = CourseService.get_active_courses()
+    sales = PaymentService.get_sales_totals()
+    daily_revenue = PaymentService.get_daily_revenue(days=30)
     
     return render_template('admin/dashboard.html',
                          courses=active_courses,
                          total_courses=len(active_courses),
-                         total_payments=len(payments),
-                         total_revenue=total_revenue)
+                         total_payments=sales['total_payments'],
+                         total_revenue=sales['total_revenue'],
+                         daily_revenue=daily_revenue)
 
 # ========== GESTIÓN DE CURSOS ==========
 
@@ -194,7 +195,7 @@ def courses_list():
         flash('No tienes permisos para acceder a esta sección.', 'error')
         return redirect(url_for('main.index'))
     
-    courses = CourseService.get_all_courses()
+    courses = CourseService.get_all_courses(with_images=True)
     return render_template('admin/courses_list.html', courses=courses)
 
 @bp.route('/courses/new', methods=['GET', 'POST'])
@@ -207,7 +208,8 @@ def course_new():
     
     form = CourseForm()
     if form.validate_on_submit():
-        uploaded_image_filenames = save_course_images(form.images.data, current_app)
+        saved_images = save_course_images(form.images.data, current_app)
+        uploaded_image_filenames = list(saved_images)
         image_filename = uploaded_image_filenames[0] if uploaded_image_filenames else None
         
         course = CourseService.create_course(
@@ -217,6 +219,10 @@ def course_new():
             image_filename=image_filename,
             image_filenames=uploaded_image_filenames
         )
+        ensure_course_images(saved_images, current_app)
+        if uploaded_image_filenames:
+            # Las variantes se generan en segundo plano; hasta entonces se sirve el original
+            variant_worker.wake()
         flash('Curso creado exitosamente.', 'success')
         return redirect(url_for('admin.courses_list'))
     
@@ -245,7 +251,8 @@ def course_edit(course_id):
     if form.validate_on_submit():
         image_filename = course.image_filename
         had_selected_files = has_selected_uploads(form.images.data)
-        uploaded_image_filenames = save_course_images(form.images.data, current_app)
+        saved_images = save_course_images(form.images.data, current_app)
+        uploaded_image_filenames = list(saved_images)
         if uploaded_image_filenames and not image_filename:
             image_filename = uploaded_image_filenames[0]
         if had_selected_files and not uploaded_image_filenames:
@@ -260,7 +267,9 @@ def course_edit(course_id):
             image_filename=image_filename,
             new_image_filenames=uploaded_image_filenames
         )
+        ensure_course_images(saved_images, current_app)
         if uploaded_image_filenames:
+            variant_worker.wake()
             flash(f'Se añadieron {len(uploaded_image_filenames)} imagen(es) al curso.', 'success')
         else:
             flash('Curso actualizado exitosamente.', 'success')
@@ -294,14 +303,13 @@ def course_image_delete(course_id, image_id):
     if course.image_filename == filename:
         course.image_filename = remaining_images[0].filename if remaining_images else None
 
-    # Solo borra el archivo físico si ya no está referenciado por ningún curso.
-    still_used = CourseImage.query.filter_by(filename=filename).first()
-    if not still_used:
-        image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        if os.path.exists(image_path):
-            os.remove(image_path)
+    # Solo borra el archivo físico si era su última referencia (contador en StoredUpload)
+    orphaned = UploadService.release_reference(filename)
 
+    catalog_cache.invalidate()
     db.session.commit()
+    if orphaned:
+        UploadService.delete_if_orphaned(filename)
     flash('Imagen eliminada correctamente.', 'success')
     return redirect(url_for('admin.course_edit', course_id=course_id))
 
@@ -358,6 +366,27 @@ def payment_gateway():
     
     return render_template('admin/payment_gateway.html', form=form, config=config)
 
+@bp.route('/payment-gateway/inbox-metrics')
+@login_required
+def redsys_inbox_metrics():
+    """Métricas de la bandeja de notificaciones de Redsys (profundidad y retraso)"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'No autorizado'}), 403
+
+    return jsonify(NotificationInboxService.get_metrics())
+
+@bp.route('/metrics')
+def request_metrics():
+    """Métricas por endpoint en formato Prometheus (admin o 'Authorization: Bearer METRICS_TOKEN')"""
+    metrics = current_app.extensions.get('request_metrics')
+    if metrics is None:
+        return jsonify({'error': 'Métricas desactivadas'}), 404
+    is_admin = current_user.is_authenticated and current_user.is_admin
+    if not is_admin and not metrics.token_authorized(current_app):
+        return jsonify({'error': 'No autorizado'}), 403
+
+    return Response(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
 # ========== COMPRADORES ==========
 
 @bp.route('/buyers')
@@ -368,8 +397,107 @@ def buyers_list():
         flash('No tienes permisos para acceder a esta sección.', 'error')
         return redirect(url_for('main.index'))
     
-    payments = PaymentService.get_payments_with_users()
-    return render_template('admin/buyers_list.html', payments=payments)
+    filters, filter_args = _buyer_filters_from_request()
+    after = PaymentService.decode_buyers_cursor(request.args.get('after', ''))
+    payments, next_cursor = PaymentService.get_buyers_page(filters, after=after)
+    return render_template('admin/buyers_list.html',
+                         payments=payments,
+                         next_cursor=next_cursor,
+                         is_first_page=after is None,
+                         filter_args=filter_args,
+                         courses=CourseService.get_all_courses())
+
+
+@bp.route('/buyers/export.csv')
+@login_required
+def buyers_export():
+    """Exporta a CSV los compradores (con los filtros del listado) generando el fichero sobre la marcha"""
+    if not current_user.is_admin:
+        flash('No tienes permisos para acceder a esta sección.', 'error')
+        return redirect(url_for('main.index'))
+
+    filters, _ = _buyer_filters_from_request()
+    rows = PaymentService.iter_completed_payments_for_export(filters)
+    filename = f"compradores_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
+    return Response(
+        stream_with_context(_buyers_csv(rows)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
+# Columnas del CSV de compradores, en el orden de iter_completed_payments_for_export
+BUYERS_CSV_HEADER = ['ID Pago', 'Fecha Compra', 'Importe', 'Método de Pago', 'ID Transacción',
+                     'Nombre', 'Email', 'Teléfono', 'ID Curso', 'Curso']
+# Filas que se acumulan antes de enviar un trozo de la respuesta
+BUYERS_CSV_CHUNK_ROWS = 500
+
+
+def _csv_safe(value):
+    """Evita que Excel interprete como fórmula un texto introducido por el comprador"""
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    return value
+
+
+def _buyers_csv(rows):
+    """Genera el CSV por trozos; el BOM inicial hace que Excel abra bien las tildes"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    writer.writerow(BUYERS_CSV_HEADER)
+
+    for count, row in enumerate(rows, start=1):
+        payment_id, completed_at, amount, payment_method, transaction_id, name, email, phone, course_id, course_title = row
+        writer.writerow([
+            payment_id,
+            completed_at.strftime('%d/%m/%Y %H:%M') if completed_at else '',
+            f"{amount:.2f}".replace('.', ','),
+            payment_method or '',
+            transaction_id or '',
+            _csv_safe(name or ''),
+            _csv_safe(email or ''),
+            _csv_safe(phone or ''),
+            course_id or '',
+            _csv_safe(course_title or ''),
+        ])
+        if count % BUYERS_CSV_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def _buyer_filters_from_request():
+    """
+    Lee los filtros del listado de compradores de la query string.
+    Devuelve los filtros ya convertidos para PaymentService y los valores originales
+    (solo los válidos) para rellenar el formulario y construir los enlaces de paginación.
+    """
+    filters = {}
+    filter_args = {}
+
+    course_id = request.args.get('course_id', type=int)
+    if course_id:
+        filters['course_id'] = course_id
+        filter_args['course_id'] = course_id
+
+    for name in ('date_from', 'date_to'):
+        value = request.args.get(name, '').strip()
+        if value:
+            try:
+                filters[name] = datetime.strptime(value, '%Y-%m-%d').date()
+                filter_args[name] = value
+            except ValueError:
+                pass
+
+    email_prefix = request.args.get('email', '').strip()
+    if email_prefix:
+        filters['email_prefix'] = email_prefix
+        filter_args['email'] = email_prefix
+
+    return filters, filter_args
 
 
 # ========== OFERTAS ==========
@@ -382,7 +510,7 @@ def offers_list():
         flash('No tienes permisos para acceder a esta sección.', 'error')
         return redirect(url_for('main.index'))
 
-    offers = Offer.query.order_by(Offer.quantity.asc()).all()
+    offers = OfferService.get_all_offers()
     return render_template('admin/offers_list.html', offers=offers)
 
 
@@ -396,14 +524,12 @@ def offer_new():
 
     form = OfferForm()
     if form.validate_on_submit():
-        offer = Offer(
+        OfferService.create_offer(
             quantity=int(form.quantity.data),
             price=form.price.data,
             description=form.description.data or None,
             is_active=form.is_active.data,
         )
-        db.session.add(offer)
-        db.session.commit()
         flash('Oferta creada correctamente.', 'success')
         return redirect(url_for('admin.offers_list'))
 
@@ -422,11 +548,13 @@ def offer_edit(offer_id):
     form = OfferForm(obj=offer)
 
     if form.validate_on_submit():
-        offer.quantity = int(form.quantity.data)
-        offer.price = form.price.data
-        offer.description = form.description.data or None
-        offer.is_active = form.is_active.data
-        db.session.commit()
+        OfferService.update_offer(
+            offer,
+            quantity=int(form.quantity.data),
+            price=form.price.data,
+            description=form.description.data or None,
+            is_active=form.is_active.data,
+        )
         flash('Oferta actualizada correctamente.', 'success')
         return redirect(url_for('admin.offers_list'))
 
@@ -442,7 +570,6 @@ def offer_delete(offer_id):
         return redirect(url_for('main.index'))
 
     offer = Offer.query.get_or_404(offer_id)
-    db.session.delete(offer)
-    db.session.commit()
+    OfferService.delete_offer(offer)
     flash('Oferta eliminada correctamente.', 'success')
     return redirect(url_for('admin.offers_list'))
@@ -1,42 +1,117 @@
 # blueprints/main/routes.py
-from flask import render_template, request, redirect, url_for, flash
+from datetime import timezone
+from flask import current_app, render_template, request, redirect, url_for, flash, session, make_response
 from . import bp
 from services.course_service import CourseService
 from services.offer_service import OfferService
+from services.cache_service import CacheVersionService, catalog_cache, frozen_pages, build_rendered_page
+from static_assets import site_fingerprint
 from models import Offer
 
+def _rendered_page_response(page):
+    """Construye la respuesta a partir de una página cacheada, en gzip si el cliente lo acepta"""
+    if 'gzip' in request.accept_encodings:
+        response = make_response(page.gzip_body)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = make_response(page.body)
+    response.headers['Content-Type'] = 'text/html; charset=utf-8'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def _conditional_page(render, tag, last_modified, max_age, render_private=None):
+    """
+    Respuesta con ETag/Last-Modified para las páginas públicas. El ETag combina la
+    huella de plantillas y estáticos (cambia con cada despliegue) con 'tag', que
+    identifica los datos de la página (versión del catálogo, curso...); si el
+    cliente o el proxy ya la tienen, se responde 304 sin consultar ni renderizar.
+    max_age=0 deja 'no-cache': se puede guardar pero hay que revalidar siempre.
+    Con mensajes flash pendientes se usa render_private (por defecto render).
+    """
+    # Con mensajes flash pendientes la página es personal: ni validadores ni caché
+    if session.get('_flashes'):
+        response = make_response((render_private or render)())
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+
+    site_hash, site_modified = site_fingerprint(current_app)
+    etag = f'{site_hash}-{tag}'
+    # Las fechas de la BDD son UTC sin zona; HTTP solo tiene resolución de segundos
+    last_modified = max(d for d in (last_modified, site_modified) if d is not None)
+    last_modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = request.if_modified_since is not None and last_modified <= request.if_modified_since
+    response = current_app.response_class(status=304) if not_modified else make_response(render())
+
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = f'public, max-age={max_age}' if max_age else 'public, no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def _catalog_page(render, tag, last_modified=None):
+    """Página que depende del catálogo: se revalida con cada invalidación de catalog_cache"""
+    version, catalog_modified = CacheVersionService.get_state('catalog')
+    dates = [d for d in (last_modified, catalog_modified) if d is not None]
+    return _conditional_page(render, f'{tag}-c{version}', max(dates) if dates else None,
+                             current_app.config['CATALOG_PAGES_MAX_AGE'])
+
+def _static_page(template):
+    """
+    Página sin datos de la BDD: solo cambia con un despliegue. Con
+    FREEZE_STATIC_PAGES se renderiza una vez por worker y después se sirven
+    los bytes (o el gzip) guardados; con mensajes flash se renderiza de nuevo.
+    """
+    def render_fresh():
+        return render_template(template)
+
+    def render():
+        if not current_app.config['FREEZE_STATIC_PAGES']:
+            return render_fresh()
+        return _rendered_page_response(frozen_pages.get(template, render_fresh))
+
+    return _conditional_page(render, 'static', None, current_app.config['STATIC_PAGES_MAX_AGE'],
+                             render_private=render_fresh)
+
 @bp.route('/')
 def index():
     """Landing page principal"""
-    courses = CourseService.get_active_courses()
-    offers = OfferService.get_active_offers()
-    # Convertimos las ofertas a estructuras simples para poder serializarlas a JSON en la plantilla
-    offers_data = [
-        {
-            "id": offer.id,
-            "quantity": offer.quantity,
-            "price": offer.price,
-            "description": offer.description,
-            "is_active": offer.is_active,
-        }
-        for offer in offers
-    ]
-    return render_template('index.html', courses=courses, offers=offers_data)
+    return _catalog_page(_index_response, 'index')
+
+def _index_response():
+    # Con mensajes flash pendientes la página es personal: se renderiza sin caché
+    if session.get('_flashes'):
+        return _render_index()
+
+    # La página completa se guarda por versión del catálogo: mientras ningún admin
+    # edite cursos u ofertas no se consulta el catálogo ni se ejecuta Jinja.
+    page = catalog_cache.get('page:index', lambda: build_rendered_page(_render_index()))
+    return _rendered_page_response(page)
+
+def _render_index():
+    """Renderiza la landing page con el catálogo y las ofertas activas"""
+    courses = CourseService.get_active_catalog()
+    # Tabla de precios óptima precalculada: el front-end la usa tal cual para el carrito
+    pricing_table = OfferService.get_pricing_table()
+    return render_template('index.html', courses=courses, pricing_table=pricing_table)
 
 @bp.route('/el-curso')
 def el_curso():
     """Página El Curso"""
-    return render_template('el_curso.html')
+    return _static_page('el_curso.html')
 
 @bp.route('/certificacion')
 def certificacion():
     """Página Certificación Oficial"""
-    return render_template('certificacion.html')
+    return _static_page('certificacion.html')
 
 @bp.route('/sobre-nosotros')
 def sobre_nosotros():
     """Página Sobre Nosotros"""
-    return render_template('sobre_nosotros.html')
+    return _static_page('sobre_nosotros.html')
 
 @bp.route('/course/<int:course_id>')
 def course_detail(course_id):
@@ -47,31 +122,32 @@ def course_detail(course_id):
         flash('Curso no encontrado.', 'error')
         return redirect(url_for('main.index'))
     
-    return render_template('course_detail.html', course=course)
+    return _catalog_page(lambda: render_template('course_detail.html', course=course),
+                         f'course-{course.id}', course.updated_at)
 
 # ========== PÁGINAS LEGALES ==========
 
 @bp.route('/aviso-legal')
 def aviso_legal():
     """Aviso Legal"""
-    return render_template('legal/aviso_legal.html')
+    return _static_page('legal/aviso_legal.html')
 
 @bp.route('/politica-privacidad')
 def politica_privacidad():
     """Política de Privacidad"""
-    return render_template('legal/politica_privacidad.html')
+    return _static_page('legal/politica_privacidad.html')
 
 @bp.route('/politica-cookies')
 def politica_cookies():
     """Política de Cookies"""
-    return render_template('legal/politica_cookies.html')
+    return _static_page('legal/politica_cookies.html')
 
 @bp.route('/terminos-condiciones')
 def terminos_condiciones():
     """Términos y Condiciones"""
-    return render_template('legal/terminos_condiciones.html')
+    return _static_page('legal/terminos_condiciones.html')
 
 @bp.route('/politica-cancelaciones')
 def politica_cancelaciones():
     """Política de Cancelaciones, Devoluciones y Matrículas"""
-    return render_template('legal/politica_cancelaciones.html')
+    return _static_page('legal/politica_cancelaciones.html')
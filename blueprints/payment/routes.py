@@ -1,4 +1,5 @@
 # blueprints/payment/routes.py
+import logging
 from flask import render_template, request, redirect, url_for, flash, jsonify
 from . import bp
 from services.payment_service import PaymentService
@@ -6,8 +7,12 @@ from services.user_service import UserService
 from services.course_service import CourseService
 from services.offer_service import OfferService
 from services.redsys_service import RedsysService
+from services.notification_inbox_service import NotificationInboxService, inbox_worker
 from flask_wtf import FlaskForm
 from wtforms import StringField, EmailField, TelField, validators
+from logging_setup import get_logger
+
+logger = get_logger('payment.routes')
 
 class PurchaseForm(FlaskForm):
     name = StringField('Nombre Completo', [
@@ -78,25 +83,22 @@ def process_payment(payment_id):
     payment_form_data = RedsysService.create_payment_form(
         payment_id=payment_id,
         course_title=course_title,
-        amount=payment.amount
+        amount=payment.amount,
+        config=redsys_config
     )
     
     if not payment_form_data:
         flash('Error al generar el formulario de pago.', 'error')
         return redirect(url_for('main.index'))
     
-    # Debug: loguear parámetros para verificar
-    mp = payment_form_data['Ds_MerchantParameters']
-    sig = payment_form_data['Ds_Signature']
-    print(f"[Redsys] MP raw: {mp}", flush=True)
-    print(f"[Redsys] SIG raw: {sig}", flush=True)
-    
-    # Decodificar y verificar contenido
-    try:
-        decoded = RedsysService.decode_merchant_parameters(mp)
-        print(f"[Redsys] MP decoded: {decoded}", flush=True)
-    except Exception as e:
-        print(f"[Redsys] Error decodificando MP: {e}", flush=True)
+    # Debug: solo se decodifica si el nivel DEBUG está activo para esta categoría
+    if logger.isEnabledFor(logging.DEBUG):
+        try:
+            decoded = RedsysService.decode_merchant_parameters(payment_form_data['Ds_MerchantParameters'])
+            logger.debug("Formulario Redsys generado", payment_id=payment_id,
+                         params=RedsysService.loggable_params(decoded))
+        except Exception as e:
+            logger.warning("Error decodificando MP", payment_id=payment_id, error=str(e))
     
     return render_template('payment/process_redsys.html',
                            payment=payment,
@@ -123,15 +125,13 @@ def cart_checkout():
         flash('Selección de cursos no válida.', 'error')
         return redirect(url_for('main.index'))
 
-    courses = CourseService.get_courses_by_ids(course_ids)
+    courses = CourseService.get_catalog_courses_by_ids(course_ids)
     if not courses:
         flash('No se han encontrado cursos válidos para el pago.', 'error')
         return redirect(url_for('main.index'))
 
-    # Asumimos que todos los cursos tienen el mismo precio base.
-    unit_price = courses[0].price
-    offers = OfferService.get_active_offers()
-    calc = OfferService.calculate_total_with_offers(len(courses), unit_price, offers)
+    # Combinación de packs más barata, respetando el precio de cada curso
+    calc = OfferService.calculate_cart_total([course.price for course in courses])
     total_amount = calc["total"]
 
     form = PurchaseForm()
@@ -167,28 +167,28 @@ def redsys_notification():
     Esta ruta debe ser accesible públicamente (sin autenticación)
     """
     try:
-        payload = request.form.to_dict()
-        print(f"[Redsys] POST /notification payload: {payload} | IP={request.remote_addr}", flush=True)
+        logger.info("POST /notification recibido", remote_addr=request.remote_addr,
+                    merchant_params=request.form.get('Ds_MerchantParameters', ''))
         merchant_params = request.form.get('Ds_MerchantParameters', '')
         signature = request.form.get('Ds_Signature', '')
         
         if not merchant_params or not signature:
-            print("[Redsys] Notificación sin parámetros obligatorios.", flush=True)
+            logger.warning("Notificación sin parámetros obligatorios")
             return jsonify({'error': 'Parámetros faltantes'}), 400
         
-        # Procesar notificación
-        result = RedsysService.process_notification(merchant_params, signature)
-        print(f"[Redsys] Resultado notificación: {result}", flush=True)
-        
-        if result.get('success'):
-            # Pago exitoso
-            return jsonify({'status': 'ok'}), 200
-        else:
-            # Error en el pago
-            return jsonify({'status': 'error', 'message': result.get('error')}), 200
+        # Se guarda en la bandeja y se confirma a Redsys al momento; la verificación
+        # y la actualización del pago las hace el worker de la bandeja.
+        notification_id = NotificationInboxService.enqueue(
+            merchant_params,
+            signature,
+            signature_version=request.form.get('Ds_SignatureVersion'),
+            remote_addr=request.remote_addr
+        )
+        inbox_worker.wake()
+        return jsonify({'status': 'received', 'notification_id': notification_id}), 200
             
     except Exception as e:
-        print(f"[Redsys] Error general en /notification: {e}", flush=True)
+        logger.exception("Error general en /notification")
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/redsys/ok')
@@ -229,11 +229,8 @@ def redsys_ko():
             payment_id = int(order_id) if order_id else None
             
             if payment_id:
-                payment = PaymentService.get_payment_by_id(payment_id)
-                if payment:
-                    payment.status = 'failed'
-                    from extensions import db
-                    db.session.commit()
+                # Solo pasa a 'failed' si seguía pendiente: nunca pisa un pago completado
+                PaymentService.fail_payment(payment_id)
         except:
             pass
     
@@ -21,6 +21,48 @@ class Config:
     UPLOAD_FOLDER = os.path.join(basedir, 'static', 'uploads', 'courses')
     MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # 5 MB máximo
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+    IMAGE_VARIANTS_WORKER = os.getenv('IMAGE_VARIANTS_WORKER', '1') == '1'      # Hilo en cada worker
+    IMAGE_VARIANT_FORMATS = os.getenv('IMAGE_VARIANT_FORMATS', 'avif,webp')      # Además de JPEG
+    
+    # Plantillas Jinja compiladas compartidas entre workers ('' para desactivar)
+    TEMPLATE_CACHE_DIR = os.getenv('TEMPLATE_CACHE_DIR', os.path.join(basedir, 'instance', 'jinja_cache'))
+    
+    # CSS/JS con hash y precomprimidos de 'flask build-assets' (ver static_assets.py)
+    STATIC_FINGERPRINTS = os.getenv('STATIC_FINGERPRINTS', '1') == '1'
+    
+    # Cache-Control de las páginas públicas (ETag/Last-Modified siempre, ver blueprints/main)
+    STATIC_PAGES_MAX_AGE = int(os.getenv('STATIC_PAGES_MAX_AGE', '3600'))    # Segundos: el curso, legales...
+    CATALOG_PAGES_MAX_AGE = int(os.getenv('CATALOG_PAGES_MAX_AGE', '0'))     # Portada y cursos (0 = revalidar)
+    FREEZE_STATIC_PAGES = os.getenv('FREEZE_STATIC_PAGES', '1') == '1'       # Renderizar una vez por worker
+    
+    # Aplicar migraciones de esquema pendientes al arrancar (ver schema_migrations.py)
+    AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', '1') == '1'
+    
+    # Perfil de SQLite para producción con varios workers (ver sqlite_tuning.py)
+    SQLITE_TUNING = os.getenv('SQLITE_TUNING', '0') == '1'                      # WAL + pragmas
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')               # OFF, NORMAL, FULL, EXTRA
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))    # Espera ante bloqueos
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(64 * 1024 * 1024)))  # Bytes (0 = sin mmap)
+    SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '16384'))       # Caché de páginas por conexión
+    
+    # Métricas por endpoint en formato Prometheus en /admin/metrics (ver request_metrics.py)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+    METRICS_DATABASE = os.getenv('METRICS_DATABASE', os.path.join(basedir, 'instance', 'metrics.db'))
+    METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '10'))  # Volcado de cada worker
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')                          # Bearer para Prometheus
+    
+    # Bandeja de notificaciones de Redsys (ver services/notification_inbox_service.py)
+    REDSYS_INBOX_WORKER = os.getenv('REDSYS_INBOX_WORKER', '1') == '1'  # Hilo en cada worker
+    REDSYS_INBOX_BATCH_SIZE = int(os.getenv('REDSYS_INBOX_BATCH_SIZE', '50'))
+    REDSYS_INBOX_POLL_SECONDS = float(os.getenv('REDSYS_INBOX_POLL_SECONDS', '5'))
+    REDSYS_INBOX_MAX_ATTEMPTS = int(os.getenv('REDSYS_INBOX_MAX_ATTEMPTS', '5'))
+    REDSYS_INBOX_CLAIM_TIMEOUT = int(os.getenv('REDSYS_INBOX_CLAIM_TIMEOUT', '300'))  # segundos
+    
+    # Configuración de logs (JSON por stdout, ver logging_setup.py)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.getenv('LOG_LEVELS', '')              # Ej: redsys=DEBUG,payment=WARNING
+    LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', '')  # Ej: redsys=0.1 (solo eventos < WARNING)
+    LOG_ASYNC = os.getenv('LOG_ASYNC', '1') == '1'        # Escribir desde un hilo aparte
 
 
 
@@ -0,0 +1,430 @@
+# loadtest_checkout.py
+# Prueba de carga del flujo de compra completo contra un servidor local:
+#   1. GET  /payment/buy/<id> (o /payment/cart?ids=...)   formulario y token CSRF
+#   2. POST del formulario                                 crea usuario y pago
+#   3. GET  /payment/process/<pago>                        formulario firmado de Redsys
+#   4. POST /payment/redsys/notification                   notificación firmada (Ds_Response 0000)
+#   5. GET  /payment/redsys/ok                             vuelta del cliente desde Redsys
+# Cada usuario virtual es un hilo con su propia sesión (cookies) que repite el
+# flujo. Informa por paso de throughput, p50/p95/p99, errores 'database is
+# locked' y otros errores, y comprueba al final que la bandeja de Redsys ha
+# completado todos los pagos.
+#
+# Sin --url arranca su propio servidor (werkzeug con hilos, en un proceso
+# aparte) sobre una BDD SQLite temporal con datos; las variables de entorno
+# como SQLITE_TUNING=1 se le pasan tal cual. Para medir varios procesos como en
+# Passenger, arranca el servidor por tu cuenta y usa --url y --course-ids. Con --save-baseline guarda el resultado
+# en loadtest_baseline.json; las ejecuciones siguientes se comparan con él y
+# terminan con error si p95 o throughput empeoran más de --tolerance.
+# Uso: python loadtest_checkout.py [--users 8] [--duration 20] [--cart] [--save-baseline]
+import sys
+import os
+import argparse
+import base64
+import http.cookiejar
+import json
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+# Configurar encoding UTF-8 para la salida
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+BASEDIR = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_BASELINE = os.path.join(BASEDIR, 'loadtest_baseline.json')
+
+SECRET_KEY = 'sq7HjrUOBfKmC576ILgskD5srU870gJ7'
+MERCHANT_CODE = '999008881'
+
+STEPS = ('buy_form', 'buy_submit', 'process', 'notification', 'redsys_ok')
+
+# Respuesta esperada de cada paso (el resto cuenta como error)
+EXPECTED_STATUS = {
+    'buy_form': (200,),
+    'buy_submit': (302,),
+    'process': (200,),
+    'notification': (200,),
+    'redsys_ok': (302,),
+}
+
+_LOCKED_MARKERS = ('database is locked', 'database is busy')
+
+# Servidor de la prueba: la app normal más un manejador que marca los errores
+# de bloqueo de SQLite para poder contarlos por paso desde el cliente
+_SERVER = r'''
+import sys
+sys.path.insert(0, {basedir!r})
+from sqlalchemy.exc import OperationalError
+from werkzeug.serving import run_simple
+from app import create_app
+from extensions import db
+
+app = create_app()
+
+@app.errorhandler(OperationalError)
+def database_error(error):
+    db.session.rollback()
+    return str(error.orig), 503
+
+run_simple('127.0.0.1', {port}, app, threaded=True)
+'''
+
+_SEED = r'''
+import sys
+sys.path.insert(0, {basedir!r})
+from app import app
+from services.course_service import CourseService
+from services.offer_service import OfferService
+from services.payment_gateway_service import PaymentGatewayService
+with app.app_context():
+    PaymentGatewayService.update_config('redsys', {merchant_code!r}, '001', {secret_key!r}, 'production')
+    ids = [CourseService.create_course(f'Curso {{i}}', 'Descripción del curso ' * 20, 250.0 + i).id for i in range(4)]
+    OfferService.create_offer(2, 450.0)
+    print(','.join(str(i) for i in ids))
+'''
+
+_COUNT_COMPLETED = r'''
+import sys
+sys.path.insert(0, {basedir!r})
+from app import app
+from models import Payment
+with app.app_context():
+    print(Payment.query.filter_by(status='completed').count())
+'''
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Cada paso se mide por separado: las redirecciones no se siguen"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _sign_notification(order_id, amount):
+    """Parámetros y firma HMAC_SHA256_V1 de una notificación aceptada, como los envía Redsys"""
+    from services.redsys_service import RedsysService
+
+    now = time.localtime()
+    params = RedsysService.encode_merchant_parameters({
+        'Ds_Date': time.strftime('%d/%m/%Y', now),
+        'Ds_Hour': time.strftime('%H:%M', now),
+        'Ds_Amount': amount,
+        'Ds_Currency': '978',
+        'Ds_Order': order_id,
+        'Ds_MerchantCode': MERCHANT_CODE,
+        'Ds_Terminal': '001',
+        'Ds_Response': '0000',
+        'Ds_TransactionType': '0',
+        'Ds_SecurePayment': '1',
+        'Ds_AuthorisationCode': '123456',
+    })
+    return params, RedsysService.generate_signature(params, order_id, SECRET_KEY)
+
+
+class CheckoutUser:
+    """Usuario virtual: una sesión HTTP con cookies que recorre el flujo de compra"""
+
+    def __init__(self, base_url, course_ids, cart, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.course_ids = course_ids
+        self.cart = cart
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(self.base_url + path, data=body, timeout=self.timeout) as response:
+                return response.status, response.headers, response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read().decode('utf-8', 'replace')
+
+    def run_once(self, n, record):
+        """Un checkout completo. record(paso, segundos, status, cuerpo) por cada paso; False si se corta"""
+        def step(name, path, data=None):
+            start = time.perf_counter()
+            try:
+                status, headers, body = self.request(path, data)
+            except (OSError, urllib.error.URLError) as e:
+                record(name, time.perf_counter() - start, None, str(e))
+                return None, None, None
+            ok = record(name, time.perf_counter() - start, status, body)
+            return (status, headers, body) if ok else (None, None, None)
+
+        if self.cart:
+            ids = ','.join(str(i) for i in self.course_ids[:2])
+            path = f'/payment/cart?ids={ids}'
+        else:
+            path = f'/payment/buy/{self.course_ids[n % len(self.course_ids)]}'
+        status, _, body = step('buy_form', path)
+        if status is None:
+            return False
+        token = re.search(r'name="csrf_token"[^>]*value="([^"]+)"', body)
+        form = {
+            'csrf_token': token.group(1) if token else '',
+            'name': f'Comprador {threading.get_ident()}-{n}',
+            'email': f'comprador{threading.get_ident()}.{n}@example.com',
+            'phone': '600000000',
+        }
+        if self.cart:
+            path = '/payment/cart'
+            form['course_ids'] = ids
+
+        status, headers, _ = step('buy_submit', path, form)
+        if status is None:
+            return False
+        location = urllib.parse.urlsplit(headers.get('Location', ''))
+
+        status, _, body = step('process', location.path)
+        if status is None:
+            return False
+        encoded = re.search(r'name="Ds_MerchantParameters" value="([^"]+)"', body).group(1)
+        merchant = json.loads(base64.b64decode(encoded))
+        params, signature = _sign_notification(merchant['DS_MERCHANT_ORDER'], merchant['DS_MERCHANT_AMOUNT'])
+
+        status, _, _ = step('notification', '/payment/redsys/notification', {
+            'Ds_SignatureVersion': 'HMAC_SHA256_V1',
+            'Ds_MerchantParameters': params,
+            'Ds_Signature': signature,
+        })
+        if status is None:
+            return False
+
+        status, _, _ = step('redsys_ok', '/payment/redsys/ok?' + urllib.parse.urlencode({
+            'Ds_SignatureVersion': 'HMAC_SHA256_V1',
+            'Ds_MerchantParameters': params,
+            'Ds_Signature': signature,
+        }))
+        return status is not None
+
+
+class StepStats:
+    def __init__(self):
+        self.latencies = []
+        self.locked = 0
+        self.errors = 0
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_load(base_url, course_ids, users, duration, iterations, cart, timeout):
+    stats = defaultdict(StepStats)
+    checkouts = [0]
+    lock = threading.Lock()
+    barrier = threading.Barrier(users + 1)
+
+    def record(step, elapsed, status, body):
+        ok = status in EXPECTED_STATUS[step]
+        with lock:
+            entry = stats[step]
+            if ok:
+                entry.latencies.append(elapsed)
+            elif any(marker in (body or '') for marker in _LOCKED_MARKERS):
+                entry.locked += 1
+            else:
+                entry.errors += 1
+        return ok
+
+    def worker():
+        user = CheckoutUser(base_url, course_ids, cart, timeout)
+        barrier.wait()
+        n = 0
+        while (iterations and n < iterations) or (not iterations and time.perf_counter() < deadline):
+            if user.run_once(n, record):
+                with lock:
+                    checkouts[0] += 1
+            n += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(users)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    deadline = start + duration
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    results = {'users': users, 'cart': cart, 'seconds': round(elapsed, 2), 'checkouts': checkouts[0],
+               'checkouts_per_second': round(checkouts[0] / elapsed, 2), 'steps': {}}
+    for step in STEPS:
+        entry = stats[step]
+        latencies = sorted(entry.latencies)
+        results['steps'][step] = {
+            'requests': len(latencies),
+            'throughput': round(len(latencies) / elapsed, 2),
+            'p50_ms': _ms(_percentile(latencies, 0.50)),
+            'p95_ms': _ms(_percentile(latencies, 0.95)),
+            'p99_ms': _ms(_percentile(latencies, 0.99)),
+            'db_locked': entry.locked,
+            'errors': entry.errors,
+        }
+    return results
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def _fmt(value):
+    return '      -' if value is None else f'{value:7.1f}'
+
+
+def print_results(results):
+    print(f"📊 {results['checkouts']} checkouts completos en {results['seconds']} s con {results['users']} usuarios"
+          f" ({results['checkouts_per_second']} checkouts/s){' | carrito' if results['cart'] else ''}\n")
+    print(f"   {'paso':<13} {'req/s':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'locked':>7} {'errores':>8}")
+    for step in STEPS:
+        s = results['steps'][step]
+        print(f"   {step:<13} {s['throughput']:7.1f} {_fmt(s['p50_ms'])} {_fmt(s['p95_ms'])} {_fmt(s['p99_ms'])}"
+              f" {s['db_locked']:7d} {s['errors']:8d}")
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Lista de regresiones respecto a la línea base (p95 y throughput por paso, bloqueos y errores)"""
+    regressions = []
+    for step in STEPS:
+        current, previous = results['steps'][step], baseline['steps'].get(step)
+        if not previous:
+            continue
+        if previous['p95_ms'] and current['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{step}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if previous['throughput'] and current['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append(f"{step}: throughput {previous['throughput']} -> {current['throughput']} req/s")
+        for key in ('db_locked', 'errors'):
+            if current[key] > previous[key]:
+                regressions.append(f"{step}: {key} {previous[key]} -> {current[key]}")
+    return regressions
+
+
+def wait_for_server(base_url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError("El servidor de la prueba terminó al arrancar")
+        try:
+            with urllib.request.urlopen(base_url + '/', timeout=2):
+                return
+        except (OSError, urllib.error.URLError):
+            time.sleep(0.2)
+    raise RuntimeError(f"El servidor no responde en {base_url}")
+
+
+def wait_for_completions(env, expected, timeout=30):
+    """Espera a que la bandeja de Redsys procese las notificaciones; devuelve los pagos completados"""
+    deadline = time.time() + timeout
+    completed = 0
+    while time.time() < deadline:
+        output = subprocess.run([sys.executable, '-c', _COUNT_COMPLETED.format(basedir=BASEDIR)],
+                                env=env, capture_output=True, text=True, check=True)
+        completed = int(output.stdout.strip().splitlines()[-1])
+        if completed >= expected:
+            break
+        time.sleep(1)
+    return completed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del checkout completo")
+    parser.add_argument('--users', type=int, default=8, help="usuarios concurrentes (hilos)")
+    parser.add_argument('--duration', type=float, default=20, help="segundos de prueba")
+    parser.add_argument('--iterations', type=int, default=0, help="checkouts por usuario (en lugar de --duration)")
+    parser.add_argument('--cart', action='store_true', help="usar /payment/cart con dos cursos")
+    parser.add_argument('--url', help="servidor ya arrancado (con la pasarela configurada con SECRET_KEY de este script)")
+    parser.add_argument('--course-ids', help="IDs de cursos activos separados por comas (con --url)")
+    parser.add_argument('--timeout', type=float, default=30, help="timeout de cada petición en segundos")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="fichero JSON de la línea base")
+    parser.add_argument('--save-baseline', action='store_true', help="guardar este resultado como línea base")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="empeoramiento admitido frente a la línea base")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    server = None
+    env = None
+    try:
+        if args.url:
+            if not args.course_ids:
+                parser.error("--url necesita --course-ids")
+            base_url = args.url.rstrip('/')
+            course_ids = [int(i) for i in args.course_ids.split(',')]
+        else:
+            tmp_dir = tempfile.mkdtemp(prefix='loadtest_')
+            env = dict(os.environ,
+                       DATABASE_URL='sqlite:///' + os.path.join(tmp_dir, 'loadtest.db'),
+                       METRICS_DATABASE=os.path.join(tmp_dir, 'metrics.db'),
+                       TEMPLATE_CACHE_DIR=os.path.join(tmp_dir, 'jinja_cache'),
+                       LOG_LEVEL=os.environ.get('LOG_LEVEL', 'WARNING'))
+            output = subprocess.run([sys.executable, '-c', _SEED.format(
+                basedir=BASEDIR, merchant_code=MERCHANT_CODE, secret_key=SECRET_KEY)],
+                env=env, capture_output=True, text=True, check=True)
+            course_ids = [int(i) for i in output.stdout.strip().splitlines()[-1].split(',')]
+
+            port = _free_port()
+            base_url = f'http://127.0.0.1:{port}'
+            server = subprocess.Popen([sys.executable, '-c', _SERVER.format(
+                basedir=BASEDIR, port=port)],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        wait_for_server(base_url, server)
+        print(f"🔍 Checkout bajo carga contra {base_url}...\n")
+        results = run_load(base_url, course_ids, args.users, args.duration, args.iterations, args.cart, args.timeout)
+        print_results(results)
+
+        ok = True
+        if env is not None:
+            completed = wait_for_completions(env, results['checkouts'])
+            results['payments_completed'] = completed
+            print(f"\n   Pagos completados por la bandeja de Redsys: {completed}/{results['checkouts']}")
+            ok = completed >= results['checkouts']
+
+        if args.save_baseline:
+            with open(args.baseline, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            print(f"\n💾 Línea base guardada en {args.baseline}")
+        elif os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = compare_with_baseline(results, baseline, args.tolerance)
+            if (baseline['users'], baseline['cart']) != (results['users'], results['cart']):
+                print(f"\n⚠️  La línea base se tomó con otra carga ({baseline['users']} usuarios"
+                      f"{', carrito' if baseline['cart'] else ''}): no se compara")
+            elif regressions:
+                print(f"\n❌ Regresiones frente a la línea base (tolerancia {args.tolerance:.0%}):")
+                for regression in regressions:
+                    print(f"   - {regression}")
+                ok = False
+            else:
+                print(f"\n✅ Sin regresiones frente a la línea base (tolerancia {args.tolerance:.0%})")
+        return ok
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,216 @@
+# logging_setup.py
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Todos los loggers de la aplicación cuelgan de este espacio de nombres
+LOGGER_NAMESPACE = 'chiangmai'
+
+REDACTED = '[REDACTED]'
+
+# Claves cuyo valor nunca debe salir al log (firmas, claves, tarjeta y datos personales)
+_SENSITIVE_KEY_PARTS = ('signature', 'secret', 'card', 'expiry', 'titular', 'holder', 'email', 'phone',
+                        'password', 'csrf')
+_SENSITIVE_KEY_RE = re.compile(r'^(name|full_name|nombre)$|(^|_)(pan|cvv2?)$')
+# Parámetros de Redsys en Base64: se sustituyen por su longitud
+_ENCODED_KEYS = {'ds_merchantparameters', 'merchant_params', 'merchant_params_encoded'}
+
+_EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+# Cadenas Base64 largas (parámetros codificados o firmas) dentro de un texto libre
+_BASE64_RE = re.compile(r'[A-Za-z0-9+/_-]{40,}={0,2}')
+
+
+def _redact_text(text):
+    text = _EMAIL_RE.sub(REDACTED, text)
+    return _BASE64_RE.sub(REDACTED, text)
+
+
+def redact(value, key=None):
+    """Devuelve una copia del valor sin firmas ni datos personales"""
+    if key is not None:
+        lowered = str(key).lower()
+        if lowered in _ENCODED_KEYS:
+            return f'<{len(value)} bytes>' if isinstance(value, (str, bytes)) else REDACTED
+        sensitive = any(part in lowered for part in _SENSITIVE_KEY_PARTS) or _SENSITIVE_KEY_RE.search(lowered)
+        if sensitive and value not in (None, ''):
+            return REDACTED
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return _redact_text(value)
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por evento: fecha, nivel, categoría, mensaje y campos ya redactados"""
+
+    def format(self, record):
+        category = record.name
+        if category.startswith(LOGGER_NAMESPACE + '.'):
+            category = category[len(LOGGER_NAMESPACE) + 1:]
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'category': category,
+            'msg': _redact_text(record.getMessage()),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(redact(fields))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = _redact_text(record.exc_text)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Deja pasar solo una fracción de los eventos por debajo de WARNING según su
+    categoría (prefijo más largo). Los avisos y errores no se muestrean nunca.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        name = record.name
+        for category, rate in self.rates:
+            full = f'{LOGGER_NAMESPACE}.{category}'
+            if name == full or name.startswith(full + '.'):
+                return rate >= 1 or random.random() < rate
+        return True
+
+
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+
+class ForkSafeQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler cuyo hilo de escritura se arranca en el primer evento de cada
+    proceso: Passenger puede hacer fork después de crear la app y los hilos no
+    sobreviven al fork. El hilo de la petición solo encola el registro.
+    """
+
+    def __init__(self, target):
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self._pid = None
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # La cola heredada del padre puede contener registros ya escritos por él
+            self.queue = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            atexit.register(self._stop_listener)
+            self._pid = os.getpid()
+
+    def _stop_listener(self):
+        """Vacía la cola y detiene el hilo de escritura de este proceso"""
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+
+    def prepare(self, record):
+        """
+        Copia del registro lista para otro hilo. A diferencia de QueueHandler,
+        no mezcla la traza en el mensaje: la deja en exc_text para que
+        JsonFormatter la escriba en 'exc', y conserva los campos estructurados.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+        # exc_info lleva referencias a los frames de la petición: no se encola
+        record.exc_info = None
+        return record
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._ensure_listener()
+        super().emit(record)
+
+    def close(self):
+        self._stop_listener()
+        self.target.close()
+        super().close()
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Permite pasar campos estructurados como kwargs: logger.info('Pago completado', payment_id=3)"""
+
+    _RESERVED = {'exc_info', 'stack_info', 'stacklevel', 'extra'}
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs) if key not in self._RESERVED}
+        if fields:
+            kwargs['extra'] = dict(kwargs.get('extra') or {}, fields=fields)
+        return msg, kwargs
+
+
+def get_logger(category):
+    """Obtiene el logger estructurado de una categoría (redsys, payment, gateway...)"""
+    return StructuredLogger(logging.getLogger(f'{LOGGER_NAMESPACE}.{category}'), {})
+
+
+def _parse_mapping(value, cast):
+    """Acepta un dict o una cadena 'categoria=valor,otra=valor' (formato de las variables de entorno)"""
+    if isinstance(value, dict):
+        return {key: cast(val) for key, val in value.items()}
+    mapping = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            key, val = item.split('=', 1)
+            mapping[key.strip()] = cast(val.strip())
+    return mapping
+
+
+def configure_logging(app, stream=None):
+    """
+    Configura los loggers de la aplicación: salida JSON por stdout, niveles por
+    categoría, muestreo y, si LOG_ASYNC está activo, escritura en un hilo aparte.
+    """
+    root = logging.getLogger(LOGGER_NAMESPACE)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.propagate = False
+    root.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+
+    # Los niveles por categoría de una configuración anterior no deben sobrevivir
+    for name, existing in logging.root.manager.loggerDict.items():
+        if name.startswith(LOGGER_NAMESPACE + '.') and isinstance(existing, logging.Logger):
+            existing.setLevel(logging.NOTSET)
+
+    for category, level in _parse_mapping(app.config.get('LOG_LEVELS'), str.upper).items():
+        logging.getLogger(f'{LOGGER_NAMESPACE}.{category}').setLevel(level)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    handler = ForkSafeQueueHandler(output) if app.config.get('LOG_ASYNC', True) else output
+    handler.addFilter(SamplingFilter(_parse_mapping(app.config.get('LOG_SAMPLE_RATES'), float)))
+    root.addHandler(handler)
+    return root
@@ -6,7 +6,7 @@ from datetime import datetime
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(120), nullable=False)
+    email = db.Column(db.String(120), nullable=False, index=True)
     phone = db.Column(db.String(20), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_admin = db.Column(db.Boolean, default=False)
@@ -27,6 +27,9 @@ class User(db.Model, UserMixin):
 
 
 class Course(db.Model):
+    # Catálogo público: cursos activos ordenados por fecha sin ordenar en memoria
+    __table_args__ = (db.Index('ix_course_active_created_at', 'is_active', 'created_at'),)
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
@@ -43,7 +46,10 @@ class Course(db.Model):
         backref='course',
         lazy=True,
         cascade='all, delete-orphan',
-        order_by='CourseImage.id.asc()'
+        # course_id delante: la carga de la galería de varios cursos (selectinload,
+        # WHERE course_id IN ...) sale ordenada de ix_course_image_course_id_id sin
+        # ordenar en un temporal; dentro de cada curso el orden sigue siendo por id
+        order_by='(CourseImage.course_id.asc(), CourseImage.id.asc())'
     )
     
     def __repr__(self):
@@ -80,11 +86,20 @@ class Course(db.Model):
             return [f'/static/uploads/courses/{self.image_filename}']
         return ['/static/images/default-course.jpg']
 
+    def get_responsive_images(self):
+        """Retorna las imágenes del curso (mismo orden que get_image_urls) con sus variantes"""
+        from services.image_service import ImageService
+        return ImageService.course_images(self)
+
 
 class CourseImage(db.Model):
+    # Galería de cada curso en orden de subida
+    __table_args__ = (db.Index('ix_course_image_course_id_id', 'course_id', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False, index=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
     filename = db.Column(db.String(255), nullable=False)
+    variants = db.Column(db.Text)  # JSON de variantes generadas (NULL = pendiente, ver image_service)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
@@ -93,8 +108,20 @@ class CourseImage(db.Model):
     def get_image_url(self):
         return f'/static/uploads/courses/{self.filename}'
 
+    def get_responsive_image(self):
+        """Retorna las URLs de las variantes (src, srcset y sources) para <picture>"""
+        from services.image_service import ImageService
+        return ImageService.responsive_image(self.filename, self.variants)
+
 
 class Payment(db.Model):
+    # Listado de compradores (paginado por completed_at, id), filtro por curso e historial por usuario
+    __table_args__ = (
+        db.Index('ix_payment_status_completed_at', 'status', 'completed_at'),
+        db.Index('ix_payment_course_status_completed_at', 'course_id', 'status', 'completed_at'),
+        db.Index('ix_payment_user_created_at', 'user_id', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
@@ -137,6 +164,9 @@ class PaymentGatewayConfig(db.Model):
 
 
 class Offer(db.Model):
+    # Ofertas activas ordenadas por cantidad
+    __table_args__ = (db.Index('ix_offer_active_quantity', 'is_active', 'quantity'),)
+
     id = db.Column(db.Integer, primary_key=True)
     quantity = db.Column(db.Integer, nullable=False)  # nº de cursos del pack
     price = db.Column(db.Float, nullable=False)       # precio total del pack
@@ -147,3 +177,55 @@ class Offer(db.Model):
     def __repr__(self):
         return f'<Offer {self.quantity} cursos por {self.price}€>'
 
+
+
+class CacheVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)   # catalog, ...
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
+
+
+class RedsysNotification(db.Model):
+    """Bandeja de entrada (solo inserción) de notificaciones de Redsys pendientes de aplicar"""
+    id = db.Column(db.Integer, primary_key=True)
+    merchant_parameters = db.Column(db.Text, nullable=False)
+    signature = db.Column(db.String(255), nullable=False)
+    signature_version = db.Column(db.String(50))
+    remote_addr = db.Column(db.String(64))
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, processing, processed, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    result = db.Column(db.String(255))
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    claimed_at = db.Column(db.DateTime)
+    processed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<RedsysNotification {self.id} - {self.status}>'
+
+
+class StoredUpload(db.Model):
+    """Archivo de UPLOAD_FOLDER con el nº de CourseImage que lo usan (ver upload_service)"""
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False, unique=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<StoredUpload {self.filename} ({self.ref_count} refs)>'
+
+
+class RevenueRollup(db.Model):
+    """Ingresos agregados por día y curso, actualizados al completar cada pago"""
+    __table_args__ = (db.UniqueConstraint('day', 'course_id', name='uq_revenue_rollup_day_course'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    payments_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<RevenueRollup {self.day} curso {self.course_id}: {self.revenue}€>'
@@ -0,0 +1,101 @@
+# profile_startup.py
+# Perfil del arranque de un worker en un proceso Python nuevo:
+#   1. Tiempo de import por paquete (python -X importtime), sumando el tiempo
+#      propio de cada módulo bajo su paquete de primer nivel.
+#   2. cProfile de create_app() y de la primera petición a la portada, con las
+#      funciones que más tiempo acumulan.
+# Usa una BDD SQLite temporal. Uso: python profile_startup.py [nº de filas]
+import sys
+import os
+import shutil
+import subprocess
+import tempfile
+from collections import defaultdict
+
+# Configurar encoding UTF-8 para la salida
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+BASEDIR = os.path.abspath(os.path.dirname(__file__))
+
+# Módulos propios de la aplicación: se muestran por separado del resto de paquetes
+APP_PACKAGES = {'app', 'config', 'extensions', 'models', 'logging_setup', 'sqlite_tuning',
+                'schema_migrations', 'blueprints', 'services'}
+
+_PROFILE_CHILD = r'''
+import cProfile, io, pstats, sys
+sys.path.insert(0, {basedir!r})
+import flask, flask_sqlalchemy  # dependencias: ya medidas en el apartado de imports
+profiler = cProfile.Profile()
+profiler.enable()
+import app as app_module
+app_module.app.test_client().get('/')
+profiler.disable()
+out = io.StringIO()
+pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats({rows})
+print(out.getvalue())
+'''
+
+
+def import_times(env):
+    """Devuelve {paquete: ms} con el tiempo propio de import sumado por paquete de primer nivel"""
+    # app.app crea la aplicación: incluye los blueprints y servicios que importa create_app()
+    code = f"import sys; sys.path.insert(0, {BASEDIR!r}); import app; app.app"
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            env=env, capture_output=True, text=True, check=True)
+    totals = defaultdict(float)
+    for line in output.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            _, self_us, _, module = line.split('|', 3)
+        except ValueError:
+            self_us, _, module = line[len('import time:'):].split('|', 2)
+        totals[module.strip().split('.')[0]] += int(self_us) / 1000
+    return totals
+
+
+def main(rows=25):
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.remove(db_path)
+    cache_dir = tempfile.mkdtemp(prefix='jinja_cache_')
+    env = dict(os.environ,
+               DATABASE_URL='sqlite:///' + db_path,
+               TEMPLATE_CACHE_DIR=cache_dir,
+               LOG_LEVEL='WARNING',
+               REDSYS_INBOX_WORKER='0',
+               IMAGE_VARIANTS_WORKER='0',
+               METRICS_ENABLED='0')
+    try:
+        # Primer arranque aparte: crea el esquema para que no cuente en las mediciones
+        subprocess.run([sys.executable, '-c', f"import sys; sys.path.insert(0, {BASEDIR!r}); import app; app.app"],
+                       env=env, capture_output=True, check=True)
+
+        totals = import_times(env)
+        own = {name: ms for name, ms in totals.items() if name in APP_PACKAGES}
+        deps = {name: ms for name, ms in totals.items() if name not in APP_PACKAGES}
+
+        print(f"📦 Tiempo de import (tiempo propio sumado por paquete), total {sum(totals.values()):.1f} ms")
+        print("   Dependencias:")
+        for name, ms in sorted(deps.items(), key=lambda item: item[1], reverse=True)[:15]:
+            print(f"      {name:<28} {ms:7.1f} ms")
+        print("   Aplicación:")
+        for name, ms in sorted(own.items(), key=lambda item: item[1], reverse=True):
+            print(f"      {name:<28} {ms:7.1f} ms")
+
+        output = subprocess.run([sys.executable, '-c', _PROFILE_CHILD.format(basedir=BASEDIR, rows=rows)],
+                                env=env, capture_output=True, text=True, check=True)
+        print(f"\n⏱️  create_app() + primera petición a / (cProfile, {rows} funciones con más tiempo acumulado):")
+        print(output.stdout)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+    return True
+
+
+if __name__ == '__main__':
+    print("🔍 Perfil del arranque de un worker...\n")
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 25)
@@ -0,0 +1,268 @@
+# redsys_simulator.py
+# Simulador local de Redsys para pruebas de carga y de fallos sin conexión.
+# Recibe el formulario de process_redsys.html en /sis/realizarPago, comprueba
+# Ds_SignatureVersion y la firma HMAC_SHA256_V1 con la clave del comercio,
+# decide el resultado del pago y:
+#   - redirige al cliente a URLOK/URLKO con los parámetros firmados, como Redsys;
+#   - envía la notificación firmada a DS_MERCHANT_MERCHANTURL desde hilos de
+#     fondo, con latencia configurable, duplicados, desorden (retraso aleatorio
+#     extra por envío), códigos de denegación y reintentos si el comercio no
+#     responde 200.
+# GET /sim/stats devuelve los contadores en JSON.
+#
+# La clave se toma de --secret-key o de la configuración activa de la pasarela
+# en la BDD de la aplicación. Con --configure se guarda la URL del simulador
+# como URL de test de Redsys y el entorno pasa a 'test'.
+# Uso: python redsys_simulator.py [--port 5050] [--latency-ms 200] [--duplicate-rate 0.2]
+#                                 [--reorder-ms 500] [--deny-rate 0.1] [--configure]
+import sys
+import argparse
+import heapq
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+
+# Configurar encoding UTF-8 para la salida
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+SIGNATURE_VERSION = 'HMAC_SHA256_V1'
+
+# Códigos de error del SIS que devuelve el simulador en lugar de la página de pago
+SIS_SIGNATURE_ERROR = 'SIS0042'     # Error en el cálculo de la firma
+SIS_VERSION_ERROR = 'SIS0413'       # Versión de firma no soportada
+SIS_PARAMETERS_ERROR = 'SIS0431'    # Error en Ds_MerchantParameters
+
+# Denegaciones habituales: tarjeta caducada, emisor no disponible, operación
+# no permitida, error de autenticación 3DS
+DEFAULT_DENY_CODES = '0101,0180,0184,0190,9915'
+
+
+class NotificationDispatcher:
+    """
+    Cola de notificaciones pendientes ordenada por hora de entrega. Los hilos
+    de envío sacan las que ya tocan y las envían con reintentos; el retraso
+    aleatorio de cada envío hace que duplicados y pagos distintos lleguen
+    desordenados.
+    """
+
+    def __init__(self, workers, retries, retry_delay, timeout, stats):
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.stats = stats
+        self._heap = []
+        self._sequence = 0
+        self._condition = threading.Condition()
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f'redsys-sim-{i}', daemon=True).start()
+
+    def schedule(self, delay, url, form, attempt=0):
+        with self._condition:
+            self._sequence += 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, self._sequence, url, form, attempt))
+            self._condition.notify()
+
+    def _next(self):
+        with self._condition:
+            while True:
+                if self._heap:
+                    wait = self._heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        return heapq.heappop(self._heap)
+                    self._condition.wait(wait)
+                else:
+                    self._condition.wait()
+
+    def _run(self):
+        while True:
+            _, _, url, form, attempt = self._next()
+            try:
+                data = urllib.parse.urlencode(form).encode()
+                with urllib.request.urlopen(url, data=data, timeout=self.timeout) as response:
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except OSError:
+                status = None
+            self.stats.add('notifications_sent')
+            if status == 200:
+                self.stats.add('notifications_delivered')
+            elif attempt < self.retries:
+                self.stats.add('notifications_retried')
+                self.schedule(self.retry_delay * (2 ** attempt), url, form, attempt + 1)
+            else:
+                self.stats.add('notifications_failed')
+
+
+class SimulatorStats:
+    """Contadores compartidos por las peticiones y los hilos de envío"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self._counts[key] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+def load_secret_key():
+    """Clave del comercio de la configuración activa de la pasarela en la BDD de la aplicación"""
+    from app import create_app
+    from services.redsys_service import RedsysService
+
+    app = create_app()
+    with app.app_context():
+        config = RedsysService.get_config()
+        return config.secret_key if config else None
+
+
+def configure_gateway(url):
+    """Apunta la URL de test de Redsys de la aplicación al simulador"""
+    from app import create_app
+    from services.payment_gateway_service import PaymentGatewayService
+
+    app = create_app()
+    with app.app_context():
+        PaymentGatewayService.update_config('redsys', environment='test', redsys_url_test=url)
+
+
+def create_simulator(secret_key, options, rng=None):
+    from flask import Flask, jsonify, redirect, request
+    from services.redsys_service import RedsysService
+
+    rng = rng or random.Random()
+    rng_lock = threading.Lock()
+    stats = SimulatorStats()
+    dispatcher = NotificationDispatcher(options.workers, options.retries, options.retry_delay_ms / 1000,
+                                        options.timeout, stats)
+    deny_codes = [code.strip() for code in options.deny_codes.split(',') if code.strip()]
+
+    simulator = Flask(__name__)
+
+    def sis_error(code):
+        stats.add(f'rejected_{code}')
+        return f'<html><body><h1>Error {code}</h1></body></html>', 400
+
+    def random_delay(rng_value):
+        return (options.latency_ms + rng_value * options.jitter_ms) / 1000
+
+    @simulator.route('/sis/realizarPago', methods=['POST'])
+    def realizar_pago():
+        stats.add('payments_received')
+        if request.form.get('Ds_SignatureVersion') != SIGNATURE_VERSION:
+            return sis_error(SIS_VERSION_ERROR)
+        encoded = request.form.get('Ds_MerchantParameters', '')
+        signature = request.form.get('Ds_Signature', '')
+        try:
+            merchant = RedsysService.decode_merchant_parameters(encoded)
+            order_id = merchant['DS_MERCHANT_ORDER']
+        except (ValueError, KeyError, TypeError):
+            # TypeError: JSON válido que no es un objeto (p. ej. '[]')
+            return sis_error(SIS_PARAMETERS_ERROR)
+        if not RedsysService.verify_signature(encoded, order_id, signature, secret_key):
+            return sis_error(SIS_SIGNATURE_ERROR)
+
+        with rng_lock:
+            denied = bool(deny_codes) and rng.random() < options.deny_rate
+            response_code = rng.choice(deny_codes) if denied else '0000'
+            copies = 1
+            while copies <= options.max_duplicates and rng.random() < options.duplicate_rate:
+                copies += 1
+            delays = [random_delay(rng.random()) + rng.random() * options.reorder_ms / 1000 for _ in range(copies)]
+            authorisation_code = '' if denied else f'{rng.randrange(10 ** 6):06d}'
+
+        now = time.localtime()
+        params = {
+            'Ds_Date': time.strftime('%d/%m/%Y', now),
+            'Ds_Hour': time.strftime('%H:%M', now),
+            'Ds_Amount': merchant.get('DS_MERCHANT_AMOUNT', ''),
+            'Ds_Currency': merchant.get('DS_MERCHANT_CURRENCY', '978'),
+            'Ds_Order': order_id,
+            'Ds_MerchantCode': merchant.get('DS_MERCHANT_MERCHANTCODE', ''),
+            'Ds_Terminal': merchant.get('DS_MERCHANT_TERMINAL', ''),
+            'Ds_Response': response_code,
+            'Ds_TransactionType': merchant.get('DS_MERCHANT_TRANSACTIONTYPE', '0'),
+            'Ds_SecurePayment': '1',
+            'Ds_AuthorisationCode': authorisation_code,
+        }
+        encoded_params = RedsysService.encode_merchant_parameters(params)
+        signed = {
+            'Ds_SignatureVersion': SIGNATURE_VERSION,
+            'Ds_MerchantParameters': encoded_params,
+            'Ds_Signature': RedsysService.generate_signature(encoded_params, order_id, secret_key),
+        }
+
+        notify_url = options.notify_url or merchant.get('DS_MERCHANT_MERCHANTURL')
+        if notify_url:
+            for delay in delays:
+                dispatcher.schedule(delay, notify_url, signed)
+            stats.add('notifications_scheduled', len(delays))
+            stats.add('duplicates_scheduled', len(delays) - 1)
+        stats.add('payments_denied' if denied else 'payments_authorised')
+
+        return_url = merchant.get('DS_MERCHANT_URLKO' if denied else 'DS_MERCHANT_URLOK')
+        if not return_url:
+            return jsonify({'Ds_Response': response_code, **signed})
+        return redirect(f"{return_url}?{urllib.parse.urlencode(signed)}")
+
+    @simulator.route('/sim/stats')
+    def sim_stats():
+        return jsonify(stats.snapshot())
+
+    return simulator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulador local de Redsys (HMAC_SHA256_V1)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--secret-key', help="clave del comercio (por defecto la de la BDD de la aplicación)")
+    parser.add_argument('--notify-url', help="URL de notificación (por defecto DS_MERCHANT_MERCHANTURL del pago)")
+    parser.add_argument('--latency-ms', type=float, default=200, help="retraso base de cada notificación")
+    parser.add_argument('--jitter-ms', type=float, default=100, help="retraso aleatorio añadido (0..jitter)")
+    parser.add_argument('--duplicate-rate', type=float, default=0.0, help="probabilidad de enviar otra copia")
+    parser.add_argument('--max-duplicates', type=int, default=2, help="copias extra como máximo por pago")
+    parser.add_argument('--reorder-ms', type=float, default=0, help="retraso extra aleatorio por envío (desorden)")
+    parser.add_argument('--deny-rate', type=float, default=0.0, help="fracción de pagos denegados")
+    parser.add_argument('--deny-codes', default=DEFAULT_DENY_CODES, help="códigos Ds_Response de denegación")
+    parser.add_argument('--retries', type=int, default=3, help="reintentos si el comercio no responde 200")
+    parser.add_argument('--retry-delay-ms', type=float, default=500, help="espera del primer reintento (se duplica)")
+    parser.add_argument('--workers', type=int, default=4, help="hilos que envían notificaciones")
+    parser.add_argument('--timeout', type=float, default=10, help="timeout de cada notificación en segundos")
+    parser.add_argument('--seed', type=int, help="semilla para repetir la misma secuencia de resultados")
+    parser.add_argument('--configure', action='store_true', help="apuntar la URL de test de la aplicación al simulador")
+    options = parser.parse_args()
+
+    sim_url = f'http://{options.host}:{options.port}/sis/realizarPago'
+    if options.configure:
+        configure_gateway(sim_url)
+        print(f"🔧 URL de test de Redsys configurada: {sim_url} (entorno 'test')")
+
+    secret_key = options.secret_key or load_secret_key()
+    if not secret_key:
+        print("❌ No hay clave del comercio: usa --secret-key o configura la pasarela en el panel")
+        return False
+
+    from werkzeug.serving import run_simple
+
+    simulator = create_simulator(secret_key, options, random.Random(options.seed))
+    print(f"🏦 Simulador de Redsys en {sim_url}")
+    print(f"   latencia {options.latency_ms:.0f}+{options.jitter_ms:.0f} ms | duplicados {options.duplicate_rate:.0%}"
+          f" | desorden {options.reorder_ms:.0f} ms | denegados {options.deny_rate:.0%} | reintentos {options.retries}")
+    run_simple(options.host, options.port, simulator, threaded=True)
+    return True
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
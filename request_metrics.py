@@ -0,0 +1,229 @@
+# request_metrics.py
+# Métricas por endpoint en formato de texto de Prometheus: peticiones por
+# código de estado, histograma de latencia y, por petición, número de consultas
+# SQL y tiempo pasado en la BDD (eventos before/after_cursor_execute).
+#
+# Cada worker de Passenger acumula en memoria y cada METRICS_FLUSH_SECONDS suma
+# sus incrementos a una BDD SQLite propia (METRICS_DATABASE, separada de la de
+# la aplicación para no competir por su bloqueo de escritura). El endpoint
+# /admin/metrics lee esa BDD, así que el resultado agrega todos los procesos,
+# incluidos los que ya terminaron; los datos de otros workers pueden llevar
+# hasta METRICS_FLUSH_SECONDS de retraso.
+import atexit
+import hmac
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from logging_setup import get_logger
+
+logger = get_logger('metrics')
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Familia -> (tipo, descripción)
+METRIC_FAMILIES = {
+    'chiangmai_http_requests_total': ('counter', 'Peticiones HTTP por endpoint, método y código de estado'),
+    'chiangmai_http_request_duration_seconds': ('histogram', 'Duración de las peticiones HTTP'),
+    'chiangmai_http_request_sql_queries': ('histogram', 'Consultas SQL ejecutadas por petición'),
+    'chiangmai_http_request_db_seconds': ('histogram', 'Tiempo de BDD por petición'),
+}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS metric (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    le TEXT NOT NULL DEFAULT '',
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels, le)
+)
+'''
+
+_UPSERT = '''
+INSERT INTO metric (name, labels, le, value) VALUES (?, ?, ?, ?)
+ON CONFLICT (name, labels, le) DO UPDATE SET value = value + excluded.value
+'''
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{key}="{_label_value(value)}"' for key, value in labels.items())
+
+
+class RequestMetrics:
+    """
+    Acumulador de un proceso. Solo guarda incrementos pendientes de volcar:
+    tras cada volcado empieza de cero, así que un worker que muere pierde como
+    mucho METRICS_FLUSH_SECONDS de datos y no hace falta distinguir procesos.
+    """
+
+    def __init__(self, path, flush_seconds=10):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._pending = defaultdict(float)
+        self._pid = os.getpid()
+        self._last_flush = time.monotonic()
+        self._schema_ready = False
+
+    def _observe(self, name, labels, buckets, value):
+        pending = self._pending
+        # Se incrementan (o se suma 0 a) todos los buckets para que siempre existan
+        for le in buckets:
+            pending[(f'{name}_bucket', labels, f'{le:g}')] += value <= le
+        pending[(f'{name}_bucket', labels, '+Inf')] += 1
+        pending[(f'{name}_sum', labels, '')] += value
+        pending[(f'{name}_count', labels, '')] += 1
+
+    def record(self, endpoint, method, status, duration, sql_queries, db_seconds):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Proceso hijo tras un fork: lo pendiente es del padre
+                self._pid = os.getpid()
+                self._pending = defaultdict(float)
+                self._last_flush = time.monotonic()
+            self._pending[('chiangmai_http_requests_total', _labels(endpoint=endpoint, method=method, status=status), '')] += 1
+            self._observe('chiangmai_http_request_duration_seconds', _labels(endpoint=endpoint, method=method),
+                          LATENCY_BUCKETS, duration)
+            self._observe('chiangmai_http_request_sql_queries', _labels(endpoint=endpoint), SQL_QUERY_BUCKETS, sql_queries)
+            self._observe('chiangmai_http_request_db_seconds', _labels(endpoint=endpoint), LATENCY_BUCKETS, db_seconds)
+        if time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=2)
+        if not self._schema_ready:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(_SCHEMA)
+            self._schema_ready = True
+        return connection
+
+    def flush(self):
+        """Suma los incrementos pendientes de este proceso a la BDD de métricas"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            pending, self._pending = self._pending, defaultdict(float)
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.executemany(_UPSERT, [(*key, value) for key, value in pending.items()])
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            # Se reintenta en el siguiente volcado: los contadores no se pierden
+            logger.warning("No se pudieron guardar las métricas", error=str(e))
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] += value
+
+    def render(self):
+        """Métricas agregadas de todos los procesos en formato de texto de Prometheus"""
+        self.flush()
+        connection = self._connect()
+        try:
+            rows = connection.execute('SELECT name, labels, le, value FROM metric').fetchall()
+        finally:
+            connection.close()
+
+        samples = defaultdict(list)
+        for name, labels, le, value in rows:
+            family = name
+            for suffix in ('_bucket', '_sum', '_count'):
+                if name.endswith(suffix) and name[:-len(suffix)] in METRIC_FAMILIES:
+                    family = name[:-len(suffix)]
+            samples[family].append((name, labels, le, value))
+
+        def sort_key(sample):
+            name, labels, le, _ = sample
+            return (labels, name, float('inf') if le == '+Inf' else float(le or 0))
+
+        lines = []
+        for family, (metric_type, description) in METRIC_FAMILIES.items():
+            lines.append(f'# HELP {family} {description}')
+            lines.append(f'# TYPE {family} {metric_type}')
+            for name, labels, le, value in sorted(samples.get(family, ()), key=sort_key):
+                if le:
+                    labels = f'{labels},le="{le}"' if labels else f'le="{le}"'
+                lines.append(f'{name}{{{labels}}} {int(value) if value.is_integer() else repr(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def token_authorized(self, app):
+        """True si la petición trae 'Authorization: Bearer <METRICS_TOKEN>' (para Prometheus)"""
+        token = app.config.get('METRICS_TOKEN')
+        header = request.headers.get('Authorization', '')
+        if not token or not header.startswith('Bearer '):
+            return False
+        return hmac.compare_digest(header[len('Bearer '):].encode(), token.encode())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and g.get('_request_metrics') is not None:
+        conn.info.setdefault('_metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_metrics_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    state = g.get('_request_metrics') if has_request_context() else None
+    if state is not None:
+        state[1] += 1
+        state[2] += elapsed
+
+
+def init_metrics(app, engine):
+    """
+    Activa las métricas (si METRICS_ENABLED): mide cada petición y cuenta las
+    consultas que lanza a través de engine. Las consultas de los hilos de fondo
+    (bandeja de Redsys, variantes de imágenes) no tienen petición y no cuentan.
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return None
+
+    metrics = RequestMetrics(app.config['METRICS_DATABASE'], app.config.get('METRICS_FLUSH_SECONDS', 10))
+    app.extensions['request_metrics'] = metrics
+    atexit.register(metrics.flush)
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def record(status):
+        state = g.pop('_request_metrics', None)
+        if state is None:
+            return
+        started, sql_queries, db_seconds = state
+        metrics.record(request.endpoint or 'unmatched', request.method, status,
+                       time.perf_counter() - started, sql_queries, db_seconds)
+
+    @app.before_request
+    def start_request_metrics():
+        # [inicio, consultas SQL, segundos de BDD]
+        g._request_metrics = [time.perf_counter(), 0, 0.0]
+
+    @app.after_request
+    def record_request_metrics(response):
+        record(response.status_code)
+        return response
+
+    @app.teardown_request
+    def record_failed_request_metrics(exc):
+        # Si after_request no llegó a ejecutarse la petición terminó en un error no capturado
+        record(500)
+
+    return metrics
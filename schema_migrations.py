@@ -0,0 +1,229 @@
+# schema_migrations.py
+"""
+Migraciones versionadas del esquema de la BDD.
+
+Cada migración tiene un número de revisión, una descripción y una función que
+recibe la conexión. Las revisiones aplicadas se guardan en la tabla
+schema_migrations; al arrancar basta una consulta (MAX(revision)) para saber que
+el esquema está al día, sin inspeccionar tablas ni ejecutar create_all.
+
+Cada migración se aplica en su propia transacción junto con el registro de su
+revisión. En SQLite la transacción es BEGIN IMMEDIATE: si varios workers de
+Passenger arrancan a la vez, solo uno migra y el resto ve la revisión ya aplicada.
+
+Para cambiar el esquema: modificar models.py y añadir una migración al final de
+MIGRATIONS. La línea base (revisión 1) crea las tablas que falten con el modelo
+actual, así que las migraciones posteriores deben comprobar si su cambio ya
+existe (ver add_column_if_missing).
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from logging_setup import get_logger
+
+logger = get_logger('migrations')
+
+_CREATE_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        revision INTEGER PRIMARY KEY,
+        description VARCHAR(200) NOT NULL,
+        applied_at DATETIME NOT NULL
+    )
+"""
+
+
+# ========== UTILIDADES PARA LAS MIGRACIONES ==========
+
+def table_columns(connection, table):
+    """Nombres de las columnas de una tabla (vacío si la tabla no existe)"""
+    from sqlalchemy import inspect
+    inspector = inspect(connection)
+    if not inspector.has_table(table):
+        return set()
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def add_column_if_missing(connection, table, column, ddl_type):
+    """ALTER TABLE ... ADD COLUMN solo si la tabla existe y aún no tiene la columna"""
+    columns = table_columns(connection, table)
+    if columns and column not in columns:
+        quoted = connection.dialect.identifier_preparer.quote(table)
+        connection.exec_driver_sql(f'ALTER TABLE {quoted} ADD COLUMN {column} {ddl_type}')
+        logger.info("Columna añadida", table=table, column=column)
+
+
+# ========== MIGRACIONES ==========
+
+def _0001_baseline(connection):
+    """
+    Crea las tablas que falten y añade a las BDD antiguas las columnas que antes
+    añadían update_database.py, update_database_redsys.py y update_db_public_url.py.
+    """
+    from extensions import db
+    import models  # noqa: F401  (registra las tablas en db.metadata)
+
+    add_column_if_missing(connection, 'payment', 'course_id', 'INTEGER')
+    add_column_if_missing(connection, 'course', 'image_filename', 'VARCHAR(255)')
+    for column, ddl_type in (
+        ('merchant_code', 'VARCHAR(9)'),
+        ('terminal', "VARCHAR(3) DEFAULT '001'"),
+        ('environment', "VARCHAR(10) DEFAULT 'test'"),
+        ('redsys_url_test', 'VARCHAR(200)'),
+        ('redsys_url_production', 'VARCHAR(200)'),
+        ('public_base_url', 'VARCHAR(200)'),
+    ):
+        add_column_if_missing(connection, 'payment_gateway_config', column, ddl_type)
+
+    db.metadata.create_all(connection)
+
+
+def _0002_query_indexes(connection):
+    """Índices del listado de compradores, historial de pagos y catálogo (audit_query_plans.py)"""
+    from extensions import db
+    import models  # noqa: F401
+
+    names = {
+        'ix_user_email', 'ix_user_created_at',
+        'ix_course_created_at', 'ix_course_active_created_at',
+        'ix_payment_created_at', 'ix_payment_status_completed_at',
+        'ix_payment_course_status_completed_at', 'ix_payment_user_created_at',
+        'ix_offer_quantity', 'ix_offer_active_quantity',
+    }
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in names:
+                index.create(connection, checkfirst=True)
+
+
+def _0003_backfill_revenue_rollup(connection):
+    """Rellena el rollup de ingresos diarios con los pagos completados antes de que existiera"""
+    if connection.execute(text('SELECT COUNT(*) FROM revenue_rollup')).scalar():
+        return
+    connection.execute(text("""
+        INSERT INTO revenue_rollup (day, course_id, payments_count, revenue)
+        SELECT date(completed_at), course_id, COUNT(id), COALESCE(SUM(amount), 0)
+        FROM payment
+        WHERE status = 'completed' AND completed_at IS NOT NULL AND course_id IS NOT NULL
+        GROUP BY date(completed_at), course_id
+    """))
+
+
+def _0004_course_image_variants(connection):
+    """Columna con las variantes generadas de cada imagen (services/image_service.py)"""
+    add_column_if_missing(connection, 'course_image', 'variants', 'TEXT')
+
+
+def _0005_stored_uploads(connection):
+    """Contador de referencias de los archivos subidos, con las CourseImage existentes"""
+    from models import StoredUpload
+    StoredUpload.__table__.create(connection, checkfirst=True)
+    if connection.execute(text('SELECT COUNT(*) FROM stored_upload')).scalar():
+        return
+    connection.execute(text("""
+        INSERT INTO stored_upload (filename, ref_count, created_at)
+        SELECT filename, COUNT(id), MIN(created_at)
+        FROM course_image
+        GROUP BY filename
+    """))
+
+
+def _0006_trim_list_indexes(connection):
+    """
+    Quita los índices de una sola columna que solo servían a listados completos
+    sin filtro ni LIMIT (leen todas las filas igual) y cambia el de la galería
+    por (course_id, id), que da la carga de varios cursos ya ordenada.
+    """
+    from models import CourseImage
+    for name in ('ix_user_created_at', 'ix_course_created_at', 'ix_payment_created_at',
+                 'ix_offer_quantity', 'ix_course_image_course_id'):
+        connection.execute(text(f'DROP INDEX IF EXISTS {name}'))
+    for index in CourseImage.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+# (revisión, descripción, función): solo se añaden al final, nunca se reordenan
+MIGRATIONS = [
+    (1, 'Línea base: tablas y columnas de los scripts update_database*', _0001_baseline),
+    (2, 'Índices compuestos para las consultas de los servicios', _0002_query_indexes),
+    (3, 'Rellenar revenue_rollup con los pagos completados existentes', _0003_backfill_revenue_rollup),
+    (4, 'Variantes responsive de las imágenes de los cursos', _0004_course_image_variants),
+    (5, 'Archivos subidos por contenido con contador de referencias', _0005_stored_uploads),
+    (6, 'Índices de listados completos fuera; galería por (course_id, id)', _0006_trim_list_indexes),
+]
+
+LATEST_REVISION = MIGRATIONS[-1][0]
+
+
+# ========== MOTOR ==========
+
+def current_revision(connection):
+    """Última revisión aplicada, o 0 si la BDD nunca se ha migrado"""
+    try:
+        return connection.execute(text('SELECT MAX(revision) FROM schema_migrations')).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        # La tabla no existe todavía (BDD nueva o anterior a las migraciones)
+        connection.rollback()
+        return 0
+
+
+@contextmanager
+def _migration_transaction(connection):
+    """
+    Transacción de una migración. En SQLite, pysqlite no abre transacción antes
+    del DDL: se usa BEGIN IMMEDIATE explícito (la conexión está en AUTOCOMMIT)
+    para que CREATE/ALTER y el registro de la revisión se confirmen juntos.
+    """
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+        try:
+            yield
+        except Exception:
+            connection.exec_driver_sql('ROLLBACK')
+            raise
+        connection.exec_driver_sql('COMMIT')
+    else:
+        with connection.begin():
+            yield
+
+
+def upgrade(engine, target=None):
+    """Aplica las migraciones pendientes hasta target (por defecto, la última). Devuelve las aplicadas."""
+    target = LATEST_REVISION if target is None else target
+    applied = []
+
+    with engine.connect() as connection:
+        if connection.dialect.name == 'sqlite':
+            connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+
+        with _migration_transaction(connection):
+            connection.exec_driver_sql(_CREATE_VERSION_TABLE)
+
+        for revision, description, migrate in MIGRATIONS:
+            if revision > target:
+                break
+            with _migration_transaction(connection):
+                # Se relee dentro de la transacción: otro worker puede haberla aplicado ya
+                if revision <= current_revision(connection):
+                    continue
+                logger.info("Aplicando migración", revision=revision, description=description)
+                migrate(connection)
+                connection.execute(
+                    text('INSERT INTO schema_migrations (revision, description, applied_at) VALUES (:r, :d, :t)'),
+                    {'r': revision, 'd': description, 't': datetime.utcnow()}
+                )
+                applied.append(revision)
+
+    return applied
+
+
+def ensure_schema(engine):
+    """
+    Llamada al arrancar la app: una sola consulta si el esquema está al día;
+    si no, aplica las migraciones pendientes.
+    """
+    with engine.connect() as connection:
+        revision = current_revision(connection)
+    if revision >= LATEST_REVISION:
+        return []
+    return upgrade(engine)
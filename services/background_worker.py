@@ -0,0 +1,48 @@
+# services/background_worker.py
+import os
+import threading
+from flask import current_app
+
+
+class BackgroundWorker:
+    """
+    Hilo de fondo por proceso que ejecuta drain() dentro de un app_context.
+    Se arranca en el primer wake() de cada proceso (los hilos no sobreviven al
+    fork de Passenger) y después drain() se repite con cada wake() y, si hay
+    poll_setting, cada tantos segundos como indique esa clave de configuración.
+    """
+
+    def __init__(self, name, drain, enabled_setting, logger, error_message, poll_setting=None):
+        self.name = name
+        self.drain = drain
+        self.enabled_setting = enabled_setting
+        self.poll_setting = poll_setting
+        self.logger = logger
+        self.error_message = error_message
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def wake(self, app=None):
+        app = app or current_app._get_current_object()
+        if not app.config.get(self.enabled_setting, True):
+            return
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._event = threading.Event()
+                    thread = threading.Thread(target=self._run, args=(app,), name=self.name, daemon=True)
+                    thread.start()
+                    self._pid = os.getpid()
+        self._event.set()
+
+    def _run(self, app):
+        poll_seconds = app.config.get(self.poll_setting) if self.poll_setting else None
+        while True:
+            self._event.wait(timeout=poll_seconds)
+            self._event.clear()
+            try:
+                with app.app_context():
+                    self.drain()
+            except Exception:
+                self.logger.exception(self.error_message)
@@ -0,0 +1,133 @@
+# services/cache_service.py
+import gzip
+import threading
+from collections import namedtuple
+from datetime import datetime
+from flask import g, has_app_context
+from extensions import db
+from models import CacheVersion
+
+
+class CacheVersionService:
+    @staticmethod
+    def get_state(name):
+        """
+        Obtiene (versión, fecha de la última invalidación) de una caché; (0, None)
+        si nunca se invalidó. Se lee una sola vez por petición y se recuerda en g.
+        """
+        key = f'_cache_version_{name}'
+        if has_app_context() and key in g:
+            return g.get(key)
+        row = db.session.query(CacheVersion.version, CacheVersion.updated_at).filter_by(name=name).first()
+        state = (row.version, row.updated_at) if row else (0, None)
+        if has_app_context():
+            setattr(g, key, state)
+        return state
+
+    @staticmethod
+    def get_version(name):
+        """Obtiene la versión guardada en BDD para una caché (0 si nunca se invalidó)"""
+        return CacheVersionService.get_state(name)[0]
+
+    @staticmethod
+    def bump_version(name):
+        """
+        Incrementa la versión dentro de la transacción en curso.
+        No hace commit: el llamador lo confirma junto con el cambio de datos,
+        de modo que ningún worker puede ver datos nuevos con la versión antigua.
+        """
+        updated = CacheVersion.query.filter_by(name=name).update(
+            {
+                CacheVersion.version: CacheVersion.version + 1,
+                CacheVersion.updated_at: datetime.utcnow(),
+            },
+            synchronize_session=False
+        )
+        if not updated:
+            db.session.add(CacheVersion(name=name, version=1))
+        if has_app_context():
+            g.pop(f'_cache_version_{name}', None)
+
+
+# Respuesta HTML ya renderizada junto a su variante comprimida con gzip
+RenderedPage = namedtuple('RenderedPage', ['body', 'gzip_body'])
+
+
+def build_rendered_page(html):
+    """Codifica el HTML renderizado y precalcula su versión gzip (una sola vez)"""
+    body = html.encode('utf-8')
+    return RenderedPage(body=body, gzip_body=gzip.compress(body, compresslevel=9, mtime=0))
+
+
+class VersionedCache:
+    """
+    Caché en memoria del proceso validada contra un contador de versión en BDD.
+    Cada worker de Passenger tiene su propia copia; en cada lectura se compara
+    la versión local con la de la BDD (una consulta por clave primaria), así que
+    una edición hecha en cualquier worker invalida la caché de todos sin TTL.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._version = None
+        self._values = {}
+
+    def get(self, key, loader):
+        """Devuelve el valor cacheado para key o lo calcula con loader()"""
+        version = CacheVersionService.get_version(self.name)
+        with self._lock:
+            if self._version == version and key in self._values:
+                return self._values[key]
+
+        value = loader()
+
+        with self._lock:
+            if self._version is None or version > self._version:
+                self._version = version
+                self._values = {}
+            if version == self._version:
+                self._values[key] = value
+        return value
+
+    def invalidate(self):
+        """Marca la caché como obsoleta en todos los workers (requiere commit posterior)"""
+        CacheVersionService.bump_version(self.name)
+
+
+# Cursos y ofertas activos que se muestran en la portada y en el carrito
+catalog_cache = VersionedCache('catalog')
+
+# Configuración activa de la pasarela de pago
+gateway_config_cache = VersionedCache('gateway_config')
+
+
+class FrozenPages:
+    """
+    Páginas sin datos de la BDD (legales, el curso...) renderizadas una sola vez
+    por proceso junto con su versión gzip. Su contenido solo cambia con un
+    despliegue, que reinicia los workers, así que no necesitan invalidación.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages = {}
+
+    def get(self, key, render):
+        """Devuelve la RenderedPage de key, renderizándola con render() la primera vez"""
+        page = self._pages.get(key)
+        if page is None:
+            with self._lock:
+                page = self._pages.get(key)
+                if page is None:
+                    page = build_rendered_page(render())
+                    self._pages[key] = page
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._pages = {}
+
+
+# Páginas informativas y legales (ver blueprints/main)
+frozen_pages = FrozenPages()
@@ -1,6 +1,13 @@
 # services/course_service.py
+from collections import namedtuple
+from sqlalchemy.orm import selectinload
 from extensions import db
 from models import Course, CourseImage
+from services.cache_service import catalog_cache
+from services.upload_service import UploadService
+
+# Vista de solo lectura de un curso para la portada (sin sesión ni carga perezosa)
+CatalogCourse = namedtuple('CatalogCourse', ['id', 'title', 'description', 'price', 'images'])
 
 class CourseService:
     @staticmethod
@@ -13,8 +20,9 @@ class CourseService:
         if image_filenames:
             for filename in image_filenames:
                 if filename:
-                    db.session.add(CourseImage(course_id=course.id, filename=filename))
+                    CourseService.add_course_image(course.id, filename)
 
+        catalog_cache.invalidate()
         db.session.commit()
         return course
     
@@ -29,9 +37,47 @@ class CourseService:
         return Course.query.filter_by(is_active=True).order_by(Course.created_at.desc()).all()
     
     @staticmethod
-    def get_all_courses():
-        """Obtiene todos los cursos"""
-        return Course.query.order_by(Course.created_at.desc()).all()
+    def get_active_catalog():
+        """Obtiene los cursos activos de la portada desde la caché del catálogo"""
+        return catalog_cache.get('active_courses', CourseService._load_active_catalog)
+    
+    @staticmethod
+    def get_catalog_courses_by_ids(course_ids):
+        """Obtiene cursos activos del catálogo cacheado a partir de una lista de IDs"""
+        if not course_ids:
+            return []
+        wanted = set(course_ids)
+        return [course for course in CourseService.get_active_catalog() if course.id in wanted]
+    
+    @staticmethod
+    def _load_active_catalog():
+        """
+        Carga los cursos activos con sus imágenes (URLs y srcset) ya calculadas.
+        selectinload trae todas las CourseImage en una sola consulta adicional,
+        así la portada cuesta siempre 2 consultas sin importar el nº de cursos.
+        """
+        courses = Course.query.filter_by(is_active=True)\
+            .options(selectinload(Course.images))\
+            .order_by(Course.created_at.desc())\
+            .all()
+        return [
+            CatalogCourse(
+                id=course.id,
+                title=course.title,
+                description=course.description,
+                price=course.price,
+                images=tuple(course.get_responsive_images()),
+            )
+            for course in courses
+        ]
+    
+    @staticmethod
+    def get_all_courses(with_images=False):
+        """Obtiene todos los cursos (with_images: galerías en una consulta, para las miniaturas)"""
+        query = Course.query.order_by(Course.created_at.desc())
+        if with_images:
+            query = query.options(selectinload(Course.images))
+        return query.all()
     
     @staticmethod
     def get_courses_by_ids(course_ids):
@@ -58,15 +104,27 @@ class CourseService:
         if image_filename is not None:
             course.image_filename = image_filename
         if new_image_filenames:
+            existing = {image.filename for image in course.images}
             for filename in new_image_filenames:
-                if filename:
-                    db.session.add(CourseImage(course_id=course.id, filename=filename))
+                # La misma foto subida otra vez ya es el mismo archivo: no se repite en la galería
+                if filename and filename not in existing:
+                    CourseService.add_course_image(course.id, filename)
+                    existing.add(filename)
         
         from datetime import datetime
         course.updated_at = datetime.utcnow()
+        catalog_cache.invalidate()
         db.session.commit()
         return course
     
+    @staticmethod
+    def add_course_image(course_id, filename):
+        """Añade una imagen a la galería y suma su referencia al archivo (sin hacer commit)"""
+        image = CourseImage(course_id=course_id, filename=filename)
+        db.session.add(image)
+        UploadService.add_reference(filename)
+        return image
+
     @staticmethod
     def delete_course(course_id):
         """Elimina un curso (soft delete)"""
@@ -75,6 +133,7 @@ class CourseService:
             course.is_active = False
             from datetime import datetime
             course.updated_at = datetime.utcnow()
+            catalog_cache.invalidate()
             db.session.commit()
         return course
 
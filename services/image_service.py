@@ -0,0 +1,219 @@
+# services/image_service.py
+import json
+import os
+from collections import namedtuple
+from flask import current_app
+from extensions import db
+from models import CourseImage
+from services.cache_service import catalog_cache
+from services.background_worker import BackgroundWorker
+from logging_setup import get_logger
+
+logger = get_logger('images')
+
+# Variantes que se generan de cada imagen subida: (nombre, ancho máximo en px)
+IMAGE_VARIANTS = (
+    ('thumb', 320),
+    ('card', 640),
+    ('hero', 1280),
+)
+
+# Formato -> (extensión, tipo MIME, opciones de Pillow al guardar)
+IMAGE_FORMATS = {
+    'avif': ('avif', 'image/avif', {'quality': 55, 'speed': 6}),
+    'webp': ('webp', 'image/webp', {'quality': 80, 'method': 6}),
+    'jpeg': ('jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+UPLOADS_URL = '/static/uploads/courses'
+DEFAULT_IMAGE_URL = '/static/images/default-course.jpg'
+
+# Imagen lista para pintar con <picture>: src/srcset en JPEG y <source> por formato moderno
+ResponsiveImage = namedtuple('ResponsiveImage', ['src', 'srcset', 'sources', 'width', 'height'])
+
+
+class ImageService:
+    """
+    Variantes redimensionadas (thumb, card, hero) de las imágenes de los cursos.
+    Se generan fuera de la petición (ver VariantWorker) en los formatos de
+    IMAGE_VARIANT_FORMATS, con la orientación EXIF aplicada y sin metadatos.
+    El resultado se guarda en CourseImage.variants como JSON; mientras es NULL
+    las plantillas usan el archivo original.
+    """
+
+    @staticmethod
+    def variants_folder(app=None):
+        app = app or current_app
+        return os.path.join(app.config['UPLOAD_FOLDER'], 'variants')
+
+    @staticmethod
+    def enabled_formats(app=None):
+        """Formatos configurados que este Pillow sabe escribir (JPEG siempre, como respaldo)"""
+        from PIL import features
+        app = app or current_app
+        wanted = [f.strip().lower() for f in app.config.get('IMAGE_VARIANT_FORMATS', 'avif,webp').split(',') if f.strip()]
+        formats = [f for f in wanted if f in IMAGE_FORMATS and f != 'jpeg' and features.check(f)]
+        return formats + ['jpeg']
+
+    @staticmethod
+    def variant_filename(filename, variant, fmt):
+        stem = filename.rsplit('.', 1)[0]
+        return f"{stem}-{variant}.{IMAGE_FORMATS[fmt][0]}"
+
+    @staticmethod
+    def generate_variants(filename, app=None):
+        """
+        Genera las variantes de un archivo de UPLOAD_FOLDER. Devuelve el dict que
+        se guarda en CourseImage.variants: formatos y tamaño real de cada variante
+        (nunca se amplía: una imagen pequeña repite el ancho original).
+        """
+        from PIL import Image, ImageOps
+        app = app or current_app
+        source_path = os.path.join(app.config['UPLOAD_FOLDER'], *filename.split('/'))
+        folder = ImageService.variants_folder(app)
+        formats = ImageService.enabled_formats(app)
+
+        # Subidas direccionadas por contenido (upload_service): si otra CourseImage
+        # con el mismo archivo ya generó las variantes, basta leer sus tamaños
+        existing = ImageService._existing_variants(filename, formats, folder)
+        if existing:
+            return existing
+
+        with Image.open(source_path) as original:
+            original.seek(0)  # GIF/WebP animados: solo el primer fotograma
+            image = ImageOps.exif_transpose(original)
+            has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+
+            sizes = {}
+            for variant, max_width in IMAGE_VARIANTS:
+                resized = image
+                if image.width > max_width:
+                    height = max(1, round(image.height * max_width / image.width))
+                    resized = image.resize((max_width, height), Image.LANCZOS)
+                sizes[variant] = [resized.width, resized.height]
+                for fmt in formats:
+                    out = resized
+                    if fmt == 'jpeg' and has_alpha:
+                        out = Image.new('RGB', resized.size, (255, 255, 255))
+                        out.paste(resized, mask=resized.getchannel('A'))
+                    # Sin exif= ni icc_profile= Pillow no copia metadatos; se escribe a un
+                    # temporal y se renombra para no servir nunca un archivo a medias
+                    target = os.path.join(folder, *ImageService.variant_filename(filename, variant, fmt).split('/'))
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    tmp_path = f"{target}.{os.getpid()}.tmp"
+                    out.save(tmp_path, format=fmt.upper(), **IMAGE_FORMATS[fmt][2])
+                    os.replace(tmp_path, target)
+
+        return {'formats': formats, 'sizes': sizes}
+
+    @staticmethod
+    def _existing_variants(filename, formats, folder):
+        """Dict de variantes a partir de los archivos ya generados (None si falta alguno)"""
+        from PIL import Image
+        sizes = {}
+        for variant, _ in IMAGE_VARIANTS:
+            paths = [os.path.join(folder, *ImageService.variant_filename(filename, variant, fmt).split('/'))
+                     for fmt in formats]
+            if not all(os.path.exists(path) for path in paths):
+                return None
+            with Image.open(paths[-1]) as image:  # JPEG: solo se lee la cabecera
+                sizes[variant] = [image.width, image.height]
+        return {'formats': formats, 'sizes': sizes}
+
+    @staticmethod
+    def delete_variants(filename, app=None):
+        """Borra las variantes de un archivo (en todos los formatos conocidos)"""
+        folder = ImageService.variants_folder(app)
+        for variant, _ in IMAGE_VARIANTS:
+            for fmt in IMAGE_FORMATS:
+                path = os.path.join(folder, *ImageService.variant_filename(filename, variant, fmt).split('/'))
+                if os.path.exists(path):
+                    os.remove(path)
+
+    @staticmethod
+    def process_pending(limit=None):
+        """
+        Genera las variantes de las imágenes con variants NULL, archivo a archivo.
+        Cada archivo se confirma por separado (con invalidación del catálogo) para
+        que la portada use las variantes en cuanto están listas. Devuelve cuántos
+        archivos se procesaron.
+        """
+        query = db.session.query(CourseImage.filename)\
+            .filter(CourseImage.variants.is_(None))\
+            .group_by(CourseImage.filename)\
+            .order_by(db.func.min(CourseImage.id))
+        if limit:
+            query = query.limit(limit)
+        filenames = [row.filename for row in query]
+        db.session.rollback()
+
+        for filename in filenames:
+            try:
+                variants = ImageService.generate_variants(filename)
+            except Exception as e:
+                # Archivo ausente o corrupto: se marca sin variantes para no reintentarlo
+                logger.warning("No se pudieron generar las variantes", filename=filename, error=str(e))
+                variants = {}
+            CourseImage.query.filter(CourseImage.filename == filename, CourseImage.variants.is_(None))\
+                .update({CourseImage.variants: json.dumps(variants)}, synchronize_session=False)
+            catalog_cache.invalidate()
+            db.session.commit()
+            logger.info("Variantes generadas", filename=filename, formats=variants.get('formats'))
+        return len(filenames)
+
+    @staticmethod
+    def responsive_image(filename, variants):
+        """ResponsiveImage de un archivo subido a partir de su JSON de variantes (o None)"""
+        data = json.loads(variants) if variants else {}
+        if not data.get('sizes'):
+            return ResponsiveImage(src=f'{UPLOADS_URL}/{filename}', srcset='', sources=(), width=None, height=None)
+
+        def srcset(fmt):
+            seen_widths = set()
+            candidates = []
+            for variant, _ in IMAGE_VARIANTS:
+                width = data['sizes'][variant][0]
+                if width not in seen_widths:
+                    seen_widths.add(width)
+                    candidates.append(f"{UPLOADS_URL}/variants/{ImageService.variant_filename(filename, variant, fmt)} {width}w")
+            return ', '.join(candidates)
+
+        sources = tuple((IMAGE_FORMATS[fmt][1], srcset(fmt)) for fmt in data['formats'] if fmt != 'jpeg')
+        width, height = data['sizes']['card']
+        return ResponsiveImage(
+            src=f"{UPLOADS_URL}/variants/{ImageService.variant_filename(filename, 'card', 'jpeg')}",
+            srcset=srcset('jpeg'),
+            sources=sources,
+            width=width,
+            height=height,
+        )
+
+    @staticmethod
+    def course_images(course):
+        """
+        Imágenes de un curso para la portada, en el mismo orden que
+        Course.get_image_urls(): la legacy primero, luego la galería y, si no hay
+        ninguna, la imagen por defecto.
+        """
+        variants_by_filename = {image.filename: image.variants for image in course.images}
+        filenames = []
+        if course.image_filename:
+            filenames.append(course.image_filename)
+        filenames.extend(image.filename for image in course.images if image.filename not in filenames)
+        if not filenames:
+            return [ResponsiveImage(src=DEFAULT_IMAGE_URL, srcset='', sources=(), width=None, height=None)]
+        return [ImageService.responsive_image(filename, variants_by_filename.get(filename)) for filename in filenames]
+
+
+def _drain_pending_variants():
+    while ImageService.process_pending(limit=10):
+        pass
+
+
+# Genera las variantes pendientes en cada proceso: se arranca con la primera
+# subida que recibe el worker y se despierta con cada subida. Si el proceso
+# muere a medias, las imágenes quedan con variants NULL y las recoge la
+# siguiente subida o 'flask generate-image-variants'.
+variant_worker = BackgroundWorker('image-variants', _drain_pending_variants, 'IMAGE_VARIANTS_WORKER',
+                                  logger, "Error generando variantes de imágenes")
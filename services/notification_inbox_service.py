@@ -0,0 +1,149 @@
+# services/notification_inbox_service.py
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, func, or_
+from extensions import db
+from models import RedsysNotification
+from services.redsys_service import RedsysService
+from services.background_worker import BackgroundWorker
+from logging_setup import get_logger
+
+logger = get_logger('redsys.inbox')
+
+
+class NotificationInboxService:
+    """
+    Bandeja de entrada duradera para las notificaciones de Redsys.
+    El endpoint solo inserta la notificación en bruto y responde; un worker
+    en segundo plano las reclama por lotes y aplica process_notification.
+    """
+
+    @staticmethod
+    def enqueue(merchant_parameters, signature, signature_version=None, remote_addr=None):
+        """Guarda la notificación recibida tal cual y la confirma en BDD"""
+        notification = RedsysNotification(
+            merchant_parameters=merchant_parameters,
+            signature=signature,
+            signature_version=signature_version,
+            remote_addr=remote_addr,
+            status='pending',
+        )
+        db.session.add(notification)
+        db.session.commit()
+        return notification.id
+
+    @staticmethod
+    def _claimable_filter(stale_before):
+        # Las filas 'processing' de un worker que murió se vuelven a reclamar pasado el timeout
+        return or_(
+            RedsysNotification.status == 'pending',
+            and_(RedsysNotification.status == 'processing', RedsysNotification.claimed_at < stale_before),
+        )
+
+    @staticmethod
+    def claim_batch(limit):
+        """
+        Reclama hasta limit notificaciones. Cada fila se marca con un UPDATE
+        condicional, así dos workers nunca procesan la misma notificación.
+        """
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=current_app.config.get('REDSYS_INBOX_CLAIM_TIMEOUT', 300))
+        claimable = NotificationInboxService._claimable_filter(stale_before)
+
+        candidate_ids = [
+            row.id for row in db.session.query(RedsysNotification.id)
+            .filter(claimable)
+            .order_by(RedsysNotification.id.asc())
+            .limit(limit)
+        ]
+        claimed_ids = []
+        for notification_id in candidate_ids:
+            updated = RedsysNotification.query.filter(RedsysNotification.id == notification_id, claimable).update(
+                {
+                    RedsysNotification.status: 'processing',
+                    RedsysNotification.claimed_at: now,
+                    RedsysNotification.attempts: RedsysNotification.attempts + 1,
+                },
+                synchronize_session=False
+            )
+            if updated:
+                claimed_ids.append(notification_id)
+        db.session.commit()
+        return claimed_ids
+
+    @staticmethod
+    def process_batch(limit=None):
+        """Procesa un lote de notificaciones pendientes y devuelve cuántas se reclamaron"""
+        limit = limit or current_app.config.get('REDSYS_INBOX_BATCH_SIZE', 50)
+        max_attempts = current_app.config.get('REDSYS_INBOX_MAX_ATTEMPTS', 5)
+        claimed_ids = NotificationInboxService.claim_batch(limit)
+
+        for notification_id in claimed_ids:
+            notification = db.session.get(RedsysNotification, notification_id)
+            result = RedsysService.process_notification(notification.merchant_parameters, notification.signature)
+            if 'success' not in result:
+                # Error sin resultado de pago (firma, BDD...): se deshace lo que quedara a medias
+                db.session.rollback()
+                notification = db.session.get(RedsysNotification, notification_id)
+
+            if 'success' in result:
+                notification.status = 'processed'
+            elif notification.attempts >= max_attempts:
+                notification.status = 'failed'
+            else:
+                notification.status = 'pending'
+            notification.result = str(result.get('error') or 'ok')[:255]
+            notification.processed_at = datetime.utcnow() if notification.status != 'pending' else None
+            db.session.commit()
+            logger.info("Notificación de la bandeja procesada", notification_id=notification_id,
+                        status=notification.status, attempts=notification.attempts, result=result)
+
+        return len(claimed_ids)
+
+    @staticmethod
+    def drain(limit=None):
+        """Procesa lotes hasta vaciar la bandeja; devuelve el total procesado"""
+        limit = limit or current_app.config.get('REDSYS_INBOX_BATCH_SIZE', 50)
+        total = 0
+        while True:
+            processed = NotificationInboxService.process_batch(limit)
+            total += processed
+            if processed < limit:
+                return total
+
+    @staticmethod
+    def get_metrics(lag_sample=100):
+        """Profundidad de la cola por estado y retraso de procesamiento (en segundos)"""
+        counts = dict(
+            db.session.query(RedsysNotification.status, func.count(RedsysNotification.id))
+            .group_by(RedsysNotification.status)
+            .all()
+        )
+        oldest_pending = db.session.query(func.min(RedsysNotification.received_at))\
+            .filter(RedsysNotification.status.in_(['pending', 'processing']))\
+            .scalar()
+        recent = db.session.query(RedsysNotification.received_at, RedsysNotification.processed_at)\
+            .filter(RedsysNotification.processed_at.isnot(None))\
+            .order_by(RedsysNotification.processed_at.desc())\
+            .limit(lag_sample)\
+            .all()
+        lags = sorted((processed_at - received_at).total_seconds() for received_at, processed_at in recent)
+        now = datetime.utcnow()
+
+        return {
+            'pending': counts.get('pending', 0),
+            'processing': counts.get('processing', 0),
+            'processed': counts.get('processed', 0),
+            'failed': counts.get('failed', 0),
+            'oldest_pending_age_seconds': (now - oldest_pending).total_seconds() if oldest_pending else 0.0,
+            'processing_lag_avg_seconds': sum(lags) / len(lags) if lags else 0.0,
+            'processing_lag_max_seconds': lags[-1] if lags else 0.0,
+        }
+
+
+# Vacía la bandeja en cada proceso: se arranca con la primera notificación que
+# recibe el worker y se despierta con cada notificación o cada
+# REDSYS_INBOX_POLL_SECONDS para recoger reintentos
+inbox_worker = BackgroundWorker('redsys-inbox', NotificationInboxService.drain, 'REDSYS_INBOX_WORKER',
+                                logger, "Error vaciando la bandeja de notificaciones",
+                                poll_setting='REDSYS_INBOX_POLL_SECONDS')
@@ -1,48 +1,175 @@
+from collections import namedtuple
+from extensions import db
 from models import Offer
+from services.cache_service import catalog_cache
+
+# Copia de solo lectura de una oferta activa, compartida entre peticiones
+CatalogOffer = namedtuple('CatalogOffer', ['id', 'quantity', 'price', 'description', 'is_active'])
 
 
 class OfferService:
     @staticmethod
     def get_active_offers():
-        return Offer.query.filter_by(is_active=True).order_by(Offer.quantity.desc()).all()
+        """Obtiene las ofertas activas desde la caché del catálogo"""
+        return catalog_cache.get('active_offers', OfferService._load_active_offers)
 
     @staticmethod
-    def calculate_total_with_offers(num_items, unit_price, offers):
+    def _load_active_offers():
+        offers = Offer.query.filter_by(is_active=True).order_by(Offer.quantity.desc()).all()
+        return [
+            CatalogOffer(
+                id=offer.id,
+                quantity=offer.quantity,
+                price=offer.price,
+                description=offer.description,
+                is_active=offer.is_active,
+            )
+            for offer in offers
+        ]
+
+    @staticmethod
+    def get_all_offers():
+        """Obtiene todas las ofertas (activas o no) para el panel de administración"""
+        return Offer.query.order_by(Offer.quantity.asc()).all()
+
+    @staticmethod
+    def create_offer(quantity, price, description=None, is_active=True):
+        """Crea una nueva oferta por cantidad"""
+        offer = Offer(quantity=quantity, price=price, description=description, is_active=is_active)
+        db.session.add(offer)
+        catalog_cache.invalidate()
+        db.session.commit()
+        return offer
+
+    @staticmethod
+    def update_offer(offer, quantity, price, description=None, is_active=True):
+        """Actualiza una oferta existente"""
+        offer.quantity = quantity
+        offer.price = price
+        offer.description = description
+        offer.is_active = is_active
+        catalog_cache.invalidate()
+        db.session.commit()
+        return offer
+
+    @staticmethod
+    def delete_offer(offer):
+        """Elimina una oferta"""
+        db.session.delete(offer)
+        catalog_cache.invalidate()
+        db.session.commit()
+
+    @staticmethod
+    def build_pricing_table(offers, max_items):
         """
-        Calcula el total aplicando ofertas por cantidad de forma greedy
-        (primero packs más grandes). Asume que todos los cursos valen lo mismo.
+        Calcula, para cada nº de cursos k <= max_items, la combinación de packs
+        más barata que cubre exactamente k cursos (mochila no acotada).
+        costs[k] es None si ningún conjunto de packs suma exactamente k.
+        Se calcula una vez por conjunto de ofertas; después cada consulta es O(1).
         """
-        remaining = num_items
-        total = 0.0
+        # Si hay varias ofertas con la misma cantidad solo importa la más barata
+        best_by_quantity = {}
+        for offer in offers:
+            qty = int(offer.quantity or 0)
+            if qty <= 0 or offer.price is None:
+                continue
+            if qty not in best_by_quantity or offer.price < best_by_quantity[qty]:
+                best_by_quantity[qty] = offer.price
+        packs = sorted(best_by_quantity.items(), reverse=True)
+
+        costs = [0.0] + [None] * max_items
+        last_pack = [None] * (max_items + 1)
+        for k in range(1, max_items + 1):
+            for index, (qty, price) in enumerate(packs):
+                if qty > k or costs[k - qty] is None:
+                    continue
+                candidate = costs[k - qty] + price
+                if costs[k] is None or candidate < costs[k] - 1e-9:
+                    costs[k] = candidate
+                    last_pack[k] = index
+
+        # Reconstruimos el desglose de packs de cada k para servirlo sin recalcular
         applied = []
+        for k in range(max_items + 1):
+            counts = {}
+            remaining = k if costs[k] is not None else 0
+            while remaining > 0:
+                qty, price = packs[last_pack[remaining]]
+                counts[qty] = counts.get(qty, 0) + 1
+                remaining -= qty
+            applied.append([
+                {"quantity": qty, "price": best_by_quantity[qty], "packs": count}
+                for qty, count in sorted(counts.items(), reverse=True)
+            ])
 
-        sorted_offers = sorted(offers, key=lambda o: o.quantity, reverse=True)
+        return {
+            "max_items": max_items,
+            "costs": costs,
+            "applied_offers": applied,
+        }
 
-        for offer in sorted_offers:
-            if remaining <= 0:
-                break
-            qty = offer.quantity or 0
-            if qty <= 0:
-                continue
+    @staticmethod
+    def get_pricing_table():
+        """
+        Tabla de precios de las ofertas activas, cacheada por versión del catálogo.
+        Cubre tantos cursos como hay en el catálogo activo (el máximo de un carrito).
+        """
+        from services.course_service import CourseService
+
+        def load():
+            max_items = max(len(CourseService.get_active_catalog()), 1)
+            return OfferService.build_pricing_table(OfferService.get_active_offers(), max_items)
+
+        return catalog_cache.get('pricing_table', load)
+
+    @staticmethod
+    def calculate_total_from_table(prices, table):
+        """
+        Calcula el total óptimo de un carrito con la tabla de precios.
+        Los packs tienen precio fijo, así que conviene que cubran los cursos
+        más caros: se prueba cada nº de cursos k cubierto por packs y el resto
+        se paga a precio individual, empezando por los más baratos.
+        """
+        prices = sorted(prices, reverse=True)
+        num_items = len(prices)
+        if num_items > table["max_items"]:
+            raise ValueError("El carrito supera el tamaño de la tabla de precios")
 
-            packs = remaining // qty
-            if packs > 0:
-                total += packs * offer.price
-                remaining -= packs * qty
-                applied.append(
-                    {
-                        "quantity": qty,
-                        "price": offer.price,
-                        "packs": packs,
-                    }
-                )
-
-        if remaining > 0:
-            total += remaining * unit_price
+        # suffix[k] = suma de los cursos que quedan fuera de los packs si estos cubren k
+        suffix = [0.0] * (num_items + 1)
+        for i in range(num_items - 1, -1, -1):
+            suffix[i] = suffix[i + 1] + prices[i]
+
+        best_k = 0
+        best_total = suffix[0]
+        for k in range(1, num_items + 1):
+            pack_cost = table["costs"][k]
+            if pack_cost is None:
+                continue
+            candidate = pack_cost + suffix[k]
+            if candidate < best_total - 1e-9:
+                best_k = k
+                best_total = candidate
 
         return {
-            "total": total,
-            "remaining": remaining,
-            "applied_offers": applied,
+            "total": best_total,
+            "remaining": num_items - best_k,
+            "applied_offers": table["applied_offers"][best_k],
         }
 
+    @staticmethod
+    def calculate_cart_total(prices):
+        """Calcula el total óptimo de un carrito con las ofertas activas"""
+        table = OfferService.get_pricing_table()
+        if len(prices) > table["max_items"]:
+            table = OfferService.build_pricing_table(OfferService.get_active_offers(), len(prices))
+        return OfferService.calculate_total_from_table(prices, table)
+
+    @staticmethod
+    def calculate_total_with_offers(num_items, unit_price, offers):
+        """
+        Calcula el total óptimo aplicando ofertas por cantidad cuando todos
+        los cursos valen lo mismo.
+        """
+        table = OfferService.build_pricing_table(offers, num_items)
+        return OfferService.calculate_total_from_table([unit_price] * num_items, table)
@@ -1,20 +1,54 @@
 # services/payment_gateway_service.py
+from collections import namedtuple
 from extensions import db
 from models import PaymentGatewayConfig
+from services.cache_service import gateway_config_cache
+from logging_setup import get_logger
+
+logger = get_logger('gateway')
+
+
+class GatewayConfigSnapshot(namedtuple('GatewayConfigSnapshot', [
+    'id', 'gateway_name', 'merchant_code', 'terminal', 'secret_key', 'environment',
+    'redsys_url_test', 'redsys_url_production', 'public_base_url', 'is_active', 'updated_at',
+])):
+    """Copia inmutable de PaymentGatewayConfig compartida entre peticiones del worker"""
+    __slots__ = ()
+
+    @classmethod
+    def from_model(cls, config):
+        return cls(**{field: getattr(config, field) for field in cls._fields})
+
+    def get_redsys_url(self):
+        """Retorna la URL de Redsys según el entorno"""
+        if self.environment == 'production':
+            return self.redsys_url_production or 'https://sis.redsys.es/sis/realizarPago'
+        return self.redsys_url_test or 'https://sis-t.redsys.es:25443/sis/realizarPago'
+
 
 class PaymentGatewayService:
     @staticmethod
     def get_config():
-        """Obtiene la configuración activa de la pasarela de pago"""
+        """
+        Obtiene la configuración activa de la pasarela de pago.
+        Se carga una vez por versión y se comparte entre todas las peticiones;
+        update_config invalida la copia de todos los workers.
+        """
+        return gateway_config_cache.get('active', PaymentGatewayService._load_config)
+
+    @staticmethod
+    def _load_config():
         config = PaymentGatewayConfig.query.filter_by(is_active=True).first()
         if config:
-            print(f"DEBUG get_config - ID: {config.id}, MerchantCode: {config.merchant_code}, Terminal: {config.terminal}, Gateway: {config.gateway_name}")
-        else:
-            print("DEBUG get_config - No se encontró configuración activa")
-        return config
+            logger.info("Configuración de pasarela cargada", config_id=config.id, merchant_code=config.merchant_code,
+                        terminal=config.terminal, gateway_name=config.gateway_name)
+            return GatewayConfigSnapshot.from_model(config)
+        logger.warning("No se encontró configuración activa de pasarela")
+        return None
     
     @staticmethod
-    def update_config(gateway_name, merchant_code=None, terminal=None, secret_key=None, environment=None, public_base_url=None):
+    def update_config(gateway_name, merchant_code=None, terminal=None, secret_key=None, environment=None, public_base_url=None,
+                      redsys_url_test=None):
         """Actualiza o crea la configuración de la pasarela de pago (Redsys)"""
         # Desactivar todas las configuraciones existentes para asegurar solo una activa
         PaymentGatewayConfig.query.update({PaymentGatewayConfig.is_active: False})
@@ -41,14 +75,18 @@ class PaymentGatewayService:
             config.environment = environment
         if public_base_url is not None:
             config.public_base_url = public_base_url.strip() if public_base_url else None
+        if redsys_url_test is not None:
+            # Ej: el simulador local (redsys_simulator.py --configure)
+            config.redsys_url_test = redsys_url_test.strip() or None
         
         from datetime import datetime
         config.updated_at = datetime.utcnow()
         
+        gateway_config_cache.invalidate()
         db.session.commit()
         
-        # Debug: verificar qué se guardó
-        print(f"DEBUG update_config - Guardado ID: {config.id}, MerchantCode: {config.merchant_code}, Terminal: {config.terminal}, PublicURL: {config.public_base_url or 'No configurada'}")
+        logger.info("Configuración de pasarela guardada", config_id=config.id, merchant_code=config.merchant_code,
+                    terminal=config.terminal, public_base_url=config.public_base_url or 'No configurada')
         
         return config
 
@@ -1,8 +1,16 @@
 # services/payment_service.py
 from extensions import db
-from models import Payment, User, Course
-from datetime import datetime
-from sqlalchemy.orm import joinedload
+from models import Payment, User, Course, RevenueRollup
+from datetime import datetime, date, time, timedelta
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, contains_eager
+from logging_setup import get_logger
+
+logger = get_logger('payment')
+
+# Filas por página en el listado de compradores
+BUYERS_PAGE_SIZE = 50
 
 class PaymentService:
     @staticmethod
@@ -13,35 +21,82 @@ class PaymentService:
         db.session.commit()
         return payment
     
+    @staticmethod
+    def _transition_status(payment_id, from_statuses, values, on_transition=None):
+        """
+        Cambia el estado con un único UPDATE condicional (compare-and-set).
+        Devuelve True solo si esta llamada hizo la transición: con notificaciones
+        duplicadas o concurrentes exactamente una gana, sin bloqueos de fila.
+        on_transition se ejecuta en la misma transacción si el UPDATE tuvo efecto.
+        """
+        for attempt in range(2):
+            try:
+                updated = Payment.query.filter(
+                    Payment.id == payment_id,
+                    Payment.status.in_(from_statuses)
+                ).update(values, synchronize_session=False)
+                if updated and on_transition:
+                    on_transition()
+                db.session.commit()
+                return updated == 1
+            except IntegrityError:
+                # Otro worker creó a la vez la misma fila agregada: se repite una vez
+                db.session.rollback()
+                if attempt:
+                    raise
+            except Exception:
+                db.session.rollback()
+                logger.exception("Error al cambiar el estado del pago", payment_id=payment_id, to_status=values.get(Payment.status))
+                raise
+
+    @staticmethod
+    def _add_to_revenue_rollup(payment_id, completed_at):
+        """Suma el pago a la fila de ingresos de su día y curso (sin hacer commit)"""
+        course_id, amount = db.session.query(Payment.course_id, Payment.amount).filter(Payment.id == payment_id).one()
+        day = completed_at.date()
+        updated = RevenueRollup.query.filter_by(day=day, course_id=course_id).update(
+            {
+                RevenueRollup.payments_count: RevenueRollup.payments_count + 1,
+                RevenueRollup.revenue: RevenueRollup.revenue + amount,
+            },
+            synchronize_session=False
+        )
+        if not updated:
+            db.session.add(RevenueRollup(day=day, course_id=course_id, payments_count=1, revenue=amount))
+            db.session.flush()
+
     @staticmethod
     def complete_payment(payment_id, transaction_id=None, payment_method=None):
         """
-        Marca un pago existente como completado.
-        Este metodo actua sobre la fila especifica de la base de datos,
-        asegurando que no se dupliquen ni se borren registros.
+        Marca un pago como completado si todavia estaba pendiente o fallido.
+        'completed' es definitivo: una notificacion verificada de Redsys puede
+        corregir un 'failed' (p. ej. de /redsys/ko), pero nada sobrescribe un pago cobrado.
+        Devuelve True si esta llamada completo el pago.
         """
-        # Usamos db.session.get para obtener la instancia mas fresca de la BDD
-        payment = db.session.get(Payment, payment_id)
-        if not payment:
-            print(f"\n>>> ERROR: No se encontro el pago con ID {payment_id}")
-            return None
-        
-        # Actualizamos el estado del registro que ya existe
-        payment.status = 'completed'
+        completed_at = datetime.utcnow()
+        values = {Payment.status: 'completed', Payment.completed_at: completed_at}
         if transaction_id:
-            payment.transaction_id = transaction_id
+            values[Payment.transaction_id] = transaction_id
         if payment_method:
-            payment.payment_method = payment_method
-        payment.completed_at = datetime.utcnow()
-        
-        try:
-            db.session.commit()
-            print(f"\n>>> OK: Pago {payment_id} actualizado a 'completed'.")
-            return payment
-        except Exception as e:
-            db.session.rollback()
-            print(f"\n>>> ERROR al confirmar pago {payment_id}: {str(e)}")
-            raise
+            values[Payment.payment_method] = payment_method
+
+        completed = PaymentService._transition_status(
+            payment_id,
+            ('pending', 'failed'),
+            values,
+            on_transition=lambda: PaymentService._add_to_revenue_rollup(payment_id, completed_at)
+        )
+        if completed:
+            logger.info("Pago actualizado a 'completed'", payment_id=payment_id)
+        return completed
+
+    @staticmethod
+    def fail_payment(payment_id):
+        """Marca un pago como fallido solo si seguia pendiente. Devuelve True si hubo transicion"""
+        failed = PaymentService._transition_status(payment_id, ('pending',), {Payment.status: 'failed'})
+        if failed:
+            logger.info("Pago actualizado a 'failed'", payment_id=payment_id)
+        return failed
     
     @staticmethod
     def get_payment_by_id(payment_id):
@@ -72,9 +127,147 @@ class PaymentService:
             .order_by(Payment.completed_at.desc())\
             .all()
         
-        print(f"\n>>> DEBUG DB: Se han recuperado {len(payments)} compras exitosas para el listado.")
+        logger.debug("Compras exitosas recuperadas para el listado", count=len(payments))
         return payments
     
+    @staticmethod
+    def _filter_completed_payments(query, course_id=None, date_from=None, date_to=None, email_prefix=None):
+        """
+        Aplica los filtros del listado de compradores: solo pagos completados, curso,
+        rango de fechas (inclusive) y prefijo de email. La consulta debe incluir el join con User.
+        """
+        query = query.filter(Payment.status == 'completed', Payment.completed_at.isnot(None))
+        if course_id:
+            query = query.filter(Payment.course_id == course_id)
+        if date_from:
+            query = query.filter(Payment.completed_at >= datetime.combine(date_from, time.min))
+        if date_to:
+            query = query.filter(Payment.completed_at < datetime.combine(date_to + timedelta(days=1), time.min))
+        if email_prefix:
+            query = query.filter(User.email.startswith(email_prefix, autoescape=True))
+        return query
+
+    @staticmethod
+    def _completed_payments_query(**filters):
+        """Pagos completados (con filtros) con su usuario y curso en una sola consulta"""
+        # outerjoin: el pago sigue siendo el eje y no desaparece aunque falte el curso o el usuario
+        query = Payment.query\
+            .outerjoin(Payment.user)\
+            .outerjoin(Payment.course)\
+            .options(contains_eager(Payment.user), contains_eager(Payment.course))
+        return PaymentService._filter_completed_payments(query, **filters)
+
+    @staticmethod
+    def encode_buyers_cursor(payment):
+        """Cursor de la página siguiente: posición (completed_at, id) del último pago mostrado"""
+        return f"{payment.completed_at.isoformat()}~{payment.id}"
+
+    @staticmethod
+    def decode_buyers_cursor(cursor):
+        """Devuelve (completed_at, id) o None si el cursor no es válido"""
+        try:
+            completed_at, payment_id = cursor.split('~', 1)
+            return datetime.fromisoformat(completed_at), int(payment_id)
+        except (AttributeError, ValueError):
+            return None
+
+    @staticmethod
+    def get_buyers_page(filters=None, after=None, limit=BUYERS_PAGE_SIZE):
+        """
+        Una página de compras completadas, de la más reciente a la más antigua.
+        Paginación por cursor sobre (completed_at, id): cada página cuesta lo mismo
+        sin importar su profundidad, a diferencia de OFFSET.
+        Devuelve (pagos, cursor de la página siguiente o None).
+        """
+        query = PaymentService._completed_payments_query(**(filters or {}))
+        if after:
+            query = query.filter(tuple_(Payment.completed_at, Payment.id) < tuple_(*after))
+
+        # Se pide una fila de más para saber si hay página siguiente
+        payments = query.order_by(Payment.completed_at.desc(), Payment.id.desc())\
+            .limit(limit + 1)\
+            .all()
+
+        next_cursor = None
+        if len(payments) > limit:
+            payments = payments[:limit]
+            next_cursor = PaymentService.encode_buyers_cursor(payments[-1])
+        return payments, next_cursor
+
+    @staticmethod
+    def iter_completed_payments_for_export(filters=None, batch_size=1000):
+        """
+        Recorre los pagos completados (con los mismos filtros que el listado) como filas
+        planas de columnas, sin crear objetos ORM. yield_per trae las filas del cursor
+        por lotes, así la memoria no crece con el número de pagos exportados.
+        """
+        statement = select(
+            Payment.id,
+            Payment.completed_at,
+            Payment.amount,
+            Payment.payment_method,
+            Payment.transaction_id,
+            User.name,
+            User.email,
+            User.phone,
+            Course.id,
+            Course.title
+        ).select_from(Payment)\
+            .outerjoin(Payment.user)\
+            .outerjoin(Payment.course)
+        statement = PaymentService._filter_completed_payments(statement, **(filters or {}))\
+            .order_by(Payment.completed_at.desc(), Payment.id.desc())\
+            .execution_options(yield_per=batch_size)
+
+        for row in db.session.execute(statement):
+            yield row
+
+    @staticmethod
+    def get_sales_totals():
+        """Nº de compras completadas e ingresos totales, sumados en SQL sobre el rollup diario"""
+        count, revenue = db.session.query(
+            func.coalesce(func.sum(RevenueRollup.payments_count), 0),
+            func.coalesce(func.sum(RevenueRollup.revenue), 0.0)
+        ).one()
+        return {'total_payments': int(count), 'total_revenue': float(revenue)}
+
+    @staticmethod
+    def get_daily_revenue(days=30):
+        """Ingresos y nº de compras por día de los últimos `days` días (más reciente primero)"""
+        since = date.today() - timedelta(days=days - 1)
+        return db.session.query(
+            RevenueRollup.day,
+            func.sum(RevenueRollup.payments_count).label('payments_count'),
+            func.sum(RevenueRollup.revenue).label('revenue')
+        ).filter(RevenueRollup.day >= since)\
+            .group_by(RevenueRollup.day)\
+            .order_by(RevenueRollup.day.desc())\
+            .all()
+
+    @staticmethod
+    def rebuild_revenue_rollup():
+        """
+        Recalcula el rollup completo desde los pagos completados.
+        Solo hace falta una vez para el histórico anterior al rollup o tras corregir datos a mano.
+        """
+        day_column = func.date(Payment.completed_at)
+        rows = db.session.query(
+            day_column,
+            Payment.course_id,
+            func.count(Payment.id),
+            func.sum(Payment.amount)
+        ).filter(Payment.status == 'completed', Payment.completed_at.isnot(None))\
+            .group_by(day_column, Payment.course_id)\
+            .all()
+
+        RevenueRollup.query.delete(synchronize_session=False)
+        for day, course_id, count, revenue in rows:
+            if isinstance(day, str):
+                day = date.fromisoformat(day)
+            db.session.add(RevenueRollup(day=day, course_id=course_id, payments_count=count, revenue=revenue or 0.0))
+        db.session.commit()
+        return len(rows)
+    
     @staticmethod
     def get_pending_payment_by_id(payment_id):
         """Busca un pago que todavia este en estado pendiente"""
@@ -4,24 +4,49 @@ import binascii
 import hashlib
 import hmac
 import json
+import threading
 import time
 from datetime import datetime
 from flask import url_for, request, current_app
-from Crypto.Cipher import DES3
 from services.payment_gateway_service import PaymentGatewayService
 from services.payment_service import PaymentService
 from models import Payment
 from extensions import db
+from logging_setup import get_logger
 
+logger = get_logger('redsys')
+
+# Cifradores 3DES ya preparados por clave secreta. La clave cambia solo cuando
+# el admin actualiza la configuración de la pasarela, así que la clave en sí
+# identifica la versión de la configuración y nunca se sirve material obsoleto.
+_key_cache = {}
+_key_cache_lock = threading.Lock()
+_KEY_CACHE_MAX = 8
+
+# Únicos parámetros de Redsys que se llevan al log: el resto (titular, tarjeta,
+# caducidad, URLs...) no hace falta para seguir un pago
+_LOGGED_PARAMS = ('Ds_Order', 'Ds_Response', 'Ds_Amount', 'Ds_AuthorisationCode',
+                  'DS_MERCHANT_ORDER', 'DS_MERCHANT_AMOUNT')
+
+
+def _get_ecb_cipher(secret_key_b64):
+    """Devuelve un cifrador 3DES-ECB reutilizable para la clave (decodificada una sola vez)"""
+    cipher = _key_cache.get(secret_key_b64)
+    if cipher is not None:
+        return cipher
+    # pycryptodome se importa aquí y no al cargar el módulo: solo lo necesita el
+    # primer pago o notificación de cada worker, no el arranque
+    from Crypto.Cipher import DES3
+
+    key = base64.b64decode(secret_key_b64.strip())
+    key = DES3.adjust_key_parity(key)
+    cipher = DES3.new(key, DES3.MODE_ECB)
+    with _key_cache_lock:
+        if len(_key_cache) >= _KEY_CACHE_MAX:
+            _key_cache.clear()
+        _key_cache[secret_key_b64] = cipher
+    return cipher
 
-def _log(message):
-    """Envía los mensajes al log estándar (stdout) y, si hay app, al logger."""
-    msg = str(message)
-    print(msg, flush=True)
-    try:
-        current_app.logger.info(msg)
-    except Exception:
-        pass
 
 class RedsysService:
     """
@@ -81,23 +106,34 @@ class RedsysService:
         decoded = base64.b64decode(encoded_params.encode('utf-8')).decode('utf-8')
         return json.loads(decoded)
 
+    @staticmethod
+    def loggable_params(params):
+        """Subconjunto de los parámetros decodificados que se puede escribir en el log"""
+        return {key: params[key] for key in _LOGGED_PARAMS if key in params}
+
     @staticmethod
     def _derive_hmac_key(secret_key_b64, order_id):
-        """Deriva la clave HMAC usando 3DES"""
+        """
+        Deriva la clave HMAC usando 3DES-CBC con IV a cero.
+        El CBC se encadena a mano sobre un cifrador ECB cacheado: evita decodificar
+        la clave y recalcular su key schedule en cada firma.
+        """
         try:
-            secret_key_b64 = secret_key_b64.strip()
-            key = base64.b64decode(secret_key_b64)
-            key = DES3.adjust_key_parity(key)
+            cipher = _get_ecb_cipher(secret_key_b64)
             
             order_bytes = order_id.encode('utf-8')
             pad_len = (8 - (len(order_bytes) % 8)) % 8
             order_padded = order_bytes + (b'\x00' * pad_len)
             
-            iv = b'\x00' * 8
-            cipher = DES3.new(key, DES3.MODE_CBC, iv=iv)
-            return cipher.encrypt(order_padded)
+            previous = b'\x00' * 8
+            blocks = []
+            for i in range(0, len(order_padded), 8):
+                block = bytes(a ^ b for a, b in zip(order_padded[i:i + 8], previous))
+                previous = cipher.encrypt(block)
+                blocks.append(previous)
+            return b''.join(blocks)
         except Exception as e:
-            print(f"ERROR en _derive_hmac_key: {e}")
+            logger.error("Error en _derive_hmac_key", error=str(e))
             raise
 
     @staticmethod
@@ -112,26 +148,56 @@ class RedsysService:
             ).digest()
             return base64.b64encode(mac).decode('utf-8')
         except Exception as e:
-            print(f"ERROR en generate_signature: {e}")
+            logger.error("Error en generate_signature", error=str(e))
             raise
 
     @staticmethod
-    def verify_signature(merchant_params_encoded, order_id, received_signature, secret_key):
-        """Verifica que la firma recibida de Redsys sea valida"""
-        expected = RedsysService.generate_signature(merchant_params_encoded, order_id, secret_key)
-        if not received_signature:
-            return False
+    def _normalize_signature(received_signature):
+        """Convierte una firma Base64 URL-safe a Base64 estándar con padding"""
         normalized = received_signature.replace('-', '+').replace('_', '/')
         # añadir padding si falta
         padding = len(normalized) % 4
         if padding:
             normalized += '=' * (4 - padding)
+        return normalized
+
+    @staticmethod
+    def verify_signature(merchant_params_encoded, order_id, received_signature, secret_key):
+        """Verifica que la firma recibida de Redsys sea valida"""
+        expected = RedsysService.generate_signature(merchant_params_encoded, order_id, secret_key)
+        if not received_signature:
+            return False
+        normalized = RedsysService._normalize_signature(received_signature)
         return hmac.compare_digest(expected, normalized)
 
     @staticmethod
-    def create_payment_form(payment_id, course_title, amount):
+    def generate_signatures(items, secret_key):
+        """
+        Firma en lote una lista de pares (merchant_params_encoded, order_id).
+        Devuelve las firmas en el mismo orden.
+        """
+        return [
+            RedsysService.generate_signature(merchant_params_encoded, order_id, secret_key)
+            for merchant_params_encoded, order_id in items
+        ]
+
+    @staticmethod
+    def verify_signatures(items, secret_key):
+        """
+        Verifica en lote una lista de tuplas
+        (merchant_params_encoded, order_id, received_signature).
+        Devuelve una lista de booleanos en el mismo orden.
+        """
+        return [
+            RedsysService.verify_signature(merchant_params_encoded, order_id, received_signature, secret_key)
+            for merchant_params_encoded, order_id, received_signature in items
+        ]
+
+    @staticmethod
+    def create_payment_form(payment_id, course_title, amount, config=None):
         """Crea el formulario de pago con una estructura de OrderID fija para evitar sustituciones"""
-        config = RedsysService.get_config()
+        if config is None:
+            config = RedsysService.get_config()
         if not config or not config.merchant_code or not config.secret_key:
             return None
 
@@ -158,7 +224,7 @@ class RedsysService:
         merchant_params_encoded = RedsysService.encode_merchant_parameters(merchant_params)
         signature = RedsysService.generate_signature(merchant_params_encoded, order_id, config.secret_key)
 
-        print(f"\n>>> DEBUG REDSYS: Enviando OrderID '{order_id}' para el Pago Real ID {payment_id}")
+        logger.info("Enviando pago a Redsys", order_id=order_id, payment_id=payment_id)
 
         return {
             'redsys_url': config.get_redsys_url(),
@@ -175,15 +241,11 @@ class RedsysService:
         try:
             if config.environment == 'test':
                 # El ID real son los primeros 8 caracteres segun nuestra nueva logica
-                payment_id = int(order_id[:8])
-            else:
-                # En produccion es el numero completo sin ceros a la izquierda
-                payment_id = int(order_id.lstrip('0'))
-            
-            # Busqueda directa por ID en la base de datos
-            return Payment.query.get(payment_id)
+                return int(order_id[:8])
+            # En produccion es el numero completo sin ceros a la izquierda
+            return int(order_id.lstrip('0'))
         except Exception as e:
-            print(f"\n>>> ERROR al extraer ID de '{order_id}': {str(e)}")
+            logger.error("Error al extraer ID de pago", order_id=order_id, error=str(e))
             return None
 
     @staticmethod
@@ -194,52 +256,51 @@ class RedsysService:
             return {'error': 'Configuracion no encontrada'}
 
         try:
-            _log(f"[Redsys] Notificacion recibida. MP len={len(merchant_params_encoded)}, signature len={len(signature)}")
             params = RedsysService.decode_merchant_parameters(merchant_params_encoded)
             order_id = params.get('Ds_Order') or params.get('DS_MERCHANT_ORDER')
-            _log(f"[Redsys] Merchant params decodificados: {params}")
+            logger.debug("Merchant params decodificados", params=RedsysService.loggable_params(params))
             
             if not order_id:
-                _log("[Redsys] OrderID ausente en la notificacion.")
+                logger.warning("OrderID ausente en la notificacion")
                 return {'error': 'OrderID no encontrado'}
             
             if not RedsysService.verify_signature(merchant_params_encoded, order_id, signature, config.secret_key):
-                _log(f"[Redsys] Firma invalida para OrderID {order_id}")
+                logger.warning("Firma invalida", order_id=order_id)
                 return {'error': 'Firma invalida'}
 
             response_code = int(params.get('Ds_Response', '999'))
-            _log(f"[Redsys] OrderID {order_id} con Ds_Response {response_code}")
 
             # Extraemos el ID exacto del pago para no actualizar la fila equivocada
-            payment = RedsysService._extract_payment_id_from_order_id(order_id, config)
-            
+            payment_id = RedsysService._extract_payment_id_from_order_id(order_id, config)
+
+            # La transicion la decide un UPDATE condicional en BDD, no una lectura previa:
+            # de varias notificaciones concurrentes para el mismo pago solo una la aplica.
+            if payment_id is not None:
+                if response_code < 100:
+                    if PaymentService.complete_payment(payment_id, transaction_id=order_id, payment_method='redsys'):
+                        logger.info("Pago verificado y completado", payment_id=payment_id, order_id=order_id,
+                                    response_code=response_code)
+                        return {'success': True, 'payment_id': payment_id}
+                elif PaymentService.fail_payment(payment_id):
+                    logger.info("Pago marcado como failed", payment_id=payment_id, order_id=order_id,
+                                response_code=response_code)
+                    return {'success': False, 'error': f'Pago denegado: {response_code}'}
+
+            # Sin transicion: el pago no existe o ya estaba en un estado definitivo
+            payment = PaymentService.get_payment_by_id(payment_id) if payment_id is not None else None
             if not payment:
-                print(f"\n>>> DEBUG: No se encontro el pago en la BDD para OrderID '{order_id}'")
+                logger.warning("No se encontro el pago en la BDD", order_id=order_id)
                 return {'success': False, 'error': 'Registro de pago no encontrado'}
-            else:
-                _log(f"[Redsys] Coincidencia Payment ID {payment.id} (status actual: {payment.status})")
 
             # SEGURIDAD: Si el pago ya esta completado, ignoramos para no duplicar ni sustituir
             if payment.status == 'completed':
-                print(f"\n>>> DEBUG: El pago {payment.id} ya figuraba como completado. Ignorando.")
-                _log(f"[Redsys] Pago {payment.id} ya estaba completado. Notificacion ignorada.")
+                logger.info("Pago ya completado, notificacion ignorada", payment_id=payment.id, order_id=order_id)
                 return {'success': True, 'payment_id': payment.id}
 
-            if response_code < 100:
-                # Marcamos el pago como completado de forma persistente
-                PaymentService.complete_payment(payment.id, transaction_id=order_id, payment_method='redsys')
-                print(f"\n>>> DEBUG: Pago {payment.id} verificado y guardado correctamente.")
-                _log(f"[Redsys] Pago {payment.id} actualizado a completed (order {order_id}).")
-                return {'success': True, 'payment_id': payment.id}
-            else:
-                # Si el pago ha fallado en Redsys, lo marcamos en nuestra BDD
-                payment.status = 'failed'
-                db.session.commit()
-                print(f"\n>>> DEBUG: Pago {payment.id} marcado como fallido (Respuesta Redsys: {response_code})")
-                _log(f"[Redsys] Pago {payment.id} marcado como failed (respuesta {response_code}).")
-                return {'success': False, 'error': f'Pago denegado: {response_code}'}
+            logger.info("Pago ya marcado como failed, notificacion ignorada", payment_id=payment.id,
+                        order_id=order_id, response_code=response_code)
+            return {'success': False, 'error': f'Pago denegado: {response_code}'}
                 
         except Exception as e:
-            print(f"\n>>> ERROR Crítico en process_notification: {str(e)}")
-            _log(f"[Redsys] Exception en process_notification: {e}")
+            logger.exception("Error crítico en process_notification")
             return {'error': str(e)}
@@ -0,0 +1,174 @@
+# services/upload_service.py
+import hashlib
+import os
+import uuid
+from flask import current_app
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import StoredUpload
+from services.image_service import ImageService
+from logging_setup import get_logger
+
+logger = get_logger('uploads')
+
+# Extensiones equivalentes: el mismo contenido acaba siempre con el mismo nombre
+_EXTENSION_ALIASES = {'jpeg': 'jpg'}
+
+
+class UploadService:
+    """
+    Almacenamiento de las imágenes subidas direccionado por contenido.
+    Cada archivo se guarda como ab/cd/<sha256>.<ext> dentro de UPLOAD_FOLDER,
+    así subir dos veces la misma foto no crea otra copia. StoredUpload lleva la
+    cuenta de CourseImage que apuntan a cada archivo: al borrar una imagen basta
+    decrementar ese contador para saber si el archivo se puede eliminar.
+    Los archivos anteriores (nombres uuid en la raíz) se siguen sirviendo igual.
+    """
+
+    @staticmethod
+    def content_filename(digest, ext):
+        """Ruta relativa (con '/') de un contenido: dos niveles de subcarpetas por el hash"""
+        ext = _EXTENSION_ALIASES.get(ext, ext)
+        return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+    @staticmethod
+    def save(file, ext, app=None, chunk_size=64 * 1024):
+        """
+        Guarda el archivo subido bajo su hash y devuelve el nombre relativo.
+        Se escribe a un temporal mientras se calcula el SHA-256 (sin cargarlo
+        entero en memoria) y se renombra al final; si el contenido ya existía
+        se descarta el temporal. No toca la BDD: la referencia la añade
+        add_reference junto con la CourseImage.
+        """
+        app = app or current_app
+        upload_folder = app.config['UPLOAD_FOLDER']
+        os.makedirs(upload_folder, exist_ok=True)
+        tmp_path = os.path.join(upload_folder, f".upload-{uuid.uuid4().hex}.tmp")
+
+        digest = hashlib.sha256()
+        try:
+            UploadService._write_stream(file, tmp_path, digest, chunk_size)
+            filename = UploadService.content_filename(digest.hexdigest(), ext.lower())
+            path = UploadService.path(filename, app)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                logger.info("Subida deduplicada", filename=filename)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return filename
+
+    @staticmethod
+    def _write_stream(file, target, digest=None, chunk_size=64 * 1024):
+        with open(target, 'wb') as out:
+            for chunk in iter(lambda: file.stream.read(chunk_size), b''):
+                if digest is not None:
+                    digest.update(chunk)
+                out.write(chunk)
+
+    @staticmethod
+    def ensure_file(filename, file, app=None):
+        """
+        Vuelve a escribir el archivo de una subida ya confirmada si no está en disco.
+        save() reutiliza el archivo existente cuando el contenido ya estaba subido;
+        si entre save() y el commit de la referencia otra petición borró la última
+        imagen que lo usaba, el archivo se eliminó y se recrea desde la subida.
+        """
+        path = UploadService.path(filename, app)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        file.stream.seek(0)
+        try:
+            UploadService._write_stream(file, tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        logger.warning("Archivo borrado durante la subida, recreado", filename=filename)
+        return True
+
+    @staticmethod
+    def path(filename, app=None):
+        app = app or current_app
+        return os.path.join(app.config['UPLOAD_FOLDER'], *filename.split('/'))
+
+    @staticmethod
+    def add_reference(filename):
+        """
+        Suma una referencia al archivo (sin hacer commit: va en la transacción de la
+        CourseImage). UPDATE del contador y, si no había fila, INSERT en un
+        savepoint: si otra subida simultánea del mismo contenido nuevo creó la
+        fila antes, el índice único de filename lo detecta y se repite el UPDATE.
+        """
+        increment = (
+            update(StoredUpload)
+            .where(StoredUpload.filename == filename)
+            .values(ref_count=StoredUpload.ref_count + 1)
+        )
+        if db.session.execute(increment).rowcount:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(StoredUpload).values(filename=filename, ref_count=1))
+        except IntegrityError:
+            db.session.execute(increment)
+
+    @staticmethod
+    def release_reference(filename):
+        """
+        Resta una referencia (sin hacer commit). Devuelve True si era la última:
+        la fila se borra y el llamador elimina el archivo tras confirmar.
+        Un archivo sin fila en StoredUpload nunca se da por huérfano.
+        UPDATE y SELECT en la misma transacción (sin RETURNING, que pide SQLite 3.35):
+        tras el UPDATE la transacción tiene el bloqueo de escritura y nadie más
+        puede cambiar el contador antes de leerlo.
+        """
+        updated = db.session.execute(
+            update(StoredUpload)
+            .where(StoredUpload.filename == filename)
+            .values(ref_count=StoredUpload.ref_count - 1)
+        ).rowcount
+        if not updated:
+            return False
+        remaining = db.session.query(StoredUpload.ref_count).filter_by(filename=filename).scalar()
+        if remaining > 0:
+            return False
+        StoredUpload.query.filter_by(filename=filename).delete(synchronize_session=False)
+        return True
+
+    @staticmethod
+    def delete_if_orphaned(filename, app=None):
+        """
+        Borra el archivo tras confirmar release_reference, si sigue sin referencias.
+        La comprobación es un UPDATE que no cambia nada pero toma el bloqueo de
+        escritura de SQLite hasta el commit: una subida del mismo contenido no
+        puede confirmar su referencia entre la comprobación y el borrado, y la que
+        confirme después encuentra el archivo borrado y lo recrea (ensure_file).
+        """
+        referenced = db.session.execute(
+            update(StoredUpload)
+            .where(StoredUpload.filename == filename)
+            .values(ref_count=StoredUpload.ref_count)
+        ).rowcount
+        try:
+            if not referenced:
+                UploadService.delete_file(filename, app)
+        finally:
+            db.session.commit()
+        return not referenced
+
+    @staticmethod
+    def delete_file(filename, app=None):
+        """Elimina el archivo original y sus variantes (ver image_service)"""
+        path = UploadService.path(filename, app)
+        if os.path.exists(path):
+            os.remove(path)
+        ImageService.delete_variants(filename, app)
@@ -0,0 +1,45 @@
+# sqlite_tuning.py
+from sqlalchemy import event
+
+# Valores admitidos por PRAGMA synchronous (se interpolan en el SQL: solo estos)
+_SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+def _is_file_database(engine):
+    return engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:')
+
+
+def configure_sqlite(app, engine):
+    """
+    Perfil de SQLite para producción con varios workers de Passenger: WAL (los
+    lectores no esperan al escritor), synchronous=NORMAL, busy_timeout, mmap y
+    una caché de páginas mayor. Se aplica a cada conexión nueva del pool.
+    Solo actúa si SQLITE_TUNING está activo y la BDD es un fichero SQLite.
+    """
+    if not app.config.get('SQLITE_TUNING') or not _is_file_database(engine):
+        return False
+
+    synchronous = str(app.config.get('SQLITE_SYNCHRONOUS', 'NORMAL')).upper()
+    if synchronous not in _SYNCHRONOUS_MODES:
+        raise ValueError(f"SQLITE_SYNCHRONOUS no válido: {synchronous}")
+    busy_timeout = int(app.config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    mmap_size = int(app.config.get('SQLITE_MMAP_SIZE', 0))
+    cache_size_kb = int(app.config.get('SQLITE_CACHE_SIZE_KB', 0))
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            # journal_mode=WAL queda guardado en el fichero; el resto es por conexión
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute(f'PRAGMA synchronous={synchronous}')
+            cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+            if mmap_size:
+                cursor.execute(f'PRAGMA mmap_size={mmap_size}')
+            if cache_size_kb:
+                # Valor negativo = tamaño en KiB en lugar de número de páginas
+                cursor.execute(f'PRAGMA cache_size=-{cache_size_kb}')
+        finally:
+            cursor.close()
+
+    return True
@@ -0,0 +1,445 @@
+# static_assets.py
+"""
+CSS y JS con huella de contenido y precomprimidos, y fotos del sitio optimizadas.
+
+'flask build-assets' minifica cada archivo de static/css y static/js, lo escribe
+como static/dist/<carpeta>/<nombre>.<hash>.<ext> junto a sus versiones .gz y .br
+y guarda el mapa nombre original -> nombre con hash en static/dist/manifest.json.
+
+Con el manifiesto presente, url_for('static', filename='css/style.css') devuelve
+la URL con hash y la vista static sirve esos archivos con Cache-Control
+immutable, eligiendo la variante .br o .gz según Accept-Encoding. Sin manifiesto
+(o con STATIC_FINGERPRINTS=0) todo funciona como antes con los archivos
+originales. Tras editar un CSS o JS hay que volver a ejecutar el build.
+
+'flask optimize-images' hace lo mismo con las fotos de static/images: variantes
+de ancho acotado en static/images/optimized que las plantillas piden con
+static_image() (srcset, dimensiones y carga diferida en la macro picture).
+"""
+import functools
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+from datetime import datetime
+from logging_setup import get_logger
+
+logger = get_logger('static')
+
+# Carpetas de static/ que se empaquetan y el minificador de cada extensión
+ASSET_FOLDERS = ('css', 'js')
+DIST_FOLDER = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Extensión de la variante precomprimida -> Content-Encoding (por orden de preferencia)
+PRECOMPRESSED = (('.br', 'br'), ('.gz', 'gzip'))
+
+_MIMETYPES = {'.css': 'text/css', '.js': 'text/javascript'}
+
+
+# ========== MINIFICACIÓN ==========
+
+def _skip_quoted(source, start):
+    """Índice tras el literal (comillas simples, dobles o backticks) que empieza en start"""
+    quote = source[start]
+    i = start + 1
+    while i < len(source):
+        if source[i] == '\\':
+            i += 2
+            continue
+        if source[i] == quote:
+            return i + 1
+        i += 1
+    return len(source)
+
+
+def _skip_regex(source, start):
+    """Índice tras el literal /regex/flags de JS que empieza en start"""
+    i = start + 1
+    in_class = False
+    while i < len(source) and source[i] != '\n':
+        c = source[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            i += 1
+            while i < len(source) and source[i].isalpha():
+                i += 1
+            return i
+        i += 1
+    return i
+
+
+def _minify(source, punctuation, regex_literals):
+    """
+    Quita comentarios y espacios sobrantes sin tocar el contenido de los
+    literales. Cada tramo de espacios se reduce a uno y desaparece junto a los
+    signos de punctuation. En JS un tramo con saltos de línea se reduce a un
+    salto, que solo se elimina cuando no puede actuar como fin de sentencia
+    (inserción automática de ';').
+    """
+    out = []
+    i = 0
+    n = len(source)
+    pending_space = ''
+    last_token = ''
+
+    def emit(text):
+        nonlocal pending_space, last_token
+        previous = out[-1][-1] if out else ''
+        if pending_space == '\n':
+            if previous and previous not in '{(,;[=:&|?!*%<>' and text[0] not in '}),;.:?]':
+                out.append('\n')
+        elif pending_space and previous and previous not in punctuation and text[0] not in punctuation:
+            out.append(' ')
+        pending_space = ''
+        out.append(text)
+        last_token = text
+
+    while i < n:
+        c = source[i]
+        if c in '\'"' or (c == '`' and regex_literals):
+            end = _skip_quoted(source, i)
+            emit(source[i:end])
+            i = end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+            pending_space = pending_space or ' '
+        elif regex_literals and source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end < 0 else end
+        elif c.isspace():
+            end = i
+            while end < n and source[end].isspace():
+                end += 1
+            if regex_literals and '\n' in source[i:end]:
+                pending_space = '\n'
+            elif pending_space != '\n':
+                pending_space = ' '
+            i = end
+        elif c == '/' and regex_literals and (
+                not last_token or last_token[-1] in '(,=:[!&|?{};+-*%<>~^' or
+                re.search(r'\b(return|typeof|case|do|else|in|of)$', last_token)):
+            end = _skip_regex(source, i)
+            emit(source[i:end])
+            i = end
+        else:
+            end = i + 1
+            if c.isalnum() or c in '_$':
+                while end < n and (source[end].isalnum() or source[end] in '_$'):
+                    end += 1
+            emit(source[i:end])
+            i = end
+    return ''.join(out).strip() + '\n'
+
+
+def minify_css(source):
+    css = _minify(source, punctuation='{};,>', regex_literals=False)
+    # El ':' de las declaraciones (no el de los selectores) y el último ';' de cada bloque
+    css = re.sub(r'([{;][\w-]+): ', r'\1:', css)
+    return css.replace(';}', '}')
+
+
+def minify_js(source):
+    # Sin '+', '-' ni '/': 'a + +b' o 'a / /re/' cambiarían de significado al juntarse
+    return _minify(source, punctuation='{}();,=:<>*%&|!?[]', regex_literals=True)
+
+
+_MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+# ========== BUILD ==========
+
+def _write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as out:
+        out.write(data)
+    os.replace(tmp_path, path)
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def build(static_folder):
+    """
+    Genera static/dist y su manifiesto. Conserva los archivos del manifiesto
+    anterior: los workers que aún no se han reiniciado siguen pidiendo esas URLs.
+    Devuelve el manifiesto nuevo.
+    """
+    dist_folder = os.path.join(static_folder, DIST_FOLDER)
+    manifest_path = os.path.join(dist_folder, MANIFEST_NAME)
+    previous = load_manifest(static_folder)
+    brotli = _brotli()
+    if brotli is None:
+        logger.warning("Módulo brotli no instalado: solo se generan las variantes .gz")
+
+    manifest = {}
+    for folder in ASSET_FOLDERS:
+        source_folder = os.path.join(static_folder, folder)
+        if not os.path.isdir(source_folder):
+            continue
+        os.makedirs(os.path.join(dist_folder, folder), exist_ok=True)
+        for name in sorted(os.listdir(source_folder)):
+            stem, ext = os.path.splitext(name)
+            if ext not in _MINIFIERS:
+                continue
+            with open(os.path.join(source_folder, name), encoding='utf-8') as source:
+                data = _MINIFIERS[ext](source.read()).encode('utf-8')
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            hashed = f"{DIST_FOLDER}/{folder}/{stem}.{digest}{ext}"
+            path = os.path.join(static_folder, *hashed.split('/'))
+            if not os.path.exists(path):
+                _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    _write(path + '.br', brotli.compress(data, quality=11))
+                _write(path, data)
+            manifest[f"{folder}/{name}"] = hashed
+
+    keep = set(manifest.values()) | set(previous.values())
+    for folder in ASSET_FOLDERS:
+        folder_path = os.path.join(dist_folder, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for name in os.listdir(folder_path):
+            base = name[:-3] if name.endswith(('.gz', '.br')) else name
+            if f"{DIST_FOLDER}/{folder}/{base}" not in keep:
+                os.remove(os.path.join(folder_path, name))
+
+    _write(manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def load_manifest(static_folder):
+    path = os.path.join(static_folder, DIST_FOLDER, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as manifest:
+        return json.load(manifest)
+
+
+# ========== IMÁGENES DEL SITIO ==========
+
+# Fotos de static/images que se optimizan y anchos máximos de sus variantes
+STATIC_IMAGE_EXTENSIONS = ('.jpg', '.jpeg')
+STATIC_IMAGE_WIDTHS = (480, 960, 1600)
+OPTIMIZED_FOLDER = 'images/optimized'
+
+
+def image_slug(filename):
+    """Nombre estable y apto para URL: 'WhatsApp Image ... (1).jpeg' -> 'whatsapp-image-...-1'"""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return re.sub(r'[^a-z0-9]+', '-', stem.lower()).strip('-')
+
+
+def optimize_images(app):
+    """
+    Genera en static/images/optimized las variantes de cada foto de static/images:
+    <slug>-<ancho>.<ext> en los formatos de IMAGE_VARIANT_FORMATS más JPEG, sin
+    ampliar nunca el original, y un manifest.json con las dimensiones que usan
+    las plantillas (ver static_image). Devuelve el manifiesto.
+    """
+    from PIL import Image, ImageOps
+    from services.image_service import IMAGE_FORMATS, ImageService
+
+    images_folder = os.path.join(app.static_folder, 'images')
+    output_folder = os.path.join(app.static_folder, *OPTIMIZED_FOLDER.split('/'))
+    os.makedirs(output_folder, exist_ok=True)
+    formats = ImageService.enabled_formats(app)
+
+    manifest = {}
+    written = set()
+    for name in sorted(os.listdir(images_folder)):
+        if os.path.splitext(name)[1].lower() not in STATIC_IMAGE_EXTENSIONS:
+            continue
+        slug = image_slug(name)
+        source_path = os.path.join(images_folder, name)
+        with Image.open(source_path) as original:
+            has_exif = bool(original.getexif())
+            image = ImageOps.exif_transpose(original).convert('RGB')
+        widths = sorted({min(width, image.width) for width in STATIC_IMAGE_WIDTHS})
+        for width in widths:
+            resized = image
+            if width < image.width:
+                resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            for fmt in formats:
+                filename = f"{slug}-{width}.{IMAGE_FORMATS[fmt][0]}"
+                tmp_path = os.path.join(output_folder, f"{filename}.{os.getpid()}.tmp")
+                resized.save(tmp_path, format=fmt.upper(), **IMAGE_FORMATS[fmt][2])
+                # A tamaño original, recomprimir un JPEG ya optimizado puede engordarlo
+                if fmt == 'jpeg' and width == image.width and not has_exif and \
+                        os.path.getsize(tmp_path) >= os.path.getsize(source_path):
+                    shutil.copyfile(source_path, tmp_path)
+                os.replace(tmp_path, os.path.join(output_folder, filename))
+                written.add(filename)
+        manifest[f"images/{name}"] = {
+            'slug': slug,
+            'width': image.width,
+            'height': image.height,
+            'widths': widths,
+            'formats': formats,
+        }
+
+    for name in os.listdir(output_folder):
+        if name != MANIFEST_NAME and name not in written:
+            os.remove(os.path.join(output_folder, name))
+    _write(os.path.join(output_folder, MANIFEST_NAME),
+           json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def load_images_manifest(static_folder):
+    path = os.path.join(static_folder, *OPTIMIZED_FOLDER.split('/'), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as manifest:
+        return json.load(manifest)
+
+
+@functools.lru_cache(maxsize=64)
+def _original_size(path):
+    """Dimensiones de una imagen sin optimizar (solo lee la cabecera), o (None, None)"""
+    from PIL import Image
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except (OSError, ValueError):
+        return None, None
+
+
+def _static_image_factory(app, manifest):
+    def static_image(filename):
+        """
+        ResponsiveImage (ver macro picture) de una imagen de static/. Sin
+        'flask optimize-images' devuelve el original con sus dimensiones.
+        """
+        from flask import url_for
+        from services.image_service import IMAGE_FORMATS, ResponsiveImage
+
+        entry = manifest.get(filename)
+        if not entry:
+            width, height = _original_size(os.path.join(app.static_folder, *filename.split('/')))
+            return ResponsiveImage(src=url_for('static', filename=filename), srcset='', sources=(),
+                                   width=width, height=height)
+
+        def url(width, ext):
+            return url_for('static', filename=f"{OPTIMIZED_FOLDER}/{entry['slug']}-{width}.{ext}")
+
+        def srcset(fmt):
+            return ', '.join(f"{url(width, IMAGE_FORMATS[fmt][0])} {width}w" for width in entry['widths'])
+
+        # src: el JPEG más cercano a 960px, para navegadores sin srcset
+        fallback_width = min(entry['widths'], key=lambda width: abs(width - 960))
+        return ResponsiveImage(
+            src=url(fallback_width, 'jpg'),
+            srcset=srcset('jpeg'),
+            sources=tuple((IMAGE_FORMATS[fmt][1], srcset(fmt)) for fmt in entry['formats'] if fmt != 'jpeg'),
+            width=entry['width'],
+            height=entry['height'],
+        )
+
+    def static_background(filename):
+        """Declaraciones background-image (JPEG y después image-set con los formatos modernos) para style="..."."""
+        from flask import url_for
+        from services.image_service import IMAGE_FORMATS
+
+        entry = manifest.get(filename)
+        if not entry:
+            return f"background-image: url('{url_for('static', filename=filename)}');"
+        width = entry['widths'][-1]
+        urls = [(IMAGE_FORMATS[fmt][1],
+                 url_for('static', filename=f"{OPTIMIZED_FOLDER}/{entry['slug']}-{width}.{IMAGE_FORMATS[fmt][0]}"))
+                for fmt in entry['formats']]
+        image_set = ', '.join(f"url('{url}') type('{mime}')" for mime, url in urls)
+        # Primera declaración: JPEG para los navegadores sin image-set()
+        return f"background-image: url('{urls[-1][1]}'); background-image: image-set({image_set});"
+
+    return static_image, static_background
+
+
+# ========== VALIDADORES HTTP ==========
+
+def site_fingerprint(app):
+    """
+    (hash, fecha) del contenido de las plantillas y de los manifiestos de
+    estáticos: cambia con cada despliegue que altere el HTML generado. Lo usan
+    los ETag/Last-Modified de las páginas públicas. Se calcula una vez por proceso.
+    """
+    cached = app.extensions.get('site_fingerprint')
+    if cached:
+        return cached
+    paths = []
+    for root, _, names in os.walk(os.path.join(app.root_path, app.template_folder)):
+        paths.extend(os.path.join(root, name) for name in names if name.endswith('.html'))
+    paths.append(os.path.join(app.static_folder, DIST_FOLDER, MANIFEST_NAME))
+    paths.append(os.path.join(app.static_folder, *OPTIMIZED_FOLDER.split('/'), MANIFEST_NAME))
+
+    digest = hashlib.sha256()
+    latest = 0.0
+    for path in sorted(paths):
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as source:
+            digest.update(source.read())
+        latest = max(latest, os.path.getmtime(path))
+    fingerprint = (digest.hexdigest()[:16], datetime.utcfromtimestamp(int(latest)))
+    app.extensions['site_fingerprint'] = fingerprint
+    return fingerprint
+
+
+# ========== INTEGRACIÓN CON FLASK ==========
+
+def init_static_assets(app):
+    """
+    Registra static_image()/static_background() para las plantillas, cambia
+    url_for('static') por los nombres con hash y sirve static/dist con caché immutable.
+    """
+    static_image, static_background = _static_image_factory(app, load_images_manifest(app.static_folder))
+    app.add_template_global(static_image)
+    app.add_template_global(static_background)
+
+    if not app.config.get('STATIC_FINGERPRINTS', True):
+        return
+    manifest = load_manifest(app.static_folder)
+    if manifest:
+        @app.url_defaults
+        def fingerprint_static_urls(endpoint, values):
+            if endpoint == 'static' and values.get('filename') in manifest:
+                values['filename'] = manifest[values['filename']]
+
+    static_view = app.view_functions['static']
+
+    def static_with_precompressed(filename):
+        if not filename.startswith(DIST_FOLDER + '/') or filename.endswith('.json'):
+            return static_view(filename=filename)
+        from flask import request, send_from_directory
+        ext = os.path.splitext(filename)[1]
+        response = None
+        for suffix, encoding in PRECOMPRESSED:
+            if encoding in request.accept_encodings and \
+                    os.path.exists(os.path.join(app.static_folder, *(filename + suffix).split('/'))):
+                response = send_from_directory(app.static_folder, filename + suffix,
+                                               mimetype=_MIMETYPES.get(ext))
+                response.headers['Content-Encoding'] = encoding
+                break
+        if response is None:
+            response = static_view(filename=filename)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.vary.add('Accept-Encoding')
+        return response
+
+    app.view_functions['static'] = static_with_precompressed
@@ -0,0 +1,150 @@
+# stress_payment_transitions.py
+# Prueba de estrés de las transiciones de estado de los pagos: varios hilos
+# envían notificaciones de Redsys firmadas, duplicadas y contradictorias (OK y
+# denegadas), por RedsysService.process_notification, y visitas a /redsys/ko
+# para los mismos pagos a la vez. Comprueba que cada
+# pago se completa como mucho una vez y que nada sobrescribe un 'completed'.
+# Usa una BDD SQLite temporal.
+import sys
+import os
+import random
+import tempfile
+import threading
+from collections import defaultdict
+
+# Configurar encoding UTF-8 para la salida
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+SECRET_KEY = 'sq7HjrUOBfKmC576ILgskD5srU870gJ7'
+
+def build_app(db_path):
+    from app import create_app
+    from config import Config
+
+    class StressConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + db_path
+        SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}}
+        LOG_LEVEL = 'WARNING'
+        REDSYS_INBOX_WORKER = False
+        IMAGE_VARIANTS_WORKER = False
+        METRICS_ENABLED = False
+        TEMPLATE_CACHE_DIR = ''
+
+    return create_app(StressConfig)
+
+
+def notification(payment_id, response_code):
+    from services.redsys_service import RedsysService
+
+    order_id = str(payment_id).zfill(12)
+    params = RedsysService.encode_merchant_parameters({'Ds_Order': order_id, 'Ds_Response': response_code})
+    return params, RedsysService.generate_signature(params, order_id, SECRET_KEY)
+
+
+def run(db_path, num_payments=40, num_threads=8, events_per_payment=12):
+    from extensions import db
+    from models import Payment
+    from services.course_service import CourseService
+    from services.payment_gateway_service import PaymentGatewayService
+    from services.payment_service import PaymentService
+    from services.redsys_service import RedsysService
+    from services.user_service import UserService
+
+    app = build_app(db_path)
+    with app.app_context():
+        PaymentGatewayService.update_config('redsys', '999008881', '001', SECRET_KEY, 'production')
+        course = CourseService.create_course('Curso estrés', '', 100.0)
+        user = UserService.create_user('Stress', 'stress@example.com', '600000000')
+        payment_ids = [PaymentService.create_payment(user.id, course.id, 100.0).id for _ in range(num_payments)]
+
+    # Cada evento: notificación OK, notificación denegada o visita a /redsys/ko
+    events = []
+    for payment_id in payment_ids:
+        kinds = ['ok'] * (events_per_payment // 2) + random.choices(['denied', 'ko'], k=events_per_payment - events_per_payment // 2)
+        events.extend((payment_id, kind) for kind in kinds)
+    random.shuffle(events)
+
+    completions = defaultdict(int)
+    failures = defaultdict(int)
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(num_threads)
+
+    # Las notificaciones OK pasan por process_notification (firma incluida); para
+    # saber cuántas transiciones a 'completed' se aplicaron de verdad se cuenta
+    # el resultado de complete_payment, que es quien hace el UPDATE condicional
+    complete_payment = PaymentService.complete_payment
+
+    def counting_complete_payment(payment_id, *args, **kwargs):
+        completed = complete_payment(payment_id, *args, **kwargs)
+        with lock:
+            completions[payment_id] += int(completed)
+        return completed
+
+    def worker(chunk):
+        barrier.wait()
+        for payment_id, kind in chunk:
+            try:
+                with app.app_context():
+                    if kind in ('ok', 'denied'):
+                        params, signature = notification(payment_id, '0000' if kind == 'ok' else '0190')
+                        result = RedsysService.process_notification(params, signature)
+                        if 'error' in result and not result.get('error', '').startswith('Pago denegado'):
+                            with lock:
+                                errors.append(f"{kind} {payment_id}: {result['error']}")
+                    else:
+                        failed = PaymentService.fail_payment(payment_id)
+                        with lock:
+                            failures[payment_id] += int(failed)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{kind} {payment_id}: {e}")
+
+    chunks = [events[i::num_threads] for i in range(num_threads)]
+    threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    PaymentService.complete_payment = staticmethod(counting_complete_payment)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        PaymentService.complete_payment = staticmethod(complete_payment)
+
+    problems = list(errors)
+    with app.app_context():
+        for payment in Payment.query.filter(Payment.id.in_(payment_ids)):
+            if completions[payment.id] > 1:
+                problems.append(f"Pago {payment.id} completado {completions[payment.id]} veces")
+            if failures[payment.id] > 1:
+                problems.append(f"Pago {payment.id} marcado como failed {failures[payment.id]} veces")
+            # Todos los pagos reciben al menos una notificación OK: deben acabar completados
+            if payment.status != 'completed' or completions[payment.id] != 1:
+                problems.append(f"Pago {payment.id} terminó en '{payment.status}' (completions={completions[payment.id]})")
+        # El rollup de ingresos debe contar cada pago completado una sola vez
+        totals = PaymentService.get_sales_totals()
+        if totals['total_payments'] != num_payments or abs(totals['total_revenue'] - num_payments * 100.0) > 0.001:
+            problems.append(f"Rollup de ingresos inconsistente: {totals}")
+        db.session.remove()
+
+    print(f"📊 {len(events)} eventos concurrentes sobre {num_payments} pagos con {num_threads} hilos")
+    if problems:
+        print(f"❌ {len(problems)} problemas detectados:")
+        for problem in problems[:20]:
+            print(f"   - {problem}")
+        return False
+    print("✅ Cada pago se completó exactamente una vez y ningún 'completed' fue sobrescrito")
+    return True
+
+
+if __name__ == '__main__':
+    print("🔍 Estrés de transiciones de estado de pagos...\n")
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    try:
+        success = run(db_path)
+    finally:
+        os.remove(db_path)
+    if not success:
+        sys.exit(1)
@@ -0,0 +1,92 @@
+# test_logging_setup.py
+# Comprueba los logs estructurados con LOG_ASYNC activo: las excepciones
+# conservan la traza en el campo 'exc', los campos estructurados llegan al JSON
+# y los datos del titular y de la tarjeta de Redsys no se escriben nunca.
+# Uso: python test_logging_setup.py (o con pytest)
+import sys
+import io
+import json
+from types import SimpleNamespace
+
+# Configurar encoding UTF-8 para la salida
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+
+def capture_logs(emit, log_async=True):
+    """Configura los logs sobre un buffer, ejecuta emit() y devuelve las entradas JSON escritas"""
+    import logging
+    from logging_setup import LOGGER_NAMESPACE, configure_logging
+
+    stream = io.StringIO()
+    app = SimpleNamespace(config={'LOG_LEVEL': 'DEBUG', 'LOG_ASYNC': log_async})
+    root = configure_logging(app, stream=stream)
+    try:
+        emit()
+    finally:
+        # Cerrar el handler vacía la cola del hilo de escritura
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+            handler.close()
+        logging.getLogger(LOGGER_NAMESPACE).propagate = True
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_async_exception_keeps_traceback():
+    from logging_setup import get_logger
+
+    logger = get_logger('test')
+
+    def emit():
+        try:
+            {}['Ds_Order']
+        except KeyError:
+            logger.exception("Fallo procesando la notificación", payment_id=7)
+
+    for log_async in (True, False):
+        entries = capture_logs(emit, log_async)
+        assert len(entries) == 1, entries
+        entry = entries[0]
+        assert entry['msg'] == "Fallo procesando la notificación", entry['msg']
+        assert entry['payment_id'] == 7, entry
+        assert 'exc' in entry and 'KeyError' in entry['exc'], entry
+
+
+def test_redsys_cardholder_data_redacted():
+    from logging_setup import REDACTED, redact
+    from services.redsys_service import RedsysService
+
+    params = {
+        'Ds_Order': '000000000042',
+        'Ds_Response': '0000',
+        'Ds_Amount': '29900',
+        'Ds_AuthorisationCode': '123456',
+        'Ds_Merchant_Titular': 'Ana Pérez',
+        'Ds_Card_Number': '454881******0004',
+        'Ds_ExpiryDate': '2712',
+        'Ds_Card_Holder': 'ANA PEREZ',
+    }
+    redacted = redact(params)
+    for key in ('Ds_Merchant_Titular', 'Ds_Card_Number', 'Ds_ExpiryDate', 'Ds_Card_Holder'):
+        assert redacted[key] == REDACTED, (key, redacted[key])
+
+    logged = RedsysService.loggable_params(params)
+    assert set(logged) == {'Ds_Order', 'Ds_Response', 'Ds_Amount', 'Ds_AuthorisationCode'}, logged
+
+
+def main():
+    tests = [test_async_exception_keeps_traceback, test_redsys_cardholder_data_redacted]
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {test.__name__}: {e}")
+    return failures == 0
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)